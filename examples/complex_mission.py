@@ -12,6 +12,7 @@ import json
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from master.main import run_master, init_database
+from master import scheduler
 import redis
 import psycopg2
 
@@ -43,8 +44,7 @@ time.sleep(2)  # Give time for decomposition
 # Show task tree
 print("\nTask Tree:")
 tasks = []
-for i in range(redis_client.llen("tasks")):
-    task_json = redis_client.lindex("tasks", i)
+for task_json in scheduler.peek(redis_client, 100):
     if task_json:
         task = json.loads(task_json)
         tasks.append(task)
@@ -59,10 +59,10 @@ start_time = time.time()
 max_time = 300  # 5 minutes max
 
 while time.time() - start_time < max_time:
-    queue_size = redis_client.llen("tasks")
+    queue_size = scheduler.size(redis_client)
     
     with pg.cursor() as cur:
-        cur.execute("SELECT COUNT(*) FROM results WHERE output IS NOT NULL")
+        cur.execute("SELECT COUNT(*) FROM results WHERE status IN ('done', 'failed')")
         completed = cur.fetchone()[0]
     
     # Progress bar
@@ -86,13 +86,13 @@ print("\n\nFinal Results Summary:")
 with pg.cursor() as cur:
     cur.execute("""
         WITH RECURSIVE task_tree AS (
-            SELECT id, parent_id, prompt, output, depth
+            SELECT id, parent_id, prompt, COALESCE(preview, LEFT(output, 200)) AS preview, depth
             FROM results
             WHERE parent_id IS NULL
             
             UNION ALL
             
-            SELECT r.id, r.parent_id, r.prompt, r.output, r.depth
+            SELECT r.id, r.parent_id, r.prompt, COALESCE(r.preview, LEFT(r.output, 200)), r.depth
             FROM results r
             JOIN task_tree t ON r.parent_id = t.id
         )
@@ -101,12 +101,12 @@ with pg.cursor() as cur:
     """)
     results = cur.fetchall()
     
-    for task_id, parent_id, prompt, output, depth in results:
+    for task_id, parent_id, prompt, preview, depth in results:
         indent = "  " * depth
-        status = "✅" if output else "⏳"
+        status = "✅" if preview is not None else "⏳"
         print(f"\n{indent}{status} [{depth}] {prompt[:100]}...")
-        if output:
-            preview = output[:200].replace('\n', ' ')
+        if preview:
+            preview = preview[:200].replace('\n', ' ')
             print(f"{indent}   → {preview}...")
 
 print("\n" + "="*80)
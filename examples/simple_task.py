@@ -11,6 +11,7 @@ import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from master.main import run_master, init_database
+from master import output_store, scheduler
 import redis
 import psycopg2
 
@@ -31,10 +32,10 @@ print("\nTask queued! Monitoring progress...")
 
 # Monitor progress
 for i in range(30):  # Check for 30 seconds
-    queue_size = redis_client.llen("tasks")
+    queue_size = scheduler.size(redis_client)
     
- n    with pg.cursor() as cur:
-        cur.execute("SELECT COUNT(*) FROM results WHERE output IS NOT NULL")
+    with pg.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM results WHERE status IN ('done', 'failed')")
         completed = cur.fetchone()[0]
     
     print(f"\rQueue: {queue_size} | Completed: {completed}", end="")
@@ -48,16 +49,18 @@ print("\n\nResults:")
 
 # Show results
 with pg.cursor() as cur:
-    cur.execute("""
-        SELECT prompt, output, created_at 
-        FROM results 
-        WHERE output IS NOT NULL 
-        ORDER BY created_at DESC 
+    # Output bodies live in the outputs table, compressed (see master/output_store.py)
+    cur.execute(f"""
+        SELECT r.prompt, r.created_at, {output_store.BODY_COLUMNS}
+        FROM results r {output_store.BODY_JOIN}
+        WHERE r.status IN ('done', 'failed')
+        ORDER BY r.created_at DESC 
         LIMIT 5
     """)
     results = cur.fetchall()
     
-    for prompt, output, created_at in results:
+    for prompt, created_at, *body in results:
+        output = output_store.decode(*body)
         print(f"\n{'='*60}")
         print(f"Task: {prompt[:100]}...")
         print(f"Completed: {created_at}")
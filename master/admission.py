@@ -0,0 +1,240 @@
+"""
+Admission control and backpressure for mission submission.
+
+``main.submit_mission()`` asks ``check()`` before a mission is decomposed.
+Capacity is judged on two high/low watermarks, with hysteresis so admission
+does not flap: waiting tasks in the queue (ADMISSION_QUEUE_HIGH / _LOW) and
+missions in flight (ADMISSION_INFLIGHT_HIGH / _LOW). Once either crosses its
+high mark the system counts as saturated until both are back under their
+low marks. Each submitter may also have at most ADMISSION_MAX_PER_SUBMITTER
+missions in flight. 0 disables a limit; by default everything is admitted.
+
+Over capacity, ADMISSION_POLICY decides:
+
+    reject   refuse the mission (``Rejected``)
+    defer    park it in the DEFERRED_KEY sorted set; the master's
+             housekeeping admits parked missions oldest first as capacity
+             frees up (decomposing them off the monitor loop), and the
+             submitter can poll its position and ETA
+    degrade  run it at once as a single task, without decomposition
+
+A mission is in flight from the spawn of its root task until its last task
+(synthesis included) is stored. Each mission keeps a pending counter:
+``spawn_task()`` adds one per task, ``run_master()`` one for the synthesis a
+decomposed mission owes (handed over to the synthesis task when it is
+spawned), workers subtract one per stored task, and ``run_master()`` holds
+one more until it has spawned every subtask. At zero the mission leaves the
+in-flight sets.
+
+While decomposing, ``pace()`` holds back further subtasks while the queue is
+over its high watermark, in place of a fixed delay between spawns.
+"""
+
+import json
+import os
+import time
+import uuid
+
+from master import scheduler, stats
+from master.connections import as_text
+
+POLICY = os.getenv("ADMISSION_POLICY", "defer")
+QUEUE_HIGH = int(os.getenv("ADMISSION_QUEUE_HIGH", "0"))
+QUEUE_LOW = int(os.getenv("ADMISSION_QUEUE_LOW", str(QUEUE_HIGH // 2)))
+INFLIGHT_HIGH = int(os.getenv("ADMISSION_INFLIGHT_HIGH", "0"))
+INFLIGHT_LOW = int(os.getenv("ADMISSION_INFLIGHT_LOW", str(INFLIGHT_HIGH * 3 // 4)))
+MAX_PER_SUBMITTER = int(os.getenv("ADMISSION_MAX_PER_SUBMITTER", "0"))
+
+# Longest pause before each subtask while the queue is over QUEUE_HIGH
+PACE_MAX = float(os.getenv("ADMISSION_PACE_MAX", "30"))
+PACE_INTERVAL = 0.5
+# Rough size of a mission in tasks, for start-time estimates of parked ones
+TASKS_PER_MISSION = int(os.getenv("ADMISSION_TASKS_PER_MISSION", "5"))
+# Missions in flight longer than this are presumed lost and stop counting
+MISSION_TTL = int(os.getenv("ADMISSION_MISSION_TTL", str(6 * 3600)))
+# Waiting jobs scanned for a mission's queue position
+POSITION_SCAN = 500
+RATE_MINUTES = 5
+
+MISSION_KEY = "admission:mission:{}"  # hash: pending, submitter
+INFLIGHT_KEY = "admission:inflight"  # zset: root id -> admitted at
+SUBMITTER_KEY = "admission:inflight:{}"  # zset per submitter
+SATURATED_KEY = "admission:saturated"
+DEFERRED_KEY = "admission:deferred"  # zset: ticket -> submitted at
+DEFERRED_DATA_KEY = "admission:deferred:data"  # hash: ticket -> mission
+TICKET_KEY = "admission:ticket:{}"  # ticket -> root id once admitted
+TICKET_TTL = 24 * 3600
+
+# KEYS: mission, in-flight  ARGV: root id, submitter key prefix. The
+# submitter's set is named from the stored submitter, so it cannot be passed
+# in KEYS; fine on a single Redis, not on a cluster.
+FINISH_SCRIPT = """
+local n = redis.call('HINCRBY', KEYS[1], 'pending', -1)
+if n <= 0 then
+    local submitter = redis.call('HGET', KEYS[1], 'submitter')
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    if submitter then
+        redis.call('ZREM', ARGV[2] .. submitter, ARGV[1])
+    end
+    redis.call('DEL', KEYS[1])
+end
+return n
+"""
+
+
+class Rejected(Exception):
+    """The system is over capacity and the policy is to refuse"""
+
+
+def register(pipe, root_id, submitter):
+    """Count a new mission in flight, holding it open while it is decomposed"""
+    submitter = submitter or "anonymous"
+    now = time.time()
+    key = MISSION_KEY.format(root_id)
+    pipe.hset(key, "submitter", submitter)
+    pipe.hincrby(key, "pending", 1)
+    pipe.expire(key, MISSION_TTL)
+    pipe.zadd(INFLIGHT_KEY, {root_id: now})
+    pipe.zadd(SUBMITTER_KEY.format(submitter), {root_id: now})
+    pipe.expire(SUBMITTER_KEY.format(submitter), MISSION_TTL)
+
+
+def track(pipe, root_id, count=1):
+    """Add ``count`` outstanding tasks (or owed syntheses) to a mission"""
+    key = MISSION_KEY.format(root_id)
+    pipe.hincrby(key, "pending", count)
+    pipe.expire(key, MISSION_TTL)
+
+
+def finish(redis_client, root_id):
+    """One task of a mission is stored (or its decomposition is over)"""
+    return int(redis_client.register_script(FINISH_SCRIPT)(
+        keys=[MISSION_KEY.format(root_id), INFLIGHT_KEY],
+        args=[root_id, SUBMITTER_KEY.format("")],
+    ))
+
+
+def _over(redis_client, queue_size, inflight):
+    """Saturation with hysteresis between the high and low watermarks"""
+    if redis_client.get(SATURATED_KEY):
+        if (not QUEUE_HIGH or queue_size <= QUEUE_LOW) and \
+                (not INFLIGHT_HIGH or inflight <= INFLIGHT_LOW):
+            redis_client.delete(SATURATED_KEY)
+            return None
+        return "the system is saturated"
+    if QUEUE_HIGH and queue_size >= QUEUE_HIGH:
+        reason = f"{queue_size} tasks are waiting"
+    elif INFLIGHT_HIGH and inflight >= INFLIGHT_HIGH:
+        reason = f"{inflight} missions are in flight"
+    else:
+        return None
+    redis_client.set(SATURATED_KEY, reason, ex=MISSION_TTL)
+    return reason
+
+
+def check(redis_client, submitter):
+    """
+    Why a mission from ``submitter`` cannot start now, as ``(scope, reason)``
+    with scope ``system`` or ``submitter``; None when it can.
+    """
+    submitter = submitter or "anonymous"
+    stale = time.time() - MISSION_TTL
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zremrangebyscore(INFLIGHT_KEY, 0, stale)
+    pipe.zcard(INFLIGHT_KEY)
+    pipe.zremrangebyscore(SUBMITTER_KEY.format(submitter), 0, stale)
+    pipe.zcard(SUBMITTER_KEY.format(submitter))
+    _, inflight, _, own = pipe.execute()
+
+    reason = _over(redis_client, scheduler.size(redis_client), inflight)
+    if reason:
+        return "system", reason
+    if MAX_PER_SUBMITTER and own >= MAX_PER_SUBMITTER:
+        return "submitter", f"{own} of your missions are still running"
+    return None
+
+
+def defer(redis_client, mission):
+    """Park a mission until there is room; returns its ticket"""
+    ticket = uuid.uuid4().hex
+    mission = {**mission, "ticket": ticket, "submitted_at": time.time()}
+    with redis_client.pipeline() as pipe:
+        pipe.hset(DEFERRED_DATA_KEY, ticket, json.dumps(mission))
+        pipe.zadd(DEFERRED_KEY, {ticket: mission["submitted_at"]})
+        pipe.execute()
+    return ticket
+
+
+def deferred(redis_client, count=20):
+    """The oldest ``count`` parked missions"""
+    tickets = [as_text(t) for t in redis_client.zrange(DEFERRED_KEY, 0, count - 1)]
+    if not tickets:
+        return []
+    return [json.loads(m) for m in redis_client.hmget(DEFERRED_DATA_KEY, tickets) if m]
+
+
+def claim(redis_client, ticket):
+    """Take a parked mission off the list; False if another master got it"""
+    if not redis_client.zrem(DEFERRED_KEY, ticket):
+        return False
+    redis_client.hdel(DEFERRED_DATA_KEY, ticket)
+    return True
+
+
+def admitted(redis_client, ticket, root_id):
+    """Let a parked mission's submitter follow it once it has started"""
+    redis_client.set(TICKET_KEY.format(ticket), root_id, ex=TICKET_TTL)
+
+
+def pace(redis_client):
+    """Hold back the next subtask while the queue is over its high watermark"""
+    if not QUEUE_HIGH:
+        return
+    deadline = time.monotonic() + PACE_MAX
+    while scheduler.size(redis_client) >= QUEUE_HIGH and time.monotonic() < deadline:
+        time.sleep(PACE_INTERVAL)
+
+
+def start_rate(redis_client):
+    """Tasks started per second over the last few minutes, or None"""
+    started = stats.snapshot(redis_client, minutes=RATE_MINUTES)["per_minute"]["started"]
+    total = sum(started)
+    return total / (RATE_MINUTES * 60) if total else None
+
+
+def _eta(redis_client, tasks_ahead):
+    rate = start_rate(redis_client)
+    return round(tasks_ahead / rate) if rate else None
+
+
+def position(redis_client, ticket=None, mission_id=None):
+    """
+    Where a submission stands: ``state`` (deferred, queued, running, done),
+    ``position`` in line and ``eta_seconds`` until it starts, when known.
+    """
+    if ticket:
+        rank = redis_client.zrank(DEFERRED_KEY, ticket)
+        if rank is not None:
+            tasks_ahead = max(scheduler.size(redis_client) - QUEUE_LOW, 0) \
+                + rank * TASKS_PER_MISSION
+            return {"state": "deferred", "position": rank + 1,
+                    "eta_seconds": _eta(redis_client, tasks_ahead)}
+        mission_id = as_text(redis_client.get(TICKET_KEY.format(ticket))) or mission_id
+        if mission_id is None:
+            return {"state": "unknown", "position": None, "eta_seconds": None}
+
+    if not redis_client.exists(MISSION_KEY.format(mission_id)):
+        return {"state": "done", "mission_id": mission_id, "position": None, "eta_seconds": 0}
+    for i, job in enumerate(scheduler.peek(redis_client, POSITION_SCAN)):
+        if json.loads(job).get("root_id") == mission_id:
+            return {"state": "queued", "mission_id": mission_id, "position": i + 1,
+                    "eta_seconds": _eta(redis_client, i)}
+    return {"state": "running", "mission_id": mission_id, "position": None, "eta_seconds": 0}
+
+
+def clear(redis_client):
+    """Forget in-flight and parked missions, e.g. after clearing the queue"""
+    keys = [INFLIGHT_KEY, SATURATED_KEY, DEFERRED_KEY, DEFERRED_DATA_KEY]
+    for pattern in (MISSION_KEY.format("*"), SUBMITTER_KEY.format("*")):
+        keys.extend(redis_client.scan_iter(pattern))
+    redis_client.delete(*keys)
@@ -0,0 +1,172 @@
+"""
+Token and cost accounting per task, and spending limits per mission.
+
+Every LLM call's reported usage is added up per task (``Usage``) and stored
+on the task's row (``prompt_tokens``, ``completion_tokens``, ``cost_usd``);
+the mission's decomposition is added to its root task. Prices come from
+LLM_PRICE_PROMPT_PER_1K / LLM_PRICE_COMPLETION_PER_1K.
+
+A mission may have a token and/or dollar budget (MISSION_BUDGET_TOKENS,
+MISSION_BUDGET_USD, or per mission through ``run_master()``; 0 means no
+limit). Its spend lives in the ``budget:mission:{root_id}`` hash:
+``spawn_task()`` reserves TASK_TOKENS worth of budget for each task and
+refuses with ``BudgetExceeded`` when the reservation would not fit, and
+the worker swaps the reservation for the actual usage once the task is
+stored. One Lua script checks and reserves atomically, so concurrent spawns
+cannot overshoot together. Recursion adapts to what is left: decomposition
+fans out to no more subtasks than the budget can pay for, and refinements
+are skipped once they no longer fit. Synthesis is forced through, since the
+fan-out already left room for it.
+"""
+
+import os
+import threading
+
+from master.connections import as_text
+
+TOKENS_LIMIT = int(os.getenv("MISSION_BUDGET_TOKENS", "0"))
+USD_LIMIT = float(os.getenv("MISSION_BUDGET_USD", "0"))
+
+# Reserved per task until its actual usage is known
+TASK_TOKENS = int(os.getenv("BUDGET_TASK_TOKENS", "3000"))
+
+PRICE_PROMPT_PER_1K = float(os.getenv("LLM_PRICE_PROMPT_PER_1K", "0.0006"))
+PRICE_COMPLETION_PER_1K = float(os.getenv("LLM_PRICE_COMPLETION_PER_1K", "0.0006"))
+
+MISSION_KEY = "budget:mission:{}"
+MISSION_TTL = 7 * 24 * 3600
+MICROS = 1_000_000  # Dollars are kept as integer micro-dollars in Redis
+
+# Reserves ARGV[1] tokens and ARGV[2] micro-dollars unless that would take
+# spent + reserved past a limit of the mission (0 = none). ARGV[3] = '1'
+# reserves regardless. Returns 1 when reserved, 0 when refused.
+RESERVE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'limit_tokens', 'limit_micros',
+    'spent_tokens', 'spent_micros', 'reserved_tokens', 'reserved_micros')
+local tokens, micros = tonumber(ARGV[1]), tonumber(ARGV[2])
+if ARGV[3] ~= '1' then
+    local limit_tokens, limit_micros = tonumber(state[1]) or 0, tonumber(state[2]) or 0
+    local used_tokens = (tonumber(state[3]) or 0) + (tonumber(state[5]) or 0)
+    local used_micros = (tonumber(state[4]) or 0) + (tonumber(state[6]) or 0)
+    if (limit_tokens > 0 and used_tokens + tokens > limit_tokens)
+        or (limit_micros > 0 and used_micros + micros > limit_micros) then
+        return 0
+    end
+end
+redis.call('HINCRBY', KEYS[1], 'reserved_tokens', tokens)
+redis.call('HINCRBY', KEYS[1], 'reserved_micros', micros)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class BudgetExceeded(Exception):
+    """A task would take its mission past its budget"""
+
+
+def cost(prompt_tokens, completion_tokens):
+    """Dollar cost of a call at the configured prices"""
+    return (prompt_tokens * PRICE_PROMPT_PER_1K
+            + completion_tokens * PRICE_COMPLETION_PER_1K) / 1000
+
+
+def task_estimate():
+    """(tokens, micro-dollars) reserved for one task"""
+    price = max(PRICE_PROMPT_PER_1K, PRICE_COMPLETION_PER_1K)
+    return TASK_TOKENS, int(TASK_TOKENS * price / 1000 * MICROS)
+
+
+class Usage:
+    """Tokens used by one task, added to from any thread"""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.prompt_tokens += int(prompt_tokens or 0)
+            self.completion_tokens += int(completion_tokens or 0)
+
+    def add_response(self, response):
+        """Count the ``usage`` of a chat completion response"""
+        usage = response.get("usage") or {}
+        self.add(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost_usd(self):
+        return cost(self.prompt_tokens, self.completion_tokens)
+
+
+def open_mission(redis_client, root_id, tokens=None, usd=None):
+    """Set a mission's limits; None takes the configured defaults"""
+    tokens = TOKENS_LIMIT if tokens is None else tokens
+    usd = USD_LIMIT if usd is None else usd
+    key = MISSION_KEY.format(root_id)
+    with redis_client.pipeline() as pipe:
+        pipe.hset(key, mapping={"limit_tokens": int(tokens), "limit_micros": int(usd * MICROS)})
+        pipe.expire(key, MISSION_TTL)
+        pipe.execute()
+
+
+def reserve(redis_client, root_id, force=False):
+    """
+    Reserve one task's estimate against a mission's budget.
+
+    Returns the reservation to hand back to ``settle()``; raises
+    ``BudgetExceeded`` if it does not fit, unless ``force``.
+    """
+    tokens, micros = task_estimate()
+    granted = redis_client.register_script(RESERVE_SCRIPT)(
+        keys=[MISSION_KEY.format(root_id)],
+        args=[tokens, micros, 1 if force else 0, MISSION_TTL],
+    )
+    if not granted:
+        raise BudgetExceeded(f"Mission {root_id} has no budget left for another task")
+    return [tokens, micros]
+
+
+def record(pipe, root_id, usage, reserved=None):
+    """Count ``usage`` against a mission and release ``reserved``, on a pipeline"""
+    key = MISSION_KEY.format(root_id)
+    pipe.hincrby(key, "spent_tokens", usage.total_tokens)
+    pipe.hincrby(key, "spent_micros", int(usage.cost_usd * MICROS))
+    if reserved:
+        pipe.hincrby(key, "reserved_tokens", -reserved[0])
+        pipe.hincrby(key, "reserved_micros", -reserved[1])
+    pipe.expire(key, MISSION_TTL)
+
+
+def remaining_tasks(redis_client, root_id):
+    """How many more task estimates fit in a mission's budget; None if unlimited"""
+    values = redis_client.hmget(
+        MISSION_KEY.format(root_id), "limit_tokens", "limit_micros",
+        "spent_tokens", "spent_micros", "reserved_tokens", "reserved_micros"
+    )
+    limit_tokens, limit_micros, spent_tokens, spent_micros, reserved_tokens, reserved_micros = (
+        int(v or 0) for v in values
+    )
+    tokens, micros = task_estimate()
+    fits = []
+    if limit_tokens:
+        fits.append((limit_tokens - spent_tokens - reserved_tokens) // tokens)
+    if limit_micros and micros:
+        fits.append((limit_micros - spent_micros - reserved_micros) // micros)
+    return max(min(fits), 0) if fits else None
+
+
+def mission(redis_client, root_id):
+    """A mission's limits, spend and outstanding reservations"""
+    state = {as_text(k): int(v) for k, v in redis_client.hgetall(MISSION_KEY.format(root_id)).items()}
+    return {
+        "limit_tokens": state.get("limit_tokens", 0),
+        "limit_usd": state.get("limit_micros", 0) / MICROS,
+        "spent_tokens": state.get("spent_tokens", 0),
+        "spent_usd": state.get("spent_micros", 0) / MICROS,
+        "reserved_tokens": state.get("reserved_tokens", 0),
+    }
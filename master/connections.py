@@ -0,0 +1,98 @@
+"""
+Process-wide Redis and Postgres connection pools, created on first use.
+
+Nothing here touches the network at import time, so importing ``master.main``
+from the worker or the UI no longer opens a second pair of connections. Both
+pools are safe to share between threads, which is also how async code reaches
+them (the async worker runs its blocking calls in executors). Pools are keyed
+to the process that created them: after a fork the child builds its own.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "10"))
+
+_lock = threading.Lock()
+_pid = None
+_redis_pool = None
+_pg_pool = None
+_pg_slots = None
+# Pools inherited across a fork are kept referenced but never used or closed:
+# closing them in the child would tear down the parent's server sessions.
+_inherited = []
+
+
+def as_text(value):
+    """A Redis reply as ``str``; clients without decode_responses return bytes"""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _check_process():
+    global _pid, _redis_pool, _pg_pool, _pg_slots
+    if _pid == os.getpid():
+        return
+    if _redis_pool is not None or _pg_pool is not None:
+        _inherited.append((_redis_pool, _pg_pool))
+    _pid = os.getpid()
+    _redis_pool = None
+    _pg_pool = None
+    _pg_slots = None
+
+
+def get_redis():
+    """Redis client backed by this process's connection pool"""
+    global _redis_pool
+    import redis
+
+    with _lock:
+        _check_process()
+        if _redis_pool is None:
+            _redis_pool = redis.ConnectionPool.from_url(
+                os.getenv("REDIS_URL"), max_connections=REDIS_MAX_CONNECTIONS
+            )
+        pool = _redis_pool
+    return redis.Redis(connection_pool=pool)
+
+
+def _get_pg_pool():
+    global _pg_pool, _pg_slots
+    from psycopg2.pool import ThreadedConnectionPool
+
+    with _lock:
+        _check_process()
+        if _pg_pool is None:
+            _pg_pool = ThreadedConnectionPool(
+                PG_POOL_MIN, PG_POOL_MAX, os.getenv("DATABASE_URL")
+            )
+            # ThreadedConnectionPool raises when exhausted; make callers wait
+            _pg_slots = threading.BoundedSemaphore(PG_POOL_MAX)
+        return _pg_pool, _pg_slots
+
+
+@contextmanager
+def pg_connection():
+    """
+    Borrow a pooled Postgres connection for one unit of work.
+
+    Commits when the block exits normally and rolls back if it raises.
+    """
+    pool, slots = _get_pg_pool()
+    slots.acquire()
+    conn = None
+    try:
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+    finally:
+        if conn is not None:
+            pool.putconn(conn, close=bool(conn.closed))
+        slots.release()
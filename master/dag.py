@@ -0,0 +1,154 @@
+"""
+Dependency-aware execution of a mission's subtasks.
+
+Decomposition returns a dependency graph: each subtask may list the earlier
+subtasks whose results it needs. ``spawn_task(..., depends_on=[...])`` records
+such a subtask as ``blocked`` with its prerequisites in ``depends_on`` and
+keeps its payload in the BLOCKED_KEY hash instead of the queue. Whenever a
+task finishes the master releases the blocked tasks whose prerequisites have
+all finished (done or failed): one UPDATE claims them, so concurrent releases
+never queue a task twice, and the payload is queued in the same transaction.
+The worker then adds the prerequisites' outputs to the prompt. Subtasks that
+do not depend on each other still run in parallel.
+"""
+
+import json
+import os
+import time
+
+from master import output_store, scheduler, stats, task_queue, tracing
+
+BLOCKED_KEY = "tasks:blocked"  # hash: task id -> payload waiting for its prerequisites
+
+# Characters of each prerequisite's output included in a dependent's prompt
+CONTEXT_CHARS = int(os.getenv("DAG_CONTEXT_CHARS", "2000"))
+
+DEPENDENT_PROMPT = """
+    {prompt}
+
+    Results of the tasks this one builds on:
+    {inputs}
+    """
+
+# Claims blocked tasks none of whose prerequisites are still queued, running
+# or blocked; callers append a condition to narrow it down. The predicate
+# matches idx_results_blocked.
+RELEASE_SQL = """
+    UPDATE results r SET status = 'queued'
+    WHERE r.status = 'blocked'
+    AND NOT EXISTS (
+        SELECT 1 FROM results d
+        WHERE d.id = ANY(r.depends_on) AND d.status IN ('queued', 'blocked')
+    )
+"""
+RELEASE_RETURNING = " RETURNING r.id, r.parent_id, r.root_id, r.prompt, r.depth, r.depends_on::text[]"
+
+
+def normalize(plan):
+    """
+    ``[(prompt, [indices of prerequisites]), ...]`` from a decomposition.
+
+    Plain strings have no prerequisites. References to the subtask itself,
+    to later subtasks, out of range or that are not integers (booleans
+    included) are dropped, which also rules out cycles.
+    """
+    subtasks = []
+    for i, item in enumerate(plan):
+        if isinstance(item, dict):
+            prompt = str(item.get("task") or item.get("prompt") or "")
+            depends_on = item.get("depends_on")
+        else:
+            prompt, depends_on = str(item), []
+        if isinstance(depends_on, int):
+            depends_on = [depends_on]
+        elif not isinstance(depends_on, list):
+            depends_on = []
+        deps = sorted({
+            d for d in depends_on
+            if isinstance(d, int) and not isinstance(d, bool) and 0 <= d < i
+        })
+        subtasks.append((prompt, deps))
+    return subtasks
+
+
+def stash(redis_client, task_data):
+    """Keep a blocked task's payload until its prerequisites finish"""
+    redis_client.hset(BLOCKED_KEY, task_data["task_id"], json.dumps(task_data))
+
+
+def discard(redis_client, task_id):
+    """Drop the payload of a task whose row was never recorded"""
+    redis_client.hdel(BLOCKED_KEY, task_id)
+
+
+def _payload(redis_client, row):
+    task_id, parent_id, root_id, prompt, depth, depends_on = row
+    task_id = str(task_id)
+    stashed = redis_client.hget(BLOCKED_KEY, task_id)
+    if stashed:
+        return json.loads(stashed)
+    # Redis lost the stash: rebuild what the row holds. Its budget
+    # reservation is gone with it, so the mission's reserved tokens stay up
+    # until the budget key expires.
+    return {
+        "task_id": task_id,
+        "parent_id": parent_id and str(parent_id),
+        "root_id": str(root_id or task_id),
+        "prompt": prompt,
+        "depth": depth,
+        "depends_on": depends_on or [],
+        "trace": tracing.context(root_id or task_id, task_id, parent_id),
+    }
+
+
+def release(redis_client, cur, condition="", params=()):
+    """
+    Queue the blocked tasks that are ready, on the caller's transaction.
+
+    Jobs are pushed before the caller commits, so a failed push rolls the
+    claim back and the next sweep retries it.
+    """
+    cur.execute(RELEASE_SQL + condition + RELEASE_RETURNING, params)
+    rows = cur.fetchall()
+    if not rows:
+        return []
+    payloads = [_payload(redis_client, row) for row in rows]
+    with redis_client.pipeline() as pipe:
+        for task_data in payloads:
+            # Queue wait counts from the release, not from when it was blocked
+            task_data["enqueued_at"] = time.time()
+            task_queue.push(
+                pipe,
+                json.dumps(task_data),
+                task_data["root_id"],
+                scheduler.priority(task_data["depth"], task_data.get("kind"))
+            )
+            stats.record_queued(pipe, task_data["depth"])
+            pipe.hdel(BLOCKED_KEY, task_data["task_id"])
+        pipe.execute()
+    return [task_data["task_id"] for task_data in payloads]
+
+
+def release_dependents(redis_client, cur, task_id):
+    """Blocked tasks waiting on ``task_id`` that are now ready"""
+    return release(redis_client, cur, " AND r.depends_on @> ARRAY[%s]::uuid[]", (task_id,))
+
+
+def render(conn, data):
+    """Full prompt of a dependent task, with its prerequisites' outputs"""
+    inputs = []
+    for i, task_id in enumerate(data["depends_on"], 1):
+        # The stored preview is enough unless it is missing or may have been
+        # cut shorter than CONTEXT_CHARS
+        output = output_store.load_preview(conn, task_id)
+        if output is None or (CONTEXT_CHARS > output_store.PREVIEW_CHARS
+                              and len(output) >= output_store.PREVIEW_CHARS):
+            output = output_store.load(conn, task_id) or ""
+        if len(output) > CONTEXT_CHARS:
+            output = output[:CONTEXT_CHARS] + "..."
+        inputs.append(f"[{i}] {output}")
+    return DEPENDENT_PROMPT.format(prompt=data["prompt"], inputs="\n\n".join(inputs))
+
+
+def clear(redis_client):
+    redis_client.delete(BLOCKED_KEY)
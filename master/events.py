@@ -0,0 +1,48 @@
+"""
+Task lifecycle events on a Redis Stream.
+
+Workers append a ``done`` event once a task's result is stored; the master
+blocks on the stream and reacts straight away instead of polling Postgres.
+The stream is capped (approximately) at EVENTS_MAXLEN entries, so it is a
+notification channel, not a log: anything the master misses while it is down
+is picked up by its periodic reconciliation sweep.
+"""
+
+import os
+
+from master.connections import as_text
+
+STREAM_KEY = "events:tasks"
+MAXLEN = int(os.getenv("EVENTS_MAXLEN", "10000"))
+
+
+def publish(redis_client, data, status="done"):
+    """Announce that a task reached ``status``"""
+    fields = {
+        "task_id": data["task_id"],
+        "parent_id": data.get("parent_id") or "",
+        "root_id": data.get("root_id") or "",
+        "depth": data.get("depth", 0),
+        "kind": data.get("kind") or "",
+        "status": status,
+    }
+    return redis_client.xadd(STREAM_KEY, fields, maxlen=MAXLEN, approximate=True)
+
+
+def latest_id(redis_client):
+    """ID of the newest event, to start reading after it"""
+    newest = redis_client.xrevrange(STREAM_KEY, count=1)
+    return as_text(newest[0][0]) if newest else "0-0"
+
+
+def read(redis_client, last_id, block_ms=1000, count=100):
+    """Events after ``last_id``, waiting up to ``block_ms`` for the first one"""
+    response = redis_client.xread({STREAM_KEY: last_id}, count=count, block=block_ms)
+    events = []
+    for _, entries in response or []:
+        for event_id, fields in entries:
+            events.append((
+                as_text(event_id),
+                {as_text(k): as_text(v) for k, v in fields.items()}
+            ))
+    return events
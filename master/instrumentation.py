@@ -0,0 +1,184 @@
+"""
+Prometheus-style counters and latency histograms, served on ``/metrics``.
+
+Each process keeps its own metrics in memory and, once ``serve()`` is called,
+exposes them in the Prometheus text format from a daemon thread (stdlib
+``http.server``, no client library needed). METRICS_PORT=0 disables the
+endpoint; pool workers serve on METRICS_PORT + 1 + their slot number.
+
+Task time is broken down by stage, each labelled with the task's depth and
+the model:
+
+    queue_wait       spawn_task() until a worker picks the task up
+    rate_limit_wait  waiting for a permit from the shared LLM rate limiter
+    agent_build      constructing the CrewAI agent, task and crew
+    llm              crew.kickoff() / one direct chat completion
+    db_write         storing the result (batched write-behind)
+    refinement_spawn spawning the follow-up refinement task
+    decompose        the master breaking a mission into subtasks
+    synthesis_spawn  the master queuing a synthesis task
+
+    curl -s localhost:9100/metrics | grep stage_seconds
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PORT = int(os.getenv("METRICS_PORT", "9100"))
+PREFIX = "infinite_crew_"
+
+# Seconds; task stages range from milliseconds (DB writes) to minutes (agents)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_lock = threading.Lock()
+_metrics = {}  # name -> metric
+_server = None
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    type = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        samples = []
+        with _lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state):
+                    samples.append((f"{self.name}_bucket", key + (("le", repr(float(bound))),), count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), state[-1]))
+                samples.append((f"{self.name}_sum", key, state[-2]))
+                samples.append((f"{self.name}_count", key, state[-1]))
+        return samples
+
+
+def _register(metric):
+    with _lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def counter(name, documentation=""):
+    return _register(Counter(PREFIX + name, documentation))
+
+
+def histogram(name, documentation="", buckets=BUCKETS):
+    return _register(Histogram(PREFIX + name, documentation, buckets))
+
+
+STAGE_SECONDS = histogram("stage_seconds", "Time spent per task stage")
+TASKS = counter("tasks_total", "Tasks finished, by outcome")
+LLM_REQUESTS = counter("llm_requests_total", "Direct LLM calls, by outcome")
+
+
+def observe(stage, seconds, **labels):
+    """Record ``seconds`` spent in ``stage``"""
+    STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Time the block as one ``stage`` observation, even if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, **labels)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown the task logs
+
+
+def serve(port=PORT):
+    """Start the ``/metrics`` endpoint in a daemon thread; no-op if disabled or running"""
+    global _server
+    if not port or _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on :{port}/metrics")
+    return _server
@@ -0,0 +1,210 @@
+"""
+Rate-limited chat completions shared by the master and the workers.
+
+Every call first takes a permit from a token bucket kept in Redis, so all
+processes together stay under the provider's quota: one bucket for requests
+per minute (LLM_RPM) and one for tokens per minute (LLM_TPM), checked and
+debited atomically by one Lua script. The token debit is an estimate (prompt
+length plus ``max_tokens``) that is corrected with the reported usage once
+the call returns. A 429 pauses the bucket for every process until the
+provider's ``Retry-After`` has passed, instead of each worker discovering the
+limit on its own.
+
+Requests go through one keep-alive ``requests.Session`` per process, and
+transient failures are retried with jittered exponential backoff.
+"""
+
+import os
+import random
+import threading
+import time
+
+from master import instrumentation
+from master.connections import get_redis
+
+MODEL = os.getenv("CREWAI_MODEL_NAME", "mistralai/Mixtral-8x7B-Instruct-v0.1")
+
+# 0 disables the corresponding bucket
+RPM = int(os.getenv("LLM_RPM", "0"))
+TPM = int(os.getenv("LLM_TPM", "0"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "20"))
+
+BUCKET_KEY = "ratelimit:llm:{}"
+PAUSE_KEY = "ratelimit:llm:pause"
+CHARS_PER_TOKEN = 4
+
+# Refills both buckets for the time since their last use, then debits them if
+# both have room (or unconditionally when ARGV[5] is 1, for corrections).
+# Returns 0 when the permit was granted, otherwise milliseconds to wait.
+ACQUIRE_SCRIPT = """
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local requests, tokens = tonumber(ARGV[3]), tonumber(ARGV[4])
+local force = ARGV[5] == '1'
+local pause = redis.call('PTTL', KEYS[3])
+if pause > 0 and not force then
+    return pause
+end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local buckets = {{KEYS[1], rpm, requests}, {KEYS[2], tpm, math.min(tokens, tpm)}}
+local wait = 0
+for _, b in ipairs(buckets) do
+    local limit, cost = b[2], b[3]
+    if limit > 0 then
+        local state = redis.call('HMGET', b[1], 'level', 'ts')
+        local level = tonumber(state[1]) or limit
+        local ts = tonumber(state[2]) or now
+        level = math.min(limit, level + (now - ts) * limit / 60000)
+        b[4] = level
+        if level < cost then
+            wait = math.max(wait, math.ceil((cost - level) * 60000 / limit))
+        end
+    end
+end
+if wait > 0 and not force then
+    return wait
+end
+for _, b in ipairs(buckets) do
+    if b[2] > 0 then
+        redis.call('HSET', b[1], 'level', math.min(b[2], b[4] - b[3]), 'ts', now)
+        redis.call('PEXPIRE', b[1], 120000)
+    end
+end
+return 0
+"""
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_openai():
+    """The ``openai`` module configured for our provider and HTTP session"""
+    global _session, _session_pid
+    # Deferred so the UI and monitor-only processes never pay for the import
+    import openai
+    import requests
+
+    with _session_lock:
+        if _session_pid != os.getpid():
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=HTTP_POOL_SIZE
+            )
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pid = os.getpid()
+        openai.api_base = os.getenv("OPENAI_API_BASE")
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        openai.requestssession = _session
+    return openai
+
+
+def estimate_tokens(messages, max_tokens):
+    return sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN + max_tokens
+
+
+def _bucket(redis_client, count, tokens, force=False):
+    script = redis_client.register_script(ACQUIRE_SCRIPT)
+    return script(
+        keys=[BUCKET_KEY.format("requests"), BUCKET_KEY.format("tokens"), PAUSE_KEY],
+        args=[RPM, TPM, count, tokens, 1 if force else 0],
+    )
+
+
+def acquire(redis_client, tokens):
+    """Block until the shared buckets grant one request of ``tokens`` tokens"""
+    if not RPM and not TPM:
+        return
+    while True:
+        wait_ms = _bucket(redis_client, 1, tokens)
+        if not wait_ms:
+            return
+        # A little jitter so waiters do not all retry on the same millisecond
+        time.sleep(wait_ms / 1000 * (1 + random.random() * 0.1))
+
+
+def settle(redis_client, estimated, actual):
+    """Charge or refund the difference between estimated and reported tokens"""
+    if TPM and actual is not None and actual != estimated:
+        _bucket(redis_client, 0, actual - estimated, force=True)
+
+
+def pause(redis_client, seconds):
+    """Hold every process's permits for ``seconds`` after the provider pushed back"""
+    if (RPM or TPM) and seconds > 0:
+        redis_client.set(PAUSE_KEY, "1", px=int(seconds * 1000), nx=True)
+
+
+def retry_after(error):
+    """Seconds from the error's Retry-After header, if it has one"""
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff(attempt):
+    """Full-jitter exponential delay for the given retry attempt"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _retryable(openai, error):
+    if isinstance(error, (openai.error.RateLimitError, openai.error.Timeout,
+                          openai.error.APIConnectionError,
+                          openai.error.ServiceUnavailableError,
+                          openai.error.TryAgain)):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 500) >= 500
+
+
+def chat(messages, max_tokens, temperature=0.7, model=None, depth=""):
+    """
+    One chat completion, rate limited across the cluster and retried on
+    transient errors. Returns the provider's response; raises the last error
+    once LLM_MAX_RETRIES retries are used up.
+    """
+    openai = get_openai()
+    redis_client = get_redis()
+    estimated = estimate_tokens(messages, max_tokens)
+    labels = {"depth": depth, "model": model or MODEL}
+
+    for attempt in range(MAX_RETRIES + 1):
+        with instrumentation.timed("rate_limit_wait", **labels):
+            acquire(redis_client, estimated)
+        started = time.perf_counter()
+        try:
+            response = openai.ChatCompletion.create(
+                model=model or MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                request_timeout=REQUEST_TIMEOUT,
+            )
+        except Exception as e:
+            instrumentation.observe("llm", time.perf_counter() - started, **labels)
+            if attempt == MAX_RETRIES or not _retryable(openai, e):
+                instrumentation.LLM_REQUESTS.inc(outcome="error", **labels)
+                raise
+            instrumentation.LLM_REQUESTS.inc(outcome="retry", **labels)
+            delay = backoff(attempt)
+            provider_delay = retry_after(e)
+            if isinstance(e, openai.error.RateLimitError):
+                pause(redis_client, provider_delay or delay)
+            if provider_delay is not None:
+                delay = max(delay, provider_delay)
+            print(f"LLM call failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        instrumentation.observe("llm", time.perf_counter() - started, **labels)
+        instrumentation.LLM_REQUESTS.inc(outcome="ok", **labels)
+        usage = response.get("usage") or {}
+        settle(redis_client, estimated, usage.get("total_tokens"))
+        return response
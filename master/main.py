@@ -1,23 +1,42 @@
 import os
 import uuid
 import json
-import redis
-import psycopg2
-import openai
-from crewai import Agent, Task, Crew
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize connections
-redis_client = redis.from_url(os.getenv("REDIS_URL"))
-pg = psycopg2.connect(os.getenv("DATABASE_URL"))
+# Make the shared ``master`` package importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from master import admission, budget, dag, events, instrumentation, llm, plan_cache, progress, scheduler, stats, task_queue, tracing
+from master.connections import get_redis, pg_connection
+from master.task_index import track_child, pending_children, release_child
 
-# Configure OpenAI/Together
-openai.api_base = os.getenv("OPENAI_API_BASE")
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# "poll" sweeps Postgres every 5 seconds; "events" reacts to worker completion
+# events and only sweeps every MONITOR_RECONCILE_INTERVAL seconds for safety
+MONITOR_MODE = os.getenv("MONITOR_MODE", "poll")
+RECONCILE_INTERVAL = int(os.getenv("MONITOR_RECONCILE_INTERVAL", "60"))
+
+# Deferred missions are decomposed here, one pass at a time, so the LLM call
+# never holds up the monitor loop
+_admission_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admission")
+_admitting = None
+
+# Fills root_id and path for rows recorded before those columns existed
+BACKFILL_PATHS_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT id, id AS root_id, id::text AS path
+        FROM results WHERE parent_id IS NULL AND root_id IS NULL
+        UNION ALL
+        SELECT r.id, t.root_id, t.path || '/' || r.id::text
+        FROM results r JOIN tree t ON r.parent_id = t.id
+    )
+    UPDATE results r SET root_id = tree.root_id, path = tree.path
+    FROM tree WHERE r.id = tree.id AND r.root_id IS NULL
+"""
 
 def init_database():
     """Initialize the database schema if it doesn't exist"""
-    with pg.cursor() as cur:
+    with pg_connection() as conn, conn.cursor() as cur:
         cur.execute("""
             CREATE TABLE IF NOT EXISTS results (
                 id UUID PRIMARY KEY,
@@ -28,138 +47,575 @@ def init_database():
                 created_at TIMESTAMPTZ DEFAULT now()
             );
         """)
-    pg.commit()
+        # Cold tier of the result cache
+        cur.execute("ALTER TABLE results ADD COLUMN IF NOT EXISTS prompt_hash TEXT")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_prompt_hash
+            ON results(prompt_hash) WHERE prompt_hash IS NOT NULL
+        """)
+        # Task status and child counters. Rows from before tasks were recorded
+        # at spawn time all hold results, so they are backfilled as done.
+        cur.execute("""
+            ALTER TABLE results
+                ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'done',
+                ADD COLUMN IF NOT EXISTS children_total INT NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS children_done INT NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS synthesis_spawned BOOLEAN NOT NULL DEFAULT FALSE,
+                ADD COLUMN IF NOT EXISTS completed_at TIMESTAMPTZ
+        """)
+        cur.execute("ALTER TABLE results ALTER COLUMN status SET DEFAULT 'queued'")
+        # Parents owed a synthesis task: set by run_master() once it has
+        # spawned all of a mission's subtasks, so a parent is never claimed
+        # while its fan-out is still going, and parents that only got a
+        # refinement child are never merged. Decomposed missions from before
+        # the column existed are backfilled once.
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'results' AND column_name = 'needs_synthesis'
+        """)
+        if not cur.fetchone():
+            cur.execute("""
+                ALTER TABLE results
+                    ADD COLUMN IF NOT EXISTS needs_synthesis BOOLEAN NOT NULL DEFAULT FALSE
+            """)
+            cur.execute("""
+                UPDATE results SET needs_synthesis = TRUE
+                WHERE parent_id IS NULL AND children_total > 0 AND NOT synthesis_spawned
+            """)
+        # Only parents whose children have all finished and that still need a
+        # synthesis task are in this index, so the monitor never scans
+        cur.execute("DROP INDEX IF EXISTS idx_results_awaiting_synthesis")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_synthesis_due ON results(id)
+            WHERE needs_synthesis AND NOT synthesis_spawned
+            AND children_done >= children_total
+        """)
+        # Keyset pagination of the UI's results list
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_created_at_id
+            ON results(created_at, id)
+        """)
+        # Mission and materialized path ('<root id>/<child id>/...'), so a
+        # mission's tree is one range scan on (root_id, path) in depth-first
+        # order. Existing rows are backfilled once.
+        cur.execute("""
+            ALTER TABLE results
+                ADD COLUMN IF NOT EXISTS root_id UUID,
+                ADD COLUMN IF NOT EXISTS path TEXT
+        """)
+        cur.execute(BACKFILL_PATHS_SQL)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_root_path ON results(root_id, path)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_missions
+            ON results(created_at, id) WHERE parent_id IS NULL
+        """)
+        # Output bodies, compressed and stored once per distinct text
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS outputs (
+                hash TEXT PRIMARY KEY,
+                encoding TEXT NOT NULL,
+                body BYTEA NOT NULL,
+                size INT NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT now()
+            )
+        """)
+        cur.execute("""
+            ALTER TABLE results
+                ADD COLUMN IF NOT EXISTS output_hash TEXT REFERENCES outputs(hash),
+                ADD COLUMN IF NOT EXISTS preview TEXT,
+                ADD COLUMN IF NOT EXISTS output_size INT
+        """)
+        # Tokens and cost of every LLM call made for the task (see master/budget.py)
+        cur.execute("""
+            ALTER TABLE results
+                ADD COLUMN IF NOT EXISTS prompt_tokens INT,
+                ADD COLUMN IF NOT EXISTS completion_tokens INT,
+                ADD COLUMN IF NOT EXISTS cost_usd NUMERIC(12, 6)
+        """)
+        # Subtasks waiting for their prerequisites (see master/dag.py)
+        cur.execute("ALTER TABLE results ADD COLUMN IF NOT EXISTS depends_on UUID[]")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_blocked
+            ON results USING GIN (depends_on) WHERE status = 'blocked'
+        """)
 
-def spawn_task(prompt, parent_id=None, depth=0):
-    """Add a new task to the Redis queue"""
+def spawn_task(prompt, parent_id=None, depth=0, root_id=None, kind=None, use_cache=True,
+               depends_on=None, budgeted=True, submitter=None):
+    """
+    Add a new task to the Redis queue, or hold it until ``depends_on`` have
+    finished. Raises ``budget.BudgetExceeded`` if the mission cannot afford
+    it, unless ``budgeted`` is False. A task without a parent starts a
+    mission in flight for ``submitter``.
+    """
     tid = str(uuid.uuid4())
     task_data = {
         "task_id": tid,
         "parent_id": parent_id,
+        "root_id": root_id or parent_id or tid,
         "prompt": prompt,
-        "depth": depth
+        "depth": depth,
+        # Lets the worker measure queue wait
+        "enqueued_at": time.time()
     }
-    redis_client.lpush("tasks", json.dumps(task_data))
+    if kind:
+        task_data["kind"] = kind
+    if not use_cache:
+        task_data["cache"] = False
+    if depends_on:
+        task_data["depends_on"] = list(depends_on)
+    # Handed back by the worker together with the task's actual usage
+    task_data["reserved"] = budget.reserve(get_redis(), task_data["root_id"], force=not budgeted)
+    
+    # A synthesis task takes over the slot its parent's mission held for it
+    # since the fan-out (see await_synthesis())
+    pending = 0 if kind == "synthesis" else 1
+    counted = recorded = False
+    try:
+        # Count the task against its parent and mission atomically, before it
+        # can be picked up and completed
+        with get_redis().pipeline() as pipe:
+            if parent_id:
+                track_child(pipe, parent_id)
+            else:
+                admission.register(pipe, tid, submitter)
+            admission.track(pipe, task_data["root_id"], pending)
+            pipe.execute()
+        counted = True
+        
+        # Record the task and count it against its parent row in one
+        # transaction. The row inherits its mission and extends its parent's
+        # materialized path.
+        with pg_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO results (id, parent_id, root_id, path, prompt, depth, status, depends_on)
+                VALUES (
+                    %(id)s, %(parent_id)s,
+                    COALESCE((SELECT root_id FROM results WHERE id = %(parent_id)s), %(root_id)s),
+                    COALESCE((SELECT path || '/' FROM results WHERE id = %(parent_id)s), '') || %(id)s,
+                    %(prompt)s, %(depth)s, %(status)s, %(depends_on)s::uuid[]
+                )
+                RETURNING root_id
+                """, {"id": tid, "parent_id": parent_id, "root_id": task_data["root_id"],
+                  "prompt": prompt, "depth": depth,
+                  "status": "blocked" if depends_on else "queued", "depends_on": depends_on or None})
+            task_data["root_id"] = str(cur.fetchone()[0])
+            task_data["trace"] = tracing.context(task_data["root_id"], tid, parent_id)
+            if parent_id:
+                cur.execute("""
+                    UPDATE results SET children_total = children_total + 1
+                    WHERE id = %s
+                """, (parent_id,))
+            # Stashed before the blocked row commits: a release that sees the
+            # row must find the full payload, reservation included
+            if depends_on:
+                dag.stash(get_redis(), task_data)
+        recorded = True
+        
+        if not depends_on:
+            with get_redis().pipeline() as pipe:
+                task_queue.push(
+                    pipe,
+                    json.dumps(task_data),
+                    task_data["root_id"],
+                    scheduler.priority(depth, kind)
+                )
+                stats.record_queued(pipe, depth)
+                pipe.execute()
+    except Exception as e:
+        print(f"Error spawning task {tid}: {e}")
+        abandon_task(task_data, pending, counted, recorded)
+        raise
+    
+    if depends_on:
+        # Prerequisites may have finished before the task was recorded
+        with pg_connection() as conn, conn.cursor() as cur:
+            dag.release(get_redis(), cur, " AND r.id = %s", (tid,))
+    tracing.record("enqueue", task_data["trace"], task_data["enqueued_at"], time.time(),
+                   task_id=tid, depth=depth, kind=kind or "task")
     print(f"Spawned task {tid}: {prompt[:50]}...")
     return tid
 
-def decompose(user_prompt):
-    """Use TogetherAI to break prompt into 1-4 sub-tasks"""
+def abandon_task(task_data, pending, counted, recorded):
+    """
+    Hand back what ``spawn_task()`` took for a task it could not queue, so
+    neither its parent nor its mission waits for a task that will never run.
+    Best effort: the store that failed the spawn may still be down.
+    """
+    tid, parent_id, root_id = task_data["task_id"], task_data["parent_id"], task_data["root_id"]
+    redis_client = get_redis()
+    steps = []
+    if recorded:
+        steps.append(lambda: delete_task(tid, parent_id))
+    if task_data.get("depends_on"):
+        steps.append(lambda: dag.discard(redis_client, tid))
+    steps.append(lambda: release_reservation(redis_client, root_id, task_data["reserved"]))
+    if counted:
+        if parent_id:
+            steps.append(lambda: release_child(redis_client, parent_id))
+        # A root task also holds its mission open while it is decomposed
+        for _ in range(pending + (0 if parent_id else 1)):
+            steps.append(lambda: admission.finish(redis_client, root_id))
+    for step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"Error abandoning task {tid}: {e}")
+
+def delete_task(tid, parent_id):
+    """Drop a task's row and its place in its parent's children_total"""
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM results WHERE id = %s", (tid,))
+        if parent_id:
+            cur.execute("""
+                UPDATE results SET children_total = children_total - 1
+                WHERE id = %s
+            """, (parent_id,))
+
+def release_reservation(redis_client, root_id, reserved):
+    """Return a task's budget reservation unspent"""
+    with redis_client.pipeline() as pipe:
+        budget.record(pipe, root_id, budget.Usage(), reserved)
+        pipe.execute()
+
+def request_plan(user_prompt, usage=None):
+    """Ask TogetherAI to break prompt into 1-4 sub-tasks; raises on failure"""
     messages = [
         {
             "role": "system", 
             "content": """Break the following user request into 1-4 simpler sub-tasks.
             If the task is already simple enough, return a JSON array with just that one task.
-            Otherwise, break it down into logical, sequential sub-tasks.
-            Return ONLY a JSON array of strings, no explanation.
-            Example: ["Research X", "Analyze findings", "Write summary"]"""
+            Otherwise, break it down into logical sub-tasks and give, for each, the
+            positions (0-based) of the earlier sub-tasks whose results it needs.
+            Sub-tasks that do not need each other run in parallel.
+            Return ONLY a JSON array, no explanation.
+            Example: [{"task": "Research X", "depends_on": []},
+                      {"task": "Research Y", "depends_on": []},
+                      {"task": "Compare X and Y", "depends_on": [0, 1]}]"""
         },
         {"role": "user", "content": user_prompt}
     ]
     
+    response = llm.chat(messages, max_tokens=500, temperature=0.2)
+    if usage is not None:
+        usage.add_response(response)
+    
+    content = response.choices[0].message.content.strip()
+    # Clean up response if needed
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.endswith("```"):
+        content = content[:-3]
+    
+    subtasks = json.loads(content.strip())
+    return subtasks if isinstance(subtasks, list) else [user_prompt]
+
+def decompose(user_prompt, usage=None):
+    """Use TogetherAI to break prompt into 1-4 sub-tasks, adding its tokens to ``usage``"""
     try:
-        response = openai.ChatCompletion.create(
-            model=os.getenv("CREWAI_MODEL_NAME", "mistralai/Mixtral-8x7B-Instruct-v0.1"),
-            messages=messages,
-            temperature=0.2,
-            max_tokens=500
-        )
-        
-        content = response.choices[0].message.content.strip()
-        # Clean up response if needed
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-        
-        subtasks = json.loads(content.strip())
-        return subtasks if isinstance(subtasks, list) else [user_prompt]
+        # Identical missions share one cached (or in-flight) plan
+        with instrumentation.timed("decompose", depth=0, model=llm.MODEL):
+            return plan_cache.get_plan(
+                get_redis(),
+                user_prompt,
+                llm.MODEL,
+                lambda: request_plan(user_prompt, usage)
+            )
     except Exception as e:
         print(f"Error decomposing task: {e}")
         # Fallback: return original prompt as single task
         return [user_prompt]
 
-def check_completion(parent_id):
-    """Check if all subtasks of a parent are complete"""
-    with pg.cursor() as cur:
+# Claims parents owed a synthesis whose children have all finished. Setting
+# synthesis_spawned in the same statement makes spawning idempotent across
+# ticks, events and multiple masters; the predicate matches
+# idx_results_synthesis_due.
+CLAIM_SYNTHESIS_SQL = """
+    UPDATE results SET synthesis_spawned = TRUE
+    WHERE needs_synthesis AND NOT synthesis_spawned
+    AND children_done >= children_total
+"""
+
+def await_synthesis(parent_id, root_id):
+    """Make a parent's synthesis claimable, now that all its subtasks are spawned"""
+    with get_redis().pipeline() as pipe:
+        admission.track(pipe, root_id, 1)  # The synthesis task the mission now owes
+        pipe.execute()
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE results SET needs_synthesis = TRUE WHERE id = %s", (parent_id,))
+    
+    # Subtasks that finished during the fan-out have had their events already
+    if pending_children(get_redis(), parent_id) > 0:
+        return
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute(CLAIM_SYNTHESIS_SQL + " AND id = %s RETURNING root_id", (parent_id,))
+        claimed = cur.fetchone()
+    if claimed:
+        spawn_synthesis(parent_id, claimed[0] and str(claimed[0]))
+
+def record_decomposition(root_id, usage):
+    """Charge a mission's decomposition to its root task and its budget"""
+    with pg_connection() as conn, conn.cursor() as cur:
         cur.execute("""
-            SELECT COUNT(*) FROM results 
-            WHERE parent_id = %s AND output IS NOT NULL
-        """, (parent_id,))
-        completed = cur.fetchone()[0]
-        
-        # Check if there are any pending tasks
-        pending_tasks = []
-        for i in range(redis_client.llen("tasks")):
-            task = json.loads(redis_client.lindex("tasks", i))
-            if task.get("parent_id") == parent_id:
-                pending_tasks.append(task)
-        
-        return len(pending_tasks) == 0 and completed > 0
+            UPDATE results SET
+                prompt_tokens = COALESCE(prompt_tokens, 0) + %s,
+                completion_tokens = COALESCE(completion_tokens, 0) + %s,
+                cost_usd = COALESCE(cost_usd, 0) + %s
+            WHERE id = %s
+        """, (usage.prompt_tokens, usage.completion_tokens, usage.cost_usd, root_id))
+    with get_redis().pipeline() as pipe:
+        budget.record(pipe, root_id, usage)
+        pipe.execute()
 
-def run_master(user_prompt):
-    """Main orchestration logic"""
+def run_master(user_prompt, use_cache=True, budget_tokens=None, budget_usd=None,
+               submitter=None, decompose_mission=True):
+    """
+    Main orchestration logic. The mission's budget defaults to
+    MISSION_BUDGET_TOKENS / MISSION_BUDGET_USD; 0 means unlimited. Without
+    ``decompose_mission`` the mission runs as a single task.
+    """
     print(f"\nReceived mission: {user_prompt}")
     
     # Decompose the task
-    subs = decompose(user_prompt)
-    print(f"Decomposed into {len(subs)} sub-tasks")
-    
-    if len(subs) == 1:
-        # Simple task - execute directly
-        spawn_task(subs[0])
+    started = time.time()
+    usage = budget.Usage()
+    if decompose_mission:
+        subs = dag.normalize(decompose(user_prompt, usage))
     else:
-        # Complex task - create parent and spawn subtasks
-        parent = spawn_task(user_prompt, depth=0)  # Meta task
-        for i, sub in enumerate(subs):
-            spawn_task(sub, parent_id=parent, depth=1)
-            time.sleep(0.1)  # Small delay to avoid overwhelming
+        subs = [(user_prompt, [])]
+    decomposed = time.time()
+    waiting = sum(1 for _, deps in subs if deps)
+    print(f"Decomposed into {len(subs)} sub-tasks ({waiting} waiting on others)")
+    
+    # The root task is the mission: simple missions run their one subtask,
+    # complex ones a meta task alongside the subtasks
+    root = spawn_task(subs[0][0] if len(subs) == 1 else user_prompt, depth=0, use_cache=use_cache,
+                      submitter=submitter)
+    budget.open_mission(get_redis(), root, budget_tokens, budget_usd)
+    record_decomposition(root, usage)
+    
+    spawned = []
+    try:
+        if len(subs) > 1:
+            # Fan out no wider than the budget allows, keeping room for the
+            # synthesis task; below two subtasks the root runs the mission alone
+            affordable = budget.remaining_tasks(get_redis(), root)
+            if affordable is not None and affordable - 1 < len(subs):
+                subs = subs[:max(affordable - 1, 0)] if affordable >= 3 else []
+                print(f"Budget allows {len(subs)} sub-tasks" if subs else
+                      "Budget too small to fan out; running the mission as one task")
+            
+            # Prerequisites come first in the plan, so their IDs are known by the
+            # time they are needed, and truncating the plan keeps them valid
+            for sub, deps in subs:
+                admission.pace(get_redis())  # Waits only while the queue is over its watermark
+                spawned.append(spawn_task(
+                    sub, parent_id=root, depth=1, root_id=root, use_cache=use_cache,
+                    depends_on=[spawned[d] for d in deps]
+                ))
+    finally:
+        # Every subtask is counted now; the mission ends with its last task
+        if spawned:
+            await_synthesis(root, root)
+        admission.finish(get_redis(), root)
+    
+    # The mission's trace is keyed by its root task, known only now
+    tracing.record("decompose", tracing.context(root, root), started, decomposed,
+                   subtasks=len(subs))
+    return root
 
-def monitor_loop():
-    """Monitor task completion and spawn new tasks if needed"""
-    print("Starting master orchestrator monitor loop...")
+def submit_mission(user_prompt, submitter=None, **options):
+    """
+    Admission-controlled entry point for new missions; ``options`` go to
+    ``run_master()``. Returns a dict with ``status`` (admitted, degraded or
+    deferred) and the ``mission_id``, or the ``ticket`` of a deferred
+    mission with its position and estimated start. Raises
+    ``admission.Rejected`` when over capacity under the reject policy.
+    """
+    redis_client = get_redis()
+    blocked = admission.check(redis_client, submitter)
+    if blocked is None:
+        return {"status": "admitted",
+                "mission_id": run_master(user_prompt, submitter=submitter, **options)}
+    
+    scope, reason = blocked
+    policy = admission.POLICY
+    if policy == "degrade" and scope == "submitter":
+        policy = "defer"  # A smaller mission would still exceed the submitter's share
+    print(f"Mission over capacity ({reason}), policy: {policy}")
+    if policy == "reject":
+        raise admission.Rejected(f"Mission not accepted: {reason}")
+    if policy == "degrade":
+        return {"status": "degraded", "reason": reason,
+                "mission_id": run_master(user_prompt, submitter=submitter,
+                                         decompose_mission=False, **options)}
+    ticket = admission.defer(redis_client, {"prompt": user_prompt, "submitter": submitter,
+                                            "options": options})
+    return {"status": "deferred", "reason": reason, "ticket": ticket,
+            **admission.position(redis_client, ticket=ticket)}
+
+def admit_deferred(redis_client):
+    """Start parked missions in the background, unless a pass is still running"""
+    global _admitting
+    if _admitting is not None and not _admitting.done():
+        return
+    if _admitting is not None and _admitting.exception():
+        print(f"Error admitting deferred missions: {_admitting.exception()}")
+    _admitting = _admission_pool.submit(start_deferred, redis_client)
+
+def start_deferred(redis_client):
+    """Start parked missions, oldest first, while there is capacity"""
+    for mission in admission.deferred(redis_client):
+        blocked = admission.check(redis_client, mission["submitter"])
+        if blocked and blocked[0] == "system":
+            break
+        if blocked or not admission.claim(redis_client, mission["ticket"]):
+            continue  # This submitter is at its limit; later ones may not be
+        try:
+            root = run_master(mission["prompt"], submitter=mission["submitter"],
+                              **mission["options"])
+            admission.admitted(redis_client, mission["ticket"], root)
+        except Exception as e:
+            print(f"Error starting deferred mission {mission['ticket']}: {e}")
+
+def spawn_synthesis(parent_id, root_id=None):
+    """Queue the task that consolidates a finished parent's subtasks"""
+    print(f"Parent {parent_id} subtasks complete, spawning synthesis task")
+    trace = tracing.context(root_id or parent_id, parent_id)
+    try:
+        with instrumentation.timed("synthesis_spawn", depth=2, model=llm.MODEL), \
+                tracing.span("spawn_synthesis", trace, task_id=parent_id):
+            # The fan-out left room for it; a mission without its synthesis
+            # would have spent its budget for nothing
+            spawn_task(
+                f"Synthesize the results of subtasks for parent task {parent_id}",
+                parent_id=parent_id,
+                depth=2,
+                root_id=root_id,
+                kind="synthesis",
+                budgeted=False
+            )
+    except Exception:
+        # Release the claim so the next sweep retries
+        with pg_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "UPDATE results SET synthesis_spawned = FALSE WHERE id = %s",
+                (parent_id,)
+            )
+        raise
+
+def housekeeping(redis_client):
+    """Report queue depth and stuck tasks; hand jobs of dead workers back to the queue"""
+    queue_size = scheduler.size(redis_client)
+    print(f"\nQueue size: {queue_size}")
+    
+    if task_queue.reliable():
+        requeued = task_queue.reap(redis_client)
+        if requeued:
+            print(f"Requeued {requeued} tasks from expired worker leases")
+    
+    for task_id, idle in progress.stuck(redis_client):
+        print(f"Task {task_id} has reported no progress for {idle:.0f}s")
+    
+    admit_deferred(redis_client)
+
+def reconcile():
+    """Release ready subtasks; spawn synthesis for parents whose children have all finished"""
+    with pg_connection() as conn, conn.cursor() as cur:
+        released = dag.release(get_redis(), cur)
+    if released:
+        print(f"Released {len(released)} subtasks whose prerequisites finished")
     
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute(CLAIM_SYNTHESIS_SQL + " RETURNING id, root_id")
+        ready_parents = cur.fetchall()
+    
+    for parent_id, root_id in ready_parents:
+        spawn_synthesis(str(parent_id), root_id and str(root_id))
+
+def handle_event(event):
+    """React to a task completion published by a worker"""
+    parent_id = event.get("parent_id")
+    if event.get("status") not in ("done", "failed"):
+        return
+    
+    # Subtasks waiting on this one may be ready now; most missions have none
+    if get_redis().hlen(dag.BLOCKED_KEY):
+        with pg_connection() as conn, conn.cursor() as cur:
+            dag.release_dependents(get_redis(), cur, event["task_id"])
+    if not parent_id:
+        return
+    
+    # Siblings still outstanding: a Redis GET, no database round-trip
+    if pending_children(get_redis(), parent_id) > 0:
+        return
+    
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute(CLAIM_SYNTHESIS_SQL + " AND id = %s RETURNING root_id", (parent_id,))
+        claimed = cur.fetchone()
+    
+    if claimed:
+        spawn_synthesis(parent_id, claimed[0] and str(claimed[0]))
+
+def poll_loop(redis_client):
+    """Sweep every 5 seconds"""
     while True:
         try:
-            # Check queue status
-            queue_size = redis_client.llen("tasks")
-            print(f"\nQueue size: {queue_size}")
+            housekeeping(redis_client)
+            reconcile()
+            time.sleep(5)  # Check every 5 seconds
             
-            # Check for completed parent tasks that might need synthesis
-            with pg.cursor() as cur:
-                cur.execute("""
-                    SELECT DISTINCT parent_id FROM results 
-                    WHERE parent_id IS NOT NULL 
-                    AND parent_id NOT IN (
-                        SELECT id FROM results WHERE output IS NOT NULL
-                    )
-                """)
-                incomplete_parents = cur.fetchall()
-                
-                for (parent_id,) in incomplete_parents:
-                    if check_completion(parent_id):
-                        print(f"Parent {parent_id} subtasks complete, spawning synthesis task")
-                        spawn_task(
-                            f"Synthesize the results of subtasks for parent task {parent_id}",
-                            parent_id=parent_id,
-                            depth=2
-                        )
+        except Exception as e:
+            print(f"Monitor loop error: {e}")
+            time.sleep(10)
+
+def event_loop(redis_client):
+    """React to completion events as they arrive, with a slow safety sweep"""
+    last_id = events.latest_id(redis_client)
+    next_housekeeping = 0
+    next_sweep = 0  # Sweep right away to catch up on anything missed while down
+    
+    while True:
+        try:
+            now = time.monotonic()
+            if now >= next_housekeeping:
+                housekeeping(redis_client)
+                next_housekeeping = now + 5
+            if now >= next_sweep:
+                reconcile()
+                next_sweep = now + RECONCILE_INTERVAL
             
-            time.sleep(5)  # Check every 5 seconds
+            for event_id, event in events.read(redis_client, last_id, block_ms=1000):
+                last_id = event_id
+                handle_event(event)
             
         except Exception as e:
             print(f"Monitor loop error: {e}")
             time.sleep(10)
 
+def monitor_loop():
+    """Monitor task completion and spawn new tasks if needed"""
+    print(f"Starting master orchestrator monitor loop ({MONITOR_MODE} mode)...")
+    instrumentation.serve()
+    redis_client = get_redis()
+    
+    if MONITOR_MODE == "events":
+        event_loop(redis_client)
+    else:
+        poll_loop(redis_client)
+
 if __name__ == "__main__":
     # Initialize database
     init_database()
     
+    # `main.py monitor` is how the deployments start the master service
+    if sys.argv[1:] == ["monitor"]:
+        monitor_loop()
     # Start with a user prompt if provided
-    import sys
-    if len(sys.argv) > 1:
+    elif len(sys.argv) > 1:
         user_mission = " ".join(sys.argv[1:])
-        run_master(user_mission)
+        print(submit_mission(user_mission, submitter="cli"))
     else:
         # Interactive mode
         print("Master Orchestrator started in interactive mode")
@@ -169,6 +625,6 @@ if __name__ == "__main__":
         if user_input.lower() == "monitor":
             monitor_loop()
         else:
-            run_master(user_input)
+            print(submit_mission(user_input, submitter="cli"))
             print("\nMission queued! Starting monitor loop...")
             monitor_loop()
@@ -0,0 +1,104 @@
+"""
+Compressed, content-addressed storage of task outputs.
+
+Output bodies live once per distinct text in the ``outputs`` table, keyed by
+their SHA-256, zlib-compressed (or zstd when OUTPUT_CODEC=zstd and the
+optional ``zstandard`` package is installed) once they reach
+OUTPUT_COMPRESS_MIN_BYTES. A result row points at its body through
+``output_hash`` and carries ``preview`` (the first OUTPUT_PREVIEW_CHARS
+characters) and ``output_size``, so listings never read or decompress bodies.
+
+Rows written before this store existed keep their text in ``results.output``;
+the read helpers fall back to it.
+"""
+
+import hashlib
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC = os.getenv("OUTPUT_CODEC", "zlib")
+MIN_COMPRESS_BYTES = int(os.getenv("OUTPUT_COMPRESS_MIN_BYTES", "512"))
+PREVIEW_CHARS = int(os.getenv("OUTPUT_PREVIEW_CHARS", "2000"))
+
+# Select BODY_COLUMNS with BODY_JOIN (results aliased ``r``) and pass the
+# three values to decode()
+BODY_COLUMNS = "r.output, o.encoding, o.body"
+BODY_JOIN = "LEFT JOIN outputs o ON o.hash = r.output_hash"
+
+INSERT_SQL = """
+    INSERT INTO outputs(hash, encoding, body, size) VALUES %s
+    ON CONFLICT (hash) DO NOTHING
+"""
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def preview(text):
+    return text[:PREVIEW_CHARS]
+
+
+def encode(text):
+    """``(encoding, body)`` for ``text``, compressed when that pays off"""
+    raw = text.encode()
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return "plain", raw
+    if CODEC == "zstd" and zstandard is not None:
+        encoding, body = "zstd", zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        encoding, body = "zlib", zlib.compress(raw, 6)
+    return (encoding, body) if len(body) < len(raw) else ("plain", raw)
+
+
+def decode(output, encoding, body):
+    """Text of a result from its legacy column or its stored body"""
+    if body is None:
+        return output
+    body = bytes(body)
+    if encoding == "zlib":
+        body = zlib.decompress(body)
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("output is zstd-compressed but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    return body.decode()
+
+
+def prepare(text):
+    """
+    Everything needed to store ``text``: the ``outputs`` row
+    ``(hash, encoding, body, size)`` and the result's preview.
+
+    Compression is done here, by the caller, so it runs in parallel with
+    other tasks rather than inside a batch flush.
+    """
+    encoding, body = encode(text)
+    return (content_hash(text), encoding, body, len(text)), preview(text)
+
+
+def load(conn, task_id):
+    """Full output of a task, or None if it has none yet"""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {BODY_COLUMNS} FROM results r {BODY_JOIN} WHERE r.id = %s",
+            (task_id,)
+        )
+        row = cur.fetchone()
+    return decode(*row) if row else None
+
+
+def load_preview(conn, task_id):
+    """Stored preview of a task's output, without touching its body"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT COALESCE(preview, LEFT(output, %s)) FROM results WHERE id = %s",
+            (PREVIEW_CHARS, task_id)
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
@@ -0,0 +1,129 @@
+"""
+Memoized, single-flight mission decomposition.
+
+Plans are cached in a bounded in-memory LRU with a TTL and persisted to Redis
+with the same TTL, so a restarted master (or the UI process) starts warm.
+Concurrent requests for the same prompt share one LLM call: within a process
+followers wait on the leader's future, and across processes a short Redis
+lock lets one caller decompose while the others poll for its plan.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from master.result_cache import prompt_hash
+
+TTL = int(os.getenv("PLAN_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+# Upper bound on how long one decompose call may hold the cross-process lock
+LOCK_TTL = int(os.getenv("PLAN_CACHE_LOCK_TTL", "60"))
+POLL_INTERVAL = 0.2
+
+PLAN_KEY = "cache:plan:{}"
+LOCK_KEY = "cache:plan:lock:{}"
+
+# Deletes the lock only while it still holds our token: once it has expired
+# it may belong to another caller
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_entries = OrderedDict()  # key -> (expires_at, plan)
+_inflight = {}  # key -> Future shared by concurrent callers
+_lock = threading.Lock()
+
+
+def _remember(key, plan):
+    with _lock:
+        _entries[key] = (time.monotonic() + TTL, plan)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def _recall(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires_at, plan = entry
+        if expires_at < time.monotonic():
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return plan
+
+
+def _load(redis_client, key):
+    raw = redis_client.get(PLAN_KEY.format(key))
+    return json.loads(raw) if raw else None
+
+
+def _load_or_compute(redis_client, key, compute):
+    """Fetch a persisted plan, or compute it holding the cross-process lock"""
+    deadline = time.monotonic() + LOCK_TTL
+    token = uuid.uuid4().hex
+    locked = False
+    while True:
+        plan = _load(redis_client, key)
+        if plan is not None:
+            return plan
+        locked = redis_client.set(LOCK_KEY.format(key), token, nx=True, px=LOCK_TTL * 1000)
+        if locked:
+            break
+        if time.monotonic() >= deadline:
+            # The holder is stuck or gone; stop waiting and decompose ourselves
+            break
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        plan = compute()
+        redis_client.set(PLAN_KEY.format(key), json.dumps(plan), ex=TTL)
+        return plan
+    finally:
+        # After a timed-out wait the lock, if any, is another caller's
+        if locked:
+            release = redis_client.register_script(RELEASE_SCRIPT)
+            release(keys=[LOCK_KEY.format(key)], args=[token])
+
+
+def get_plan(redis_client, prompt, model, compute):
+    """
+    Return the plan for ``prompt``, calling ``compute()`` only on a miss.
+
+    Exceptions from ``compute`` propagate to every waiting caller and nothing
+    is cached, so a failed decomposition is retried on the next request.
+    """
+    key = prompt_hash(prompt, model)
+    plan = _recall(key)
+    if plan is not None:
+        return plan
+
+    with _lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+
+    if not leader:
+        return future.result()
+
+    try:
+        plan = _load_or_compute(redis_client, key, compute)
+        _remember(key, plan)
+        future.set_result(plan)
+        return plan
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
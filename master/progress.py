@@ -0,0 +1,95 @@
+"""
+Live progress of running tasks on per-task Redis Streams.
+
+While a worker executes a task it appends each agent step (or synthesis
+level) to ``progress:<task_id>``, so the UI can show partial output long
+before the result row exists. Streams are capped at PROGRESS_MAXLEN entries
+of at most PROGRESS_CHUNK_CHARS characters each and expire PROGRESS_TTL
+seconds after their last write. The ``progress:active`` sorted set holds the
+time of every running task's latest update: a task that stays silent for
+PROGRESS_STUCK_AFTER seconds is reported as stuck.
+"""
+
+import os
+import time
+
+from master.connections import as_text
+
+STREAM_KEY = "progress:{}"
+ACTIVE_KEY = "progress:active"
+
+MAXLEN = int(os.getenv("PROGRESS_MAXLEN", "200"))
+CHUNK_CHARS = int(os.getenv("PROGRESS_CHUNK_CHARS", "2000"))
+TTL = int(os.getenv("PROGRESS_TTL", "3600"))
+STUCK_AFTER = int(os.getenv("PROGRESS_STUCK_AFTER", "600"))
+# A finished task's stream only needs to outlive the UI catching up
+FINISHED_TTL = 300
+
+
+def append(redis_client, task_id, text, kind="step"):
+    """Record one piece of partial output for a running task"""
+    if len(text) > CHUNK_CHARS:
+        text = text[:CHUNK_CHARS] + "..."
+    key = STREAM_KEY.format(task_id)
+    pipe = redis_client.pipeline()
+    pipe.xadd(key, {"kind": kind, "text": text}, maxlen=MAXLEN, approximate=True)
+    pipe.expire(key, TTL)
+    pipe.zadd(ACTIVE_KEY, {task_id: time.time()})
+    pipe.execute()
+
+
+def finish(redis_client, task_id, status="done"):
+    """Close a task's stream and stop watching it"""
+    key = STREAM_KEY.format(task_id)
+    pipe = redis_client.pipeline()
+    pipe.xadd(key, {"kind": status, "text": ""}, maxlen=MAXLEN, approximate=True)
+    pipe.expire(key, FINISHED_TTL)
+    pipe.zrem(ACTIVE_KEY, task_id)
+    pipe.execute()
+
+
+def read(redis_client, task_id, last_id="0-0", count=100):
+    """
+    Entries after ``last_id`` as ``(entries, last_id)``.
+
+    Pass the returned ``last_id`` back in to tail the stream; each entry is a
+    dict with ``id``, ``kind`` (start, step, done or failed) and ``text``.
+    """
+    entries = []
+    response = redis_client.xread({STREAM_KEY.format(task_id): last_id}, count=count)
+    for _, stream_entries in response or []:
+        for entry_id, fields in stream_entries:
+            entry = {as_text(k): as_text(v) for k, v in fields.items()}
+            entry["id"] = last_id = as_text(entry_id)
+            entries.append(entry)
+    return entries, last_id
+
+
+def active(redis_client):
+    """Running tasks with the seconds since each last reported progress"""
+    now = time.time()
+    return [
+        (as_text(task_id), now - updated)
+        for task_id, updated in redis_client.zrange(ACTIVE_KEY, 0, -1, withscores=True)
+    ]
+
+
+def stuck(redis_client, idle_seconds=STUCK_AFTER):
+    """
+    Tasks that have not reported progress for ``idle_seconds``.
+
+    Tasks silent for longer than PROGRESS_TTL lost their stream and are
+    forgotten; the queue's lease reaper deals with the job itself.
+    """
+    now = time.time()
+    redis_client.zremrangebyscore(ACTIVE_KEY, "-inf", now - TTL)
+    return [
+        (as_text(task_id), now - updated)
+        for task_id, updated in redis_client.zrangebyscore(
+            ACTIVE_KEY, "-inf", now - idle_seconds, withscores=True
+        )
+    ]
+
+
+def clear(redis_client):
+    redis_client.delete(ACTIVE_KEY)
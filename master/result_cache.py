@@ -0,0 +1,106 @@
+"""
+Exact-match cache of task outputs.
+
+Entries are keyed on a hash of the whitespace-normalized prompt plus the model
+name. The hot tier is Redis: one key per entry with a TTL, plus a sorted set
+of last-access times used to evict the least recently used entries once the
+cache grows past RESULT_CACHE_MAX_ENTRIES. The cold tier is the ``results``
+table itself, looked up through its indexed ``prompt_hash`` column; cold hits
+are promoted back into Redis.
+"""
+
+import hashlib
+import os
+import time
+
+from master import output_store
+from master.connections import as_text
+
+ENABLED = os.getenv("RESULT_CACHE", "1") == "1"
+TTL = int(os.getenv("RESULT_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+ENTRY_KEY = "cache:result:{}"
+LRU_KEY = "cache:result:lru"
+STATS_KEY = "cache:result:stats"
+
+# What worker.execute_task() returns when the crew fails; never worth caching
+ERROR_PREFIX = "Error executing task:"
+
+
+def normalize(prompt):
+    """Collapse whitespace so trivially different prompts share an entry"""
+    return " ".join(prompt.split())
+
+
+def prompt_hash(prompt, model):
+    """Cache key of a prompt for a given model"""
+    return hashlib.sha256(f"{model}\n{normalize(prompt)}".encode()).hexdigest()
+
+
+def cacheable(output):
+    """Whether an output should be served to later identical tasks"""
+    return bool(output) and not output.startswith(ERROR_PREFIX)
+
+
+def lookup(redis_client, pg, key):
+    """Return the cached output for ``key`` from Redis or Postgres, or None"""
+    output = redis_client.get(ENTRY_KEY.format(key))
+    if output is not None:
+        redis_client.zadd(LRU_KEY, {key: time.time()})
+        redis_client.hincrby(STATS_KEY, "hot_hits", 1)
+        return as_text(output)
+
+    try:
+        with pg.cursor() as cur:
+            cur.execute(f"""
+                SELECT {output_store.BODY_COLUMNS} FROM results r {output_store.BODY_JOIN}
+                WHERE r.prompt_hash = %s AND r.status = 'done'
+                AND (r.output_hash IS NOT NULL OR r.output IS NOT NULL)
+                AND COALESCE(r.preview, r.output) NOT LIKE %s
+                ORDER BY r.created_at DESC
+                LIMIT 1
+            """, (key, ERROR_PREFIX + "%"))
+            row = cur.fetchone()
+    finally:
+        # Don't leave the read transaction open on a shared connection
+        pg.rollback()
+
+    if row:
+        output = output_store.decode(*row)
+        store(redis_client, key, output)
+        redis_client.hincrby(STATS_KEY, "cold_hits", 1)
+        return output
+
+    redis_client.hincrby(STATS_KEY, "misses", 1)
+    return None
+
+
+def store(redis_client, key, output):
+    """Put an output in the hot tier, evicting least recently used entries"""
+    now = time.time()
+    with redis_client.pipeline() as pipe:
+        pipe.set(ENTRY_KEY.format(key), output, ex=TTL)
+        pipe.zadd(LRU_KEY, {key: now})
+        # Entries that expired on their own no longer need tracking
+        pipe.zremrangebyscore(LRU_KEY, "-inf", now - TTL)
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+
+    if size > MAX_ENTRIES:
+        evicted = redis_client.zpopmin(LRU_KEY, size - MAX_ENTRIES)
+        if evicted:
+            redis_client.delete(*[ENTRY_KEY.format(as_text(k)) for k, _ in evicted])
+            redis_client.hincrby(STATS_KEY, "evictions", len(evicted))
+
+
+def stats(redis_client):
+    """Hit/miss counters of the cache"""
+    raw = redis_client.hgetall(STATS_KEY)
+    counters = {as_text(k): int(v) for k, v in raw.items()}
+    for name in ("hot_hits", "cold_hits", "misses", "evictions"):
+        counters.setdefault(name, 0)
+    lookups = counters["hot_hits"] + counters["cold_hits"] + counters["misses"]
+    hits = counters["hot_hits"] + counters["cold_hits"]
+    counters["hit_rate"] = hits / lookups if lookups else 0.0
+    return counters
@@ -0,0 +1,227 @@
+"""
+Ordering of ready tasks.
+
+``fifo`` (the default) keeps the original single ``tasks`` list: LPUSH to
+enqueue, pop from the right.
+
+``fair`` (SCHEDULER_MODE=fair) keeps ready tasks in the ``tasks:ready`` sorted
+set, scored with start-time fair queueing across root missions. Every mission
+has its own virtual clock; a new task is tagged one step after the later of
+that clock and the global virtual time, so a mission that just dumped twenty
+subtasks gets every twentieth slot instead of the next twenty, and missions
+submitted afterwards interleave with it. Tasks on a mission's critical path
+(deeper tasks and synthesis tasks, which unblock a whole parent) get their
+score lowered by a priority boost so they jump ahead of fresh depth-0 work.
+"""
+
+import os
+import time
+
+from master import stats
+
+MODE = os.getenv("SCHEDULER_MODE", "fifo")
+
+FIFO_KEY = "tasks"
+READY_KEY = "tasks:ready"
+VTIME_KEY = "sched:vtime"
+MISSION_TAG_KEY = "sched:tag:{}"
+
+DEPTH_BOOST = float(os.getenv("SCHEDULER_DEPTH_BOOST", "1"))
+SYNTHESIS_BOOST = float(os.getenv("SCHEDULER_SYNTHESIS_BOOST", "10"))
+POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", "0.2"))
+MISSION_TAG_TTL = 7 * 24 * 3600
+
+# KEYS: ready, mission tag, vtime  ARGV: job, boost, tag ttl
+PUSH_FAIR_SCRIPT = """
+local vt = tonumber(redis.call('GET', KEYS[3]) or '0')
+local last = tonumber(redis.call('GET', KEYS[2]) or '0')
+local tag = math.max(vt, last) + 1
+redis.call('SET', KEYS[2], tag, 'EX', ARGV[3])
+redis.call('ZADD', KEYS[1], tag - tonumber(ARGV[2]), ARGV[1])
+return tag
+"""
+
+# KEYS: ready, vtime[, processing]
+POP_FAIR_SCRIPT = """
+local item = redis.call('ZPOPMIN', KEYS[1])
+if #item == 0 then
+    return false
+end
+local vt = tonumber(redis.call('GET', KEYS[2]) or '0')
+if tonumber(item[2]) > vt then
+    redis.call('SET', KEYS[2], item[2])
+end
+if KEYS[3] then
+    redis.call('LPUSH', KEYS[3], item[1])
+end
+return item[1]
+"""
+
+# KEYS: vtime  ARGV: score of a task popped with BZPOPMIN
+ADVANCE_SCRIPT = """
+local vt = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tonumber(ARGV[1]) > vt then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: ready, vtime  ARGV: job. Requeued work has already waited its turn,
+# so it goes back at the current virtual time rather than behind new arrivals.
+REQUEUE_FAIR_SCRIPT = """
+local vt = tonumber(redis.call('GET', KEYS[2]) or '0')
+redis.call('ZADD', KEYS[1], vt, ARGV[1])
+return 1
+"""
+
+# Counts a reaped job as waiting again at its depth (see master/stats.py)
+COUNT_REQUEUED = """local depth = cjson.decode(job)['depth']
+    if type(depth) ~= 'number' then depth = 0 end
+    redis.call('HINCRBY', KEYS[#KEYS], depth, 1)"""
+
+# Move every job of a dead worker back to the ready set. Checking the heartbeat
+# and draining the list happen in one script so a worker can't come back to
+# life halfway through and ack a job that has already been requeued.
+# KEYS: processing, heartbeat, fifo list, waiting-per-depth counters
+REAP_FIFO_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local moved = 0
+local job = redis.call('LMOVE', KEYS[1], KEYS[3], 'RIGHT', 'RIGHT')
+while job do
+    REQUEUED_COUNT
+    moved = moved + 1
+    job = redis.call('LMOVE', KEYS[1], KEYS[3], 'RIGHT', 'RIGHT')
+end
+return moved
+""".replace("REQUEUED_COUNT", COUNT_REQUEUED)
+
+# KEYS: processing, heartbeat, ready, vtime, waiting-per-depth counters
+REAP_FAIR_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local vt = tonumber(redis.call('GET', KEYS[4]) or '0')
+local moved = 0
+local job = redis.call('RPOP', KEYS[1])
+while job do
+    redis.call('ZADD', KEYS[3], vt, job)
+    REQUEUED_COUNT
+    moved = moved + 1
+    job = redis.call('RPOP', KEYS[1])
+end
+return moved
+""".replace("REQUEUED_COUNT", COUNT_REQUEUED)
+
+
+def fair():
+    """Whether the fair-queueing sorted set is in use"""
+    return MODE == "fair"
+
+
+def priority(depth, kind=None):
+    """Boost for tasks on the critical path of their mission"""
+    boost = DEPTH_BOOST * (depth or 0)
+    if kind == "synthesis":
+        boost += SYNTHESIS_BOOST
+    return boost
+
+
+def push(pipe, job, root_id, boost=0):
+    """Add a serialized job to the ready structure (usually on a pipeline)"""
+    if not fair():
+        pipe.lpush(FIFO_KEY, job)
+        return
+    script = pipe.register_script(PUSH_FAIR_SCRIPT)
+    script(
+        keys=[READY_KEY, MISSION_TAG_KEY.format(root_id), VTIME_KEY],
+        args=[job, boost, MISSION_TAG_TTL],
+        client=pipe,
+    )
+
+
+def requeue(pipe, job):
+    """Put a job that could not be completed back on the ready structure"""
+    if not fair():
+        pipe.lpush(FIFO_KEY, job)
+        return
+    script = pipe.register_script(REQUEUE_FAIR_SCRIPT)
+    script(keys=[READY_KEY, VTIME_KEY], args=[job], client=pipe)
+
+
+def pop(redis_client, timeout, processing_key=None):
+    """
+    Take the next job, blocking up to ``timeout`` seconds; None if idle.
+
+    With ``processing_key`` the job is moved into that list atomically.
+    """
+    if not fair():
+        if processing_key:
+            return redis_client.blmove(
+                FIFO_KEY, processing_key, timeout, "RIGHT", "LEFT"
+            )
+        result = redis_client.brpop(FIFO_KEY, timeout=timeout)
+        return result[1] if result else None
+
+    if not processing_key:
+        result = redis_client.bzpopmin(READY_KEY, timeout=timeout)
+        if result is None:
+            return None
+        _, job, score = result
+        redis_client.register_script(ADVANCE_SCRIPT)(keys=[VTIME_KEY], args=[score])
+        return job
+
+    # There is no blocking pop-and-push from a sorted set to a list, so the
+    # atomic move is a script polled until something is ready
+    pop_fair = redis_client.register_script(POP_FAIR_SCRIPT)
+    deadline = time.monotonic() + timeout
+    while True:
+        job = pop_fair(keys=[READY_KEY, VTIME_KEY, processing_key])
+        if job is not None or time.monotonic() >= deadline:
+            return job
+        time.sleep(POLL_INTERVAL)
+
+
+def reap(redis_client, processing_key, heartbeat_key):
+    """Requeue a worker's processing list if its heartbeat has expired"""
+    if fair():
+        script = redis_client.register_script(REAP_FAIR_SCRIPT)
+        keys = [processing_key, heartbeat_key, READY_KEY, VTIME_KEY, stats.WAITING_KEY]
+    else:
+        script = redis_client.register_script(REAP_FIFO_SCRIPT)
+        keys = [processing_key, heartbeat_key, FIFO_KEY, stats.WAITING_KEY]
+    return int(script(keys=keys))
+
+
+def size(redis_client):
+    """Number of tasks waiting to be picked up"""
+    if fair():
+        return redis_client.zcard(READY_KEY)
+    return redis_client.llen(FIFO_KEY)
+
+
+def peek(redis_client, count):
+    """The next ``count`` serialized jobs, in the order they will run"""
+    if fair():
+        return redis_client.zrange(READY_KEY, 0, count - 1)
+    return list(reversed(redis_client.lrange(FIFO_KEY, -count, -1)))
+
+
+def snapshot(redis_client, count):
+    """``(size(), peek(count))`` in one round-trip"""
+    pipe = redis_client.pipeline(transaction=False)
+    if fair():
+        pipe.zcard(READY_KEY)
+        pipe.zrange(READY_KEY, 0, count - 1)
+        waiting, jobs = pipe.execute()
+        return waiting, jobs
+    pipe.llen(FIFO_KEY)
+    pipe.lrange(FIFO_KEY, -count, -1)
+    waiting, jobs = pipe.execute()
+    return waiting, list(reversed(jobs))
+
+
+def clear(redis_client):
+    """Drop every waiting task"""
+    redis_client.delete(FIFO_KEY, READY_KEY)
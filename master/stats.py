@@ -0,0 +1,134 @@
+"""
+Live system metrics maintained in Redis, so dashboards never count rows.
+
+Counters are updated as things happen rather than computed on demand:
+
+- ``spawn_task()`` and requeues add to the number of waiting tasks per depth,
+  and workers subtract when they start one (the reaper's Lua scripts add
+  back what they return to the queue);
+- workers bump per-minute buckets of started, completed and failed tasks,
+  plus a running total per outcome seeded once from Postgres;
+- workers push each execution time onto a list trimmed to the last
+  DURATION_SAMPLES entries, from which p50/p95 are read.
+
+Minute buckets expire after two hours. ``snapshot()`` reads everything in one
+pipelined round-trip.
+"""
+
+import math
+import os
+import time
+
+from master.connections import as_text
+
+TOTALS_KEY = "stats:results"
+SEEDED_KEY = "stats:results:seeded"
+MINUTE_KEY = "stats:results:{}:{}"  # event (started, done, failed), minute since the epoch
+WAITING_KEY = "stats:waiting"  # hash: depth -> tasks waiting in the queue
+DURATIONS_KEY = "stats:durations"
+RUNNING_KEY = "progress:active"  # see master/progress.py
+
+MINUTE_TTL = 2 * 3600
+DURATION_SAMPLES = int(os.getenv("STATS_DURATION_SAMPLES", "1000"))
+EVENTS = ("started", "done", "failed")
+
+
+def _minute(now=None):
+    return int((now or time.time()) // 60)
+
+
+def _bump(pipe, event, now=None):
+    key = MINUTE_KEY.format(event, _minute(now))
+    pipe.incr(key)
+    pipe.expire(key, MINUTE_TTL)
+
+
+def record_queued(pipe, depth, count=1):
+    """Count tasks entering the queue at ``depth`` on a pipeline"""
+    pipe.hincrby(WAITING_KEY, depth or 0, count)
+
+
+def record_start(pipe, depth, now=None):
+    """Count a task leaving the queue to run"""
+    pipe.hincrby(WAITING_KEY, depth or 0, -1)
+    _bump(pipe, "started", now)
+
+
+def record(pipe, status, duration=None, now=None):
+    """Count one finished task (``done`` or ``failed``) and its run time"""
+    pipe.hincrby(TOTALS_KEY, status, 1)
+    _bump(pipe, status, now)
+    if duration is not None:
+        pipe.lpush(DURATIONS_KEY, round(duration, 3))
+        pipe.ltrim(DURATIONS_KEY, 0, DURATION_SAMPLES - 1)
+
+
+def seed(redis_client, count_by_status):
+    """
+    Initialise the totals from ``count_by_status()`` unless already done.
+
+    Completions recorded between the count and the seed are counted twice;
+    this happens once per deployment and only skews the total slightly.
+    """
+    if not redis_client.set(SEEDED_KEY, "1", nx=True):
+        return
+    pipe = redis_client.pipeline()
+    for status, count in count_by_status().items():
+        pipe.hincrby(TOTALS_KEY, status, count)
+    pipe.execute()
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of ``samples``, or None when there are none"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def snapshot(redis_client, minutes=60, now=None):
+    """
+    Everything a dashboard shows, in one round-trip: totals per outcome,
+    per-minute series (oldest first) and their sums over the last
+    ``minutes`` minutes, waiting tasks per depth, running tasks and p50/p95
+    execution time in seconds.
+    """
+    current = _minute(now)
+    window = range(current - minutes + 1, current + 1)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(TOTALS_KEY)
+    pipe.hgetall(WAITING_KEY)
+    pipe.zcard(RUNNING_KEY)
+    pipe.lrange(DURATIONS_KEY, 0, -1)
+    for event in EVENTS:
+        pipe.mget([MINUTE_KEY.format(event, minute) for minute in window])
+    totals, waiting, running, durations, *series = pipe.execute()
+
+    totals = {as_text(k): int(v) for k, v in totals.items()}
+    series = {
+        event: [int(v) if v else 0 for v in values]
+        for event, values in zip(EVENTS, series)
+    }
+    durations = [float(d) for d in durations]
+    return {
+        "done": totals.get("done", 0),
+        "failed": totals.get("failed", 0),
+        **{f"{event}_recent": sum(series[event]) for event in EVENTS},
+        "per_minute": series,
+        "waiting_by_depth": {
+            int(as_text(depth)): max(int(count), 0)
+            for depth, count in sorted(waiting.items(), key=lambda kv: int(as_text(kv[0])))
+        },
+        "running": running,
+        "p50_seconds": percentile(durations, 0.50),
+        "p95_seconds": percentile(durations, 0.95),
+    }
+
+
+def clear_waiting(redis_client):
+    """Forget waiting-task counts, for when the queue itself is cleared"""
+    redis_client.delete(WAITING_KEY)
+
+
+def clear(redis_client):
+    redis_client.delete(TOTALS_KEY, SEEDED_KEY, WAITING_KEY, DURATIONS_KEY)
@@ -0,0 +1,49 @@
+"""
+Per-parent index of outstanding child tasks.
+
+spawn_task() increments a parent's counter in the same MULTI/EXEC as the
+LPUSH of the child, and the worker releases it once the child's result has
+been stored. Checking whether a parent still has work queued or in flight is
+then a single GET instead of a scan over the whole task queue.
+"""
+
+PENDING_KEY = "pending:{}"
+
+# Decrement and drop the counter at zero so finished parents don't leave keys
+# behind, and a stray double release can never drive it negative.
+RELEASE_SCRIPT = """
+local n = redis.call('DECR', KEYS[1])
+if n <= 0 then
+    redis.call('DEL', KEYS[1])
+    return 0
+end
+return n
+"""
+
+
+def pending_key(parent_id):
+    """Redis key holding the outstanding-children counter of a parent"""
+    return PENDING_KEY.format(parent_id)
+
+
+def track_child(pipe, parent_id):
+    """Queue an increment of the parent's counter on a (transactional) pipeline"""
+    pipe.incr(pending_key(parent_id))
+
+
+def release_child(redis_client, parent_id):
+    """Mark one child of the parent as finished, returning how many remain"""
+    release = redis_client.register_script(RELEASE_SCRIPT)
+    return int(release(keys=[pending_key(parent_id)]))
+
+
+def pending_children(redis_client, parent_id):
+    """Number of children of the parent that are still queued or running"""
+    value = redis_client.get(pending_key(parent_id))
+    return int(value) if value else 0
+
+
+def clear(redis_client):
+    """Drop every counter, e.g. after the queue itself has been cleared"""
+    for key in redis_client.scan_iter(PENDING_KEY.format("*")):
+        redis_client.delete(key)
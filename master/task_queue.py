@@ -0,0 +1,130 @@
+"""
+Task queue operations shared by the master and the workers.
+
+In the default ``fifo`` mode a worker takes a job with BRPOP and the job is
+gone from Redis the moment it is popped, so a worker that dies mid-task loses
+it. In ``reliable`` mode (QUEUE_MODE=reliable) the job is atomically moved into
+a per-worker processing list and only removed (acked) once its result is
+stored. Every worker keeps a heartbeat key alive while it runs, and the
+master's reaper moves jobs out of processing lists whose heartbeat has expired
+and back onto the queue, giving at-least-once delivery.
+
+Which task runs next is up to ``master.scheduler``.
+"""
+
+import json
+import os
+import socket
+import threading
+import uuid
+
+from master import scheduler, stats
+from master.connections import as_text
+
+PROCESSING_KEY = "tasks:processing:{}"
+HEARTBEAT_KEY = "workers:heartbeat:{}"
+
+QUEUE_MODE = os.getenv("QUEUE_MODE", "fifo")
+LEASE_TTL = int(os.getenv("TASK_LEASE_TTL", "60"))
+
+_worker_id = None
+_worker_pid = None
+
+
+def reliable():
+    """Whether jobs are leased through processing lists"""
+    return QUEUE_MODE == "reliable"
+
+
+def worker_id():
+    """Identifier of this worker process, stable for the life of the process"""
+    global _worker_id, _worker_pid
+    if _worker_pid != os.getpid():
+        _worker_id = os.getenv("WORKER_ID") or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        _worker_pid = os.getpid()
+    return _worker_id
+
+
+def processing_key(wid=None):
+    """Processing list holding the jobs leased by a worker"""
+    return PROCESSING_KEY.format(wid or worker_id())
+
+
+def heartbeat_key(wid=None):
+    """Key that stays alive for as long as the worker does"""
+    return HEARTBEAT_KEY.format(wid or worker_id())
+
+
+def push(pipe, job, root_id, boost=0):
+    """Queue a serialized job (usually on the spawning pipeline)"""
+    scheduler.push(pipe, job, root_id, boost)
+
+
+def pop(redis_client, timeout):
+    """Take the next job, blocking up to ``timeout`` seconds; None if idle"""
+    return scheduler.pop(
+        redis_client, timeout, processing_key() if reliable() else None
+    )
+
+
+def ack(redis_client, job):
+    """Drop a finished job from this worker's processing list"""
+    if reliable():
+        redis_client.lrem(processing_key(), 1, job)
+
+
+def requeue(redis_client, job):
+    """Put a job that could not be completed back at the end of the queue"""
+    with redis_client.pipeline() as pipe:
+        if reliable():
+            pipe.lrem(processing_key(), 1, job)
+        scheduler.requeue(pipe, job)
+        stats.record_queued(pipe, json.loads(job).get("depth"))
+        pipe.execute()
+
+
+def reap(redis_client):
+    """Requeue jobs leased by workers whose heartbeat has expired"""
+    moved = 0
+    prefix = PROCESSING_KEY.format("")
+    for key in redis_client.scan_iter(PROCESSING_KEY.format("*")):
+        key = as_text(key)
+        wid = key[len(prefix):]
+        moved += scheduler.reap(redis_client, key, heartbeat_key(wid))
+    return moved
+
+
+class Heartbeat:
+    """Background thread keeping this worker's lease alive"""
+
+    def __init__(self, redis_client, ttl=LEASE_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._stop = threading.Event()
+        self._thread = None
+
+    def beat(self):
+        self.redis_client.set(heartbeat_key(), "1", ex=self.ttl)
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"Heartbeat error: {e}")
+
+    def start(self):
+        # Beat once synchronously so the lease exists before the first BLMOVE
+        self.beat()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        # Let the reaper hand back anything still leased right away
+        self.redis_client.delete(heartbeat_key())
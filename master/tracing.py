@@ -0,0 +1,163 @@
+"""
+Trace spans linking every task of a mission.
+
+IDs are derived from the task hierarchy rather than generated, so any process
+can link a span to its parent without a lookup: a mission's trace ID is its
+root task ID and each task's span ID is the first 16 hex digits of its task
+ID. ``spawn_task()`` puts that context in the queued payload (``trace``), the
+worker records the task's stages as children of the task span and the task
+span itself, parented to the span of the task (or mission) that spawned it.
+
+Spans are plain dicts exported as one JSON object per line, either appended
+to TRACE_FILE (TRACE_EXPORTER=jsonl) or POSTed in batches to TRACE_ENDPOINT
+(TRACE_EXPORTER=http, for an OTLP collector stand-in). The default, ``none``,
+records nothing. ``scripts/trace_report.py`` rebuilds a mission from the
+JSONL file and reports its critical path.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+# Relative to the repository root, not the working directory: the master and
+# the workers run from their own directories but must share one file
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACE_FILE = os.path.join(ROOT, os.getenv("TRACE_FILE", "traces.jsonl"))
+ENDPOINT = os.getenv("TRACE_ENDPOINT", "http://localhost:4318/v1/traces")
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_fd = None
+_fd_pid = None
+_outbox = None
+_outbox_pid = None
+
+
+def enabled():
+    return EXPORTER in ("jsonl", "http")
+
+
+def trace_id(root_id):
+    return uuid.UUID(str(root_id)).hex
+
+
+def task_span_id(task_id):
+    return uuid.UUID(str(task_id)).hex[:16]
+
+
+def new_span_id():
+    return uuid.uuid4().hex[:16]
+
+
+def context(root_id, task_id, parent_id=None):
+    """Trace context of a task, carried in its queued payload"""
+    return {
+        "trace_id": trace_id(root_id),
+        "span_id": task_span_id(task_id),
+        "parent_span_id": task_span_id(parent_id) if parent_id else None,
+    }
+
+
+def _write_jsonl(line):
+    global _fd, _fd_pid
+    with _lock:
+        if _fd_pid != os.getpid():
+            # O_APPEND keeps whole-line writes from several processes intact
+            _fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            _fd_pid = os.getpid()
+        os.write(_fd, line.encode() + b"\n")
+
+
+def _post(spans):
+    # Only the http exporter needs it; spare every other importer the cost
+    import urllib.request
+
+    request = urllib.request.Request(
+        ENDPOINT,
+        data=json.dumps({"spans": spans}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    urllib.request.urlopen(request, timeout=5).close()
+
+
+def _run_http_exporter(outbox):
+    while True:
+        spans = [outbox.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(spans) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                spans.append(outbox.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _post(spans)
+        except Exception as e:
+            print(f"Dropped {len(spans)} spans: {e}")
+
+
+def export(span):
+    """Hand a finished span to the configured exporter; never raises"""
+    global _outbox, _outbox_pid
+    try:
+        if EXPORTER == "jsonl":
+            _write_jsonl(json.dumps(span, default=str))
+        elif EXPORTER == "http":
+            with _lock:
+                if _outbox_pid != os.getpid():
+                    _outbox = queue.Queue(maxsize=10000)
+                    _outbox_pid = os.getpid()
+                    threading.Thread(
+                        target=_run_http_exporter, args=(_outbox,), daemon=True
+                    ).start()
+            _outbox.put_nowait(span)
+    except Exception as e:
+        print(f"Error exporting span {span.get('name')}: {e}")
+
+
+def record(name, ctx, start, end, span_id=None, parent_span_id=None, **attributes):
+    """
+    Export a span measured by the caller.
+
+    By default the span is a child of ``ctx``'s span; pass ``span_id`` and
+    ``parent_span_id`` to record the task span itself.
+    """
+    if not enabled() or not ctx:
+        return
+    export({
+        "trace_id": ctx["trace_id"],
+        "span_id": span_id or new_span_id(),
+        "parent_span_id": parent_span_id if span_id else ctx["span_id"],
+        "name": name,
+        "start": start,
+        "end": end,
+        "duration_ms": round((end - start) * 1000, 3),
+        "attributes": attributes,
+        "pid": os.getpid(),
+    })
+
+
+@contextmanager
+def span(name, ctx, **attributes):
+    """Time the block as a child span of ``ctx``; the attributes dict can be added to"""
+    start = time.time()
+    try:
+        yield attributes
+    finally:
+        record(name, ctx, start, time.time(), **attributes)
+
+
+def record_task(ctx, start, end, **attributes):
+    """Export the span covering a whole task, from enqueue to completion"""
+    if ctx:
+        record("task", ctx, start, end, span_id=ctx["span_id"],
+               parent_span_id=ctx.get("parent_span_id"), **attributes)
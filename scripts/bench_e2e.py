@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark: master plus N workers against a fake LLM.
+
+Starts the stub from ``fake_llm.py`` in-process, the master monitor and N
+worker processes pointed at it, then submits a mission mix (synthetic
+prompts, lines of a file, or the most recent missions replayed from
+Postgres) and waits for every mission to finish. Reports tasks per second,
+mission latency p50/p99, Redis command counts (``INFO commandstats``) and
+Postgres activity (``pg_stat_database``) over the run.
+
+Redis and Postgres come from REDIS_URL and DATABASE_URL; locally,
+``docker-compose up -d redis postgres`` provides both. Use a database you
+can spare: ``--reset`` empties it and the Redis DB before the run.
+
+Usage:
+    python scripts/bench_e2e.py [--workers 4] [--missions 20] [--rate 0]
+                                [--mix missions.txt | --replay 50]
+                                [--latency 0.2] [--error-rate 0.01] ...
+                                [--json out.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_llm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+PG_COUNTERS = (
+    "xact_commit", "xact_rollback", "tup_returned", "tup_fetched",
+    "tup_inserted", "tup_updated", "tup_deleted", "blks_read", "blks_hit",
+)
+
+# Aggregates per mission; a mission is finished once nothing is queued and no
+# parent still waits for its synthesis to be spawned
+MISSIONS_SQL = """
+    SELECT root_id::text,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE status IN ('done', 'failed')),
+           COUNT(*) FILTER (WHERE status = 'failed'),
+           bool_and(status IN ('done', 'failed'))
+               AND NOT bool_or(needs_synthesis AND NOT synthesis_spawned),
+           EXTRACT(EPOCH FROM MAX(completed_at))::float8
+    FROM results
+    WHERE root_id = ANY(%s::uuid[])
+    GROUP BY root_id
+"""
+
+HEADLINE = ("tasks_per_second", "missions_per_minute", "mission_p50_seconds",
+            "mission_p99_seconds", "redis_calls_per_task", "pg_transactions_per_task")
+
+
+def synthetic_mix(count, seed=None):
+    rng = random.Random(seed)
+    topics = ("battery chemistry", "urban transit", "protein folding", "tax policy",
+              "coral reefs", "compiler design", "supply chains", "exoplanets")
+    shapes = ("Research and summarize {}", "Compare three approaches to {}",
+              "Write a briefing on recent developments in {}", "Explain {} to a newcomer")
+    return [
+        f"{rng.choice(shapes).format(rng.choice(topics))} (benchmark {i})"
+        for i in range(count)
+    ]
+
+
+def file_mix(path):
+    missions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("{"):
+                line = json.loads(line)["prompt"]
+            if line:
+                missions.append(line)
+    return missions
+
+
+def replay_mix(count):
+    from master.connections import pg_connection
+
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT prompt FROM results WHERE parent_id IS NULL
+            ORDER BY created_at DESC LIMIT %s
+        """, (count,))
+        return [prompt for (prompt,) in cur.fetchall()][::-1]
+
+
+def redis_commandstats(redis_client):
+    return {
+        name[len("cmdstat_"):]: {"calls": s["calls"], "usec": s["usec"]}
+        for name, s in redis_client.info("commandstats").items()
+    }
+
+
+def pg_activity():
+    from master.connections import pg_connection
+
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"SELECT {', '.join(PG_COUNTERS)} FROM pg_stat_database WHERE datname = current_database()"
+        )
+        return dict(zip(PG_COUNTERS, cur.fetchone()))
+
+
+def diff_commandstats(before, after):
+    delta = {}
+    for command, s in after.items():
+        calls = s["calls"] - before.get(command, {}).get("calls", 0)
+        if calls:
+            usec = s["usec"] - before.get(command, {}).get("usec", 0)
+            delta[command] = {"calls": calls, "usec": usec}
+    return dict(sorted(delta.items(), key=lambda kv: -kv[1]["calls"]))
+
+
+def reset(redis_client):
+    from master.connections import pg_connection
+
+    redis_client.flushdb()
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE results, outputs")
+
+
+def start_processes(args, env, log_dir):
+    """The master monitor and the workers, logging to ``log_dir``"""
+    # ``main.py <args>`` would submit its arguments as a mission
+    monitor = "import main; main.monitor_loop()"
+    commands = [("master", [sys.executable, "-c", monitor], os.path.join(ROOT, "master"))]
+    commands += [
+        (f"worker-{i}", [sys.executable, "worker.py"], os.path.join(ROOT, "worker"))
+        for i in range(args.workers)
+    ]
+    processes = []
+    for name, command, cwd in commands:
+        log = open(os.path.join(log_dir, f"{name}.log"), "w")
+        processes.append((name, subprocess.Popen(
+            command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT
+        ), log))
+    return processes
+
+
+def stop_processes(processes):
+    for _, process, _ in processes:
+        process.terminate()
+    for _, process, log in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+def wait_for_missions(submitted, timeout):
+    """Poll until every mission finished or ``timeout``; returns rows by mission ID"""
+    from master.connections import pg_connection
+
+    deadline = time.time() + timeout
+    while True:
+        with pg_connection() as conn, conn.cursor() as cur:
+            cur.execute(MISSIONS_SQL, (list(submitted),))
+            rows = {row[0]: row[1:] for row in cur.fetchall()}
+        finished = sum(1 for row in rows.values() if row[3])
+        print(f"  {finished}/{len(submitted)} missions finished", end="\r", flush=True)
+        if finished == len(submitted) or time.time() >= deadline:
+            print()
+            return rows
+        time.sleep(1)
+
+
+def summarize(submitted, rows, started, redis_delta, pg_delta, llm_stats):
+    latencies = sorted(
+        rows[m][4] - submitted_at
+        for m, submitted_at in submitted.items()
+        if m in rows and rows[m][3] and rows[m][4] is not None
+    )
+    finished_at = max((rows[m][4] for m in rows if rows[m][4] is not None), default=time.time())
+    elapsed = max(finished_at - started, 1e-9)
+    tasks = sum(row[1] for row in rows.values())
+    redis_calls = sum(s["calls"] for s in redis_delta.values())
+
+    def pct(q):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 3)
+
+    return {
+        "missions": len(submitted),
+        "missions_finished": len(latencies),
+        "tasks": tasks,
+        "tasks_failed": sum(row[2] for row in rows.values()),
+        "elapsed_seconds": round(elapsed, 3),
+        "tasks_per_second": round(tasks / elapsed, 3),
+        "missions_per_minute": round(len(latencies) * 60 / elapsed, 3),
+        "mission_p50_seconds": pct(0.50),
+        "mission_p99_seconds": pct(0.99),
+        "mission_max_seconds": round(latencies[-1], 3) if latencies else None,
+        "redis_calls": redis_calls,
+        "redis_calls_per_task": round(redis_calls / tasks, 2) if tasks else None,
+        "pg_transactions_per_task": (
+            round(pg_delta["xact_commit"] / tasks, 2) if tasks else None
+        ),
+        "redis_commands": redis_delta,
+        "postgres": pg_delta,
+        "llm": llm_stats,
+    }
+
+
+def print_summary(summary, compare=None):
+    print(f"\n{summary['missions_finished']}/{summary['missions']} missions, "
+          f"{summary['tasks']} tasks ({summary['tasks_failed']} failed) "
+          f"in {summary['elapsed_seconds']:.1f}s")
+    for key in HEADLINE:
+        value = summary[key]
+        line = f"  {key:<26} {value}"
+        if compare and compare.get(key) and value is not None:
+            line += f"  ({(value - compare[key]) / compare[key]:+.1%} vs baseline)"
+        print(line)
+    print("\n  Redis commands (calls, usec/call):")
+    for command, s in list(summary["redis_commands"].items())[:12]:
+        print(f"    {command:<20} {s['calls']:>8} {s['usec'] / s['calls']:>8.1f}")
+    print("\n  Postgres:")
+    for key, value in summary["postgres"].items():
+        print(f"    {key:<20} {value:>10}")
+    llm = summary["llm"]
+    print(f"\n  LLM stub: {llm['requests']} requests, {llm['errors']} errors, "
+          f"{llm['rate_limited']} rate limited")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-mode", default=os.getenv("WORKER_MODE", "sync"),
+                        choices=("sync", "async", "pool"))
+    parser.add_argument("--monitor-mode", default=os.getenv("MONITOR_MODE", "events"),
+                        choices=("poll", "events"))
+    parser.add_argument("--missions", type=int, default=20, help="synthetic missions to submit")
+    parser.add_argument("--mix", help="file of mission prompts, one per line (or JSONL with prompt)")
+    parser.add_argument("--replay", type=int, help="replay the N most recent missions from Postgres")
+    parser.add_argument("--rate", type=float, default=0, help="missions per second, 0 for all at once")
+    parser.add_argument("--warmup", type=float, default=15, help="seconds to let workers start")
+    parser.add_argument("--timeout", type=float, default=900)
+    parser.add_argument("--llm-port", type=int, default=8900)
+    parser.add_argument("--reset", action="store_true",
+                        help="empty the Redis DB and the results tables first")
+    parser.add_argument("--log-dir", help="service logs (default: a temporary directory)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare with")
+    fake_llm.add_arguments(parser)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ.update({
+        "OPENAI_API_BASE": base_url,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+        "MONITOR_MODE": args.monitor_mode,
+    })
+    env = {
+        **os.environ,
+        "WORKER_MODE": args.worker_mode,
+        # Every process would otherwise try to bind the same metrics port
+        "METRICS_PORT": os.getenv("METRICS_PORT", "0"),
+        "PYTHONUNBUFFERED": "1",
+    }
+    # Imported after the environment points at the stub
+    from master.connections import get_redis
+    from master.main import init_database, run_master
+
+    behaviour = fake_llm.behaviour_from(args)
+    server = fake_llm.serve(behaviour, args.llm_port)
+    redis_client = get_redis()
+
+    init_database()
+    # Read before --reset empties the table a replay comes from
+    if args.mix:
+        missions = file_mix(args.mix)
+    elif args.replay:
+        missions = replay_mix(args.replay)
+    else:
+        missions = synthetic_mix(args.missions, args.seed)
+
+    if args.reset:
+        print("Resetting Redis and Postgres")
+        reset(redis_client)
+
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="bench_e2e-")
+    os.makedirs(log_dir, exist_ok=True)
+    processes = start_processes(args, env, log_dir)
+    print(f"Started master and {args.workers} {args.worker_mode} workers, logs in {log_dir}")
+    try:
+        time.sleep(args.warmup)
+
+        redis_before = redis_commandstats(redis_client)
+        pg_before = pg_activity()
+        started = time.time()
+        submitted = {}
+        for i, prompt in enumerate(missions):
+            if args.rate:
+                time.sleep(max(0, started + i / args.rate - time.time()))
+            submitted_at = time.time()
+            submitted[run_master(prompt, use_cache=False)] = submitted_at
+        print(f"Submitted {len(submitted)} missions in {time.time() - started:.1f}s")
+
+        rows = wait_for_missions(submitted, args.timeout)
+        time.sleep(1)  # Postgres publishes its statistics with a short delay
+        redis_delta = diff_commandstats(redis_before, redis_commandstats(redis_client))
+        pg_after = pg_activity()
+        pg_delta = {key: pg_after[key] - pg_before[key] for key in PG_COUNTERS}
+    finally:
+        stop_processes(processes)
+        server.shutdown()
+
+    summary = summarize(submitted, rows, started, redis_delta, pg_delta, behaviour.stats())
+    compare = None
+    if args.compare:
+        with open(args.compare) as f:
+            compare = json.load(f)["summary"]
+    print_summary(summary, compare)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": sys.version,
+                "timestamp": time.time(),
+                "config": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+                "summary": summary,
+            }, f, indent=2, default=str)
+        print(f"\nResults written to {args.json}")
+
+    sys.exit(0 if summary["missions_finished"] == summary["missions"] else 1)
+
+
+if __name__ == "__main__":
+    main()
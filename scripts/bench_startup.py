@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Startup import benchmark for each Infinite Crew entry point.
+
+Runs every entry point's imports in a fresh interpreter under
+``python -X importtime`` and reports total import time, wall time, the
+slowest direct imports and which heavy dependencies got loaded, so an
+accidental eager import of CrewAI in the master or UI shows up immediately.
+
+Usage:
+    python scripts/bench_startup.py [--runs 3] [--top 10] [--json out.json]
+                                    [--max-ms master=300 ...]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (working directory, statement) mirroring how each service is started
+ENTRY_POINTS = {
+    "master": (os.path.join(ROOT, "master"), "import main"),
+    "worker": (os.path.join(ROOT, "worker"), "import worker"),
+    "ui": (
+        os.path.join(ROOT, "ui"),
+        f"import sys; sys.path.append({ROOT!r}); "
+        "import streamlit, pandas, master.main, master.connections"
+    ),
+}
+
+HEAVY_PACKAGES = ("crewai", "langchain", "openai", "psycopg2", "redis", "pandas", "streamlit")
+
+
+def parse_importtime(stderr):
+    """
+    Map each imported module to its (self_us, cumulative_us).
+
+    Names keep the indentation ``-X importtime`` uses for nesting, so modules
+    imported directly by the entry point are the ones without leading spaces.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules[name[1:].rstrip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(name, runs):
+    """Import an entry point ``runs`` times and summarize the fastest run"""
+    cwd, statement = ENTRY_POINTS[name]
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", statement],
+            cwd=cwd, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - started) * 1000
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+            return {"entry_point": name, "error": error}
+        modules = parse_importtime(proc.stderr)
+        samples.append((wall_ms, modules))
+
+    wall_ms, modules = min(samples, key=lambda sample: sample[0])
+    # The entry module and what it imports directly (one nesting level down)
+    top_level = {}
+    for module, (_, cumulative) in modules.items():
+        if len(module) - len(module.lstrip()) <= 2:
+            top_level[module.strip()] = cumulative
+    loaded = {module.strip().split(".")[0] for module in modules}
+    return {
+        "entry_point": name,
+        "wall_ms": round(wall_ms, 1),
+        "wall_ms_median": round(statistics.median(s[0] for s in samples), 1),
+        "import_ms": round(sum(s for s, _ in modules.values()) / 1000, 1),
+        "modules": len(modules),
+        "heavy_loaded": sorted(p for p in HEAVY_PACKAGES if p in loaded),
+        "top": sorted(
+            ({"module": m, "cumulative_ms": round(us / 1000, 1)} for m, us in top_level.items()),
+            key=lambda entry: entry["cumulative_ms"],
+            reverse=True,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-ms", nargs="*", default=[],
+                        help="fail if an entry point's import time exceeds NAME=MS")
+    args = parser.parse_args()
+
+    limits = {k: float(v) for k, v in (item.split("=", 1) for item in args.max_ms)}
+    report = [measure(name, args.runs) for name in args.entry_points]
+
+    failed = False
+    for entry in report:
+        print(f"\n== {entry['entry_point']} ==")
+        if "error" in entry:
+            print(f"  import failed: {entry['error']}")
+            failed = True
+            continue
+        print(f"  wall {entry['wall_ms']} ms (median {entry['wall_ms_median']} ms), "
+              f"imports {entry['import_ms']} ms across {entry['modules']} modules")
+        print(f"  heavy packages loaded: {', '.join(entry['heavy_loaded']) or 'none'}")
+        for item in entry["top"][:args.top]:
+            print(f"    {item['cumulative_ms']:>9.1f} ms  {item['module']}")
+        limit = limits.get(entry["entry_point"])
+        if limit is not None and entry["import_ms"] > limit:
+            print(f"  REGRESSION: {entry['import_ms']} ms > {limit} ms budget")
+            failed = True
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version, "timestamp": time.time(), "results": report},
+                      f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible chat completions stub for benchmarks.
+
+Answers ``POST .../chat/completions`` after a configurable latency plus
+generation time (completion tokens at ``--tokens-per-second``), and injects
+failures: a fraction of requests get a 500, another fraction a 429 with
+``Retry-After``. Decomposition requests (the master's "Return ONLY a JSON
+array" prompt) get a JSON array of subtasks, some with dependencies; CrewAI
+agent runs get a ``Final Answer:`` so the agent stops after one call;
+everything else gets filler text, a fraction of which asks for refinement.
+``GET /stats`` returns request counts.
+
+Usage:
+    python scripts/fake_llm.py [--port 8900] [--latency 0.2] [--tokens-per-second 200]
+                               [--error-rate 0.01] [--rate-limit-rate 0.01]
+
+then point the services at it with OPENAI_API_BASE=http://localhost:8900/v1.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+FILLER = "The analysis covers the relevant factors in turn and states its conclusions. "
+REFINE_HINT = "This section needs further detail. "
+
+
+class Behaviour:
+    """Knobs of the stub plus the counters it reports"""
+
+    def __init__(self, latency=0.2, jitter=0.1, tokens_per_second=200, completion_tokens=300,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1, subtasks=(1, 3, 4),
+                 refine_rate=0.1, dependency_rate=0.5, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.subtasks = tuple(subtasks)
+        self.refine_rate = refine_rate
+        self.dependency_rate = dependency_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {
+            "requests": 0, "ok": 0, "errors": 0, "rate_limited": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        }
+
+    def count(self, **amounts):
+        with self.lock:
+            for key, amount in amounts.items():
+                self.counts[key] += amount
+
+    def roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def answer(behaviour, messages):
+    """Text of the completion for ``messages``"""
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if "JSON array" in text:
+        with behaviour.lock:
+            count = behaviour.random.choice(behaviour.subtasks)
+        # Some plans end with a subtask that needs all the others
+        gather = count > 1 and behaviour.roll() < behaviour.dependency_rate
+        return json.dumps([
+            {
+                "task": f"Subtask {i + 1}: {uuid.uuid4().hex[:8]}",
+                "depends_on": list(range(i)) if gather and i == count - 1 else [],
+            }
+            for i in range(count)
+        ])
+
+    tokens = max(1, int(behaviour.completion_tokens * (0.5 + behaviour.roll())))
+    body = (FILLER * (tokens * CHARS_PER_TOKEN // len(FILLER) + 1))[:tokens * CHARS_PER_TOKEN]
+    if behaviour.roll() < behaviour.refine_rate:
+        body = REFINE_HINT + body
+    if "Final Answer" in text:
+        return f"Thought: I now know the final answer\nFinal Answer: {body}"
+    return body
+
+
+def make_handler(behaviour):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send(200, behaviour.stats())
+            elif self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            behaviour.count(requests=1)
+
+            roll = behaviour.roll()
+            if roll < behaviour.error_rate:
+                behaviour.count(errors=1)
+                self._send(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                return
+            if roll < behaviour.error_rate + behaviour.rate_limit_rate:
+                behaviour.count(rate_limited=1)
+                self._send(429, {"error": {"message": "injected rate limit", "type": "rate_limit"}},
+                           {"Retry-After": str(behaviour.retry_after)})
+                return
+
+            messages = request.get("messages") or []
+            content = answer(behaviour, messages)
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+            completion_tokens = max(1, len(content) // CHARS_PER_TOKEN)
+            delay = behaviour.latency + behaviour.jitter * behaviour.roll()
+            if behaviour.tokens_per_second:
+                delay += completion_tokens / behaviour.tokens_per_second
+            time.sleep(delay)
+
+            behaviour.count(ok=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+        def log_message(self, format, *args):
+            pass  # One line per request would swamp a benchmark run
+
+    return Handler
+
+
+def serve(behaviour, port=8900, host="127.0.0.1"):
+    """Start the stub in a daemon thread and return the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(behaviour))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    """Stub options, shared with the benchmark harness"""
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.1, help="extra random seconds, up to")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="0 for instant")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="mean answer length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--subtasks", default="1,3,4", help="subtask counts decompositions pick from")
+    parser.add_argument("--refine-rate", type=float, default=0.1,
+                        help="fraction of answers that trigger a refinement task")
+    parser.add_argument("--dependency-rate", type=float, default=0.5,
+                        help="fraction of plans whose last subtask depends on the others")
+    parser.add_argument("--seed", type=int)
+
+
+def behaviour_from(args):
+    return Behaviour(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        subtasks=[int(n) for n in args.subtasks.split(",")],
+        refine_rate=args.refine_rate,
+        dependency_rate=args.dependency_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--host", default="127.0.0.1")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(behaviour_from(args), args.port, args.host)
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
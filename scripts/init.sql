@@ -16,12 +16,92 @@ CREATE INDEX IF NOT EXISTS idx_results_parent_id ON results(parent_id);
 CREATE INDEX IF NOT EXISTS idx_results_created_at ON results(created_at);
 CREATE INDEX IF NOT EXISTS idx_results_depth ON results(depth);
 
+-- Cold tier of the result cache: hash of the normalized prompt plus model
+ALTER TABLE results ADD COLUMN IF NOT EXISTS prompt_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_results_prompt_hash ON results(prompt_hash) WHERE prompt_hash IS NOT NULL;
+
+-- Task status (queued, done, failed) and child counters, maintained by
+-- spawn_task() and the worker; rows from before tasks were recorded at spawn
+-- time all hold results, so they are backfilled as done
+ALTER TABLE results
+    ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'done',
+    ADD COLUMN IF NOT EXISTS children_total INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS children_done INT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS synthesis_spawned BOOLEAN NOT NULL DEFAULT FALSE,
+    ADD COLUMN IF NOT EXISTS completed_at TIMESTAMPTZ;
+ALTER TABLE results ALTER COLUMN status SET DEFAULT 'queued';
+
+-- Parents owed a synthesis task, flagged by run_master() once all of a
+-- mission's subtasks are spawned. Decomposed missions from before the column
+-- existed are backfilled once, as init_database() does.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'results' AND column_name = 'needs_synthesis'
+    ) THEN
+        ALTER TABLE results ADD COLUMN needs_synthesis BOOLEAN NOT NULL DEFAULT FALSE;
+        UPDATE results SET needs_synthesis = TRUE
+        WHERE parent_id IS NULL AND children_total > 0 AND NOT synthesis_spawned;
+    END IF;
+END $$;
+
+-- Parents whose children have all finished and still need a synthesis task
+DROP INDEX IF EXISTS idx_results_awaiting_synthesis;
+CREATE INDEX IF NOT EXISTS idx_results_synthesis_due ON results(id)
+    WHERE needs_synthesis AND NOT synthesis_spawned AND children_done >= children_total;
+
+-- Keyset pagination of the UI's results list on (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_results_created_at_id ON results(created_at, id);
+
+-- Mission (root task) and materialized path '<root id>/<child id>/...' of every
+-- task: one mission's tree is a single range scan on (root_id, path), already in
+-- depth-first order
+ALTER TABLE results
+    ADD COLUMN IF NOT EXISTS root_id UUID,
+    ADD COLUMN IF NOT EXISTS path TEXT;
+WITH RECURSIVE tree AS (
+    SELECT id, id AS root_id, id::text AS path
+    FROM results WHERE parent_id IS NULL AND root_id IS NULL
+    UNION ALL
+    SELECT r.id, t.root_id, t.path || '/' || r.id::text
+    FROM results r JOIN tree t ON r.parent_id = t.id
+)
+UPDATE results r SET root_id = tree.root_id, path = tree.path
+FROM tree WHERE r.id = tree.id AND r.root_id IS NULL;
+CREATE INDEX IF NOT EXISTS idx_results_root_path ON results(root_id, path);
+CREATE INDEX IF NOT EXISTS idx_results_missions ON results(created_at, id) WHERE parent_id IS NULL;
+
+-- Output bodies, compressed and stored once per distinct text; results keep
+-- a preview for listings (see master/output_store.py)
+CREATE TABLE IF NOT EXISTS outputs (
+    hash TEXT PRIMARY KEY,
+    encoding TEXT NOT NULL,
+    body BYTEA NOT NULL,
+    size INT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+ALTER TABLE results
+    ADD COLUMN IF NOT EXISTS output_hash TEXT REFERENCES outputs(hash),
+    ADD COLUMN IF NOT EXISTS preview TEXT,
+    ADD COLUMN IF NOT EXISTS output_size INT;
+
+-- Tokens and cost of every LLM call made for a task (see master/budget.py)
+ALTER TABLE results
+    ADD COLUMN IF NOT EXISTS prompt_tokens INT,
+    ADD COLUMN IF NOT EXISTS completion_tokens INT,
+    ADD COLUMN IF NOT EXISTS cost_usd NUMERIC(12, 6);
+
+-- Subtasks waiting for their prerequisites to finish (see master/dag.py)
+ALTER TABLE results ADD COLUMN IF NOT EXISTS depends_on UUID[];
+CREATE INDEX IF NOT EXISTS idx_results_blocked ON results USING GIN (depends_on) WHERE status = 'blocked';
+
 -- Create a view for task statistics
 CREATE OR REPLACE VIEW task_stats AS
 SELECT 
     COUNT(*) as total_tasks,
-    COUNT(CASE WHEN output IS NOT NULL THEN 1 END) as completed_tasks,
-    COUNT(CASE WHEN output IS NULL THEN 1 END) as pending_tasks,
+    COUNT(CASE WHEN status IN ('done', 'failed') THEN 1 END) as completed_tasks,
+    COUNT(CASE WHEN status IN ('queued', 'blocked') THEN 1 END) as pending_tasks,
     AVG(depth) as avg_depth,
     MAX(depth) as max_depth
 FROM results;
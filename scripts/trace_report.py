@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Critical path and per-stage latency of one mission, from its trace spans.
+
+Reads the JSONL written with TRACE_EXPORTER=jsonl (see master/tracing.py),
+rebuilds the mission's task tree from the ``task`` spans and walks back from
+the task that finished last: a follow-up task (subtask spawned after its
+parent ran, refinement) waits on its parent, a synthesis task on the last of
+its siblings to finish and a dependent subtask on the last of its
+prerequisites. Each task on that path is broken down into the time
+before it was queued (handoff), queue wait, execution and persistence, and
+every stage is summarised across the whole mission.
+
+Usage:
+    python scripts/trace_report.py [MISSION_ID] [--file traces.jsonl]
+                                   [--json out.json]
+
+Without a mission ID the most recently finished trace in the file is used.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import uuid
+from collections import defaultdict
+
+TASK_STAGES = ("queue_wait", "execute", "persist")
+
+# Resolved like master/tracing.py does, so both find the same file
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_spans(path, trace_id=None):
+    """Spans of ``trace_id``, or of the trace that ended last, oldest first"""
+    by_trace = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash mid-write
+            by_trace[span["trace_id"]].append(span)
+    if not by_trace:
+        return None, []
+    if trace_id is None:
+        trace_id = max(by_trace, key=lambda t: max(s["end"] for s in by_trace[t]))
+    return trace_id, sorted(by_trace.get(trace_id, []), key=lambda s: s["start"])
+
+
+def build_tasks(spans):
+    """Task spans by span ID, each with its stage spans under ``stages``"""
+    tasks = {}
+    for span in spans:
+        if span["name"] == "task":
+            # A requeued task is recorded once per attempt; keep the last
+            previous = tasks.get(span["span_id"])
+            if previous is None or span["end"] > previous["end"]:
+                tasks[span["span_id"]] = {**span, "stages": {}}
+    for span in spans:
+        task = tasks.get(span["parent_span_id"])
+        if task is not None and span["name"] != "task":
+            stages = task["stages"]
+            if span["name"] not in stages or span["end"] > stages[span["name"]]["end"]:
+                stages[span["name"]] = span
+    return tasks
+
+
+def ready_at(task):
+    """When a task's result became visible to whatever waits on it"""
+    for stage in ("persist", "execute"):
+        if stage in task["stages"]:
+            return task["stages"][stage]["end"]
+    return task["end"]
+
+
+def predecessor(task, tasks):
+    """The task whose completion ``task`` waited for, if any"""
+    attributes = task["attributes"]
+    if attributes.get("depends_on"):
+        by_task_id = {t["attributes"].get("task_id"): t for t in tasks.values()}
+        prerequisites = [by_task_id[d] for d in attributes["depends_on"] if d in by_task_id]
+        return max(prerequisites, key=ready_at, default=None)
+    if attributes.get("kind") == "synthesis":
+        siblings = [
+            t for t in tasks.values()
+            if t["attributes"].get("parent_id") == attributes.get("parent_id")
+            and t["attributes"].get("kind") != "synthesis"
+            and ready_at(t) <= task["start"]
+        ]
+        return max(siblings, key=ready_at, default=None)
+    parent = tasks.get(task["parent_span_id"])
+    # Subtasks queued alongside their parent do not wait on it
+    if parent is not None and ready_at(parent) <= task["start"]:
+        return parent
+    return None
+
+
+def critical_path(tasks):
+    """Tasks from the first to the one that finished last, each waiting on the previous"""
+    current = max(tasks.values(), key=lambda t: t["end"], default=None)
+    path = []
+    while current is not None and current not in path:
+        path.append(current)
+        current = predecessor(current, tasks)
+    return path[::-1]
+
+
+def summarize(spans):
+    """Count, total, mean, p50 and max milliseconds per span name"""
+    durations = defaultdict(list)
+    for span in spans:
+        durations[span["name"]].append(span["duration_ms"])
+    return {
+        name: {
+            "count": len(values),
+            "total_ms": round(sum(values), 1),
+            "mean_ms": round(statistics.mean(values), 1),
+            "p50_ms": round(statistics.median(values), 1),
+            "max_ms": round(max(values), 1),
+        }
+        for name, values in sorted(durations.items(), key=lambda kv: -sum(kv[1]))
+    }
+
+
+def report(trace_id, spans):
+    tasks = build_tasks(spans)
+    started = min(s["start"] for s in spans)
+    finished = max(s["end"] for s in spans)
+    path = critical_path(tasks)
+
+    steps = []
+    on_path = defaultdict(float)
+    previous_ready = started
+    for task in path:
+        stages = {
+            name: task["stages"][name]["duration_ms"]
+            for name in TASK_STAGES if name in task["stages"]
+        }
+        handoff = max(task["start"] - previous_ready, 0) * 1000
+        on_path["handoff"] += handoff
+        for name, ms in stages.items():
+            on_path[name] += ms
+        previous_ready = ready_at(task)
+        steps.append({
+            "task_id": task["attributes"].get("task_id"),
+            "kind": task["attributes"].get("kind"),
+            "depth": task["attributes"].get("depth"),
+            "status": task["attributes"].get("status"),
+            "handoff_ms": round(handoff, 1),
+            **{f"{name}_ms": round(ms, 1) for name, ms in stages.items()},
+            "task_ms": task["duration_ms"],
+        })
+    on_path["tail"] = max(finished - previous_ready, 0) * 1000 if path else 0
+
+    return {
+        "trace_id": trace_id,
+        "mission_id": str(uuid.UUID(trace_id)),
+        "tasks": len(tasks),
+        "spans": len(spans),
+        "wall_ms": round((finished - started) * 1000, 1),
+        "critical_path": steps,
+        "critical_path_ms": {name: round(ms, 1) for name, ms in on_path.items()},
+        "stages": summarize(spans),
+    }
+
+
+def print_report(result):
+    print(f"Mission {result['mission_id']}: {result['tasks']} tasks, "
+          f"{result['spans']} spans, {result['wall_ms'] / 1000:.2f}s wall")
+
+    print("\nCritical path:")
+    for step in result["critical_path"]:
+        stages = ", ".join(
+            f"{name} {step[f'{name}_ms']:.0f}" for name in TASK_STAGES if f"{name}_ms" in step
+        )
+        print(f"  {str(step['task_id'])[:8]}  {step['kind']:<10} depth {step['depth']}  "
+              f"+{step['handoff_ms']:.0f} ms handoff, {stages} ms  [{step['status']}]")
+    wall = result["wall_ms"] or 1
+    print("\nCritical path by stage:")
+    for name, ms in sorted(result["critical_path_ms"].items(), key=lambda kv: -kv[1]):
+        print(f"  {name:<18} {ms:>10.1f} ms  {ms / wall:>6.1%}")
+
+    print("\nAll spans by stage:")
+    print(f"  {'stage':<18} {'count':>6} {'total ms':>11} {'mean':>9} {'p50':>9} {'max':>9}")
+    for name, s in result["stages"].items():
+        print(f"  {name:<18} {s['count']:>6} {s['total_ms']:>11.1f} {s['mean_ms']:>9.1f} "
+              f"{s['p50_ms']:>9.1f} {s['max_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mission_id", nargs="?", help="root task ID (default: latest trace)")
+    parser.add_argument("--file", default=os.path.join(ROOT, os.getenv("TRACE_FILE", "traces.jsonl")))
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    trace_id = uuid.UUID(args.mission_id).hex if args.mission_id else None
+    trace_id, spans = load_spans(args.file, trace_id)
+    if not spans:
+        print(f"No spans for {args.mission_id or 'any mission'} in {args.file}")
+        sys.exit(1)
+
+    result = report(trace_id, spans)
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
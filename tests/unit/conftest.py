@@ -0,0 +1,22 @@
+"""
+Shared fixtures for the unit tests.
+
+These run without any services: Redis is fakeredis (with Lua, for the
+scripts) and Postgres is replaced per test where needed. The live-service
+checks stay in tests/test_connections.py and tests/test_decomposition.py.
+"""
+
+import os
+import sys
+
+import fakeredis
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(server=fakeredis.FakeServer())
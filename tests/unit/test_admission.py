@@ -0,0 +1,96 @@
+from master import admission, scheduler
+
+
+def start(redis_client, root, submitter="alice", tasks=1):
+    with redis_client.pipeline() as pipe:
+        admission.register(pipe, root, submitter)
+        admission.track(pipe, root, tasks)
+        pipe.execute()
+
+
+def test_mission_leaves_when_its_last_task_finishes(redis_client):
+    start(redis_client, "m", tasks=2)
+    assert admission.finish(redis_client, "m") == 2  # Decomposition done
+    assert redis_client.zscore(admission.INFLIGHT_KEY, "m") is not None
+    admission.finish(redis_client, "m")
+    assert admission.finish(redis_client, "m") == 0
+    assert redis_client.zcard(admission.INFLIGHT_KEY) == 0
+    assert redis_client.zcard(admission.SUBMITTER_KEY.format("alice")) == 0
+    assert not redis_client.exists(admission.MISSION_KEY.format("m"))
+
+
+def test_per_submitter_limit(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "MAX_PER_SUBMITTER", 1)
+    assert admission.check(redis_client, "alice") is None
+    start(redis_client, "m")
+    assert admission.check(redis_client, "alice")[0] == "submitter"
+    assert admission.check(redis_client, "bob") is None
+
+
+def test_queue_watermarks_have_hysteresis(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "QUEUE_HIGH", 4)
+    monkeypatch.setattr(admission, "QUEUE_LOW", 2)
+
+    def queue(n):
+        redis_client.delete(scheduler.FIFO_KEY)
+        if n:
+            redis_client.lpush(scheduler.FIFO_KEY, *range(n))
+
+    queue(3)
+    assert admission.check(redis_client, "alice") is None
+    queue(4)
+    assert admission.check(redis_client, "alice")[0] == "system"
+    # Under the high mark but not yet the low one: still saturated
+    queue(3)
+    assert admission.check(redis_client, "alice")[0] == "system"
+    queue(2)
+    assert admission.check(redis_client, "alice") is None
+
+
+def test_inflight_watermark(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "INFLIGHT_HIGH", 2)
+    monkeypatch.setattr(admission, "INFLIGHT_LOW", 1)
+    start(redis_client, "m1")
+    assert admission.check(redis_client, "bob") is None
+    start(redis_client, "m2")
+    assert admission.check(redis_client, "bob")[0] == "system"
+    admission.finish(redis_client, "m2")
+    admission.finish(redis_client, "m2")
+    assert admission.check(redis_client, "bob") is None
+
+
+def test_deferred_missions_wait_in_order(redis_client):
+    first = admission.defer(redis_client, {"prompt": "one", "submitter": "alice"})
+    second = admission.defer(redis_client, {"prompt": "two", "submitter": "bob"})
+    assert [m["prompt"] for m in admission.deferred(redis_client)] == ["one", "two"]
+    assert admission.position(redis_client, ticket=second)["position"] == 2
+
+    assert admission.claim(redis_client, first)
+    assert not admission.claim(redis_client, first)
+    assert admission.position(redis_client, ticket=second)["position"] == 1
+
+    # Once started, the ticket follows the mission
+    admission.admitted(redis_client, first, "m")
+    start(redis_client, "m")
+    assert admission.position(redis_client, ticket=first)["state"] == "running"
+    admission.finish(redis_client, "m")
+    admission.finish(redis_client, "m")
+    assert admission.position(redis_client, ticket=first)["state"] == "done"
+    assert admission.position(redis_client, ticket="nope")["state"] == "unknown"
+
+
+def test_queued_position(redis_client):
+    start(redis_client, "m")
+    with redis_client.pipeline() as pipe:
+        scheduler.push(pipe, '{"root_id": "other"}', "other")
+        scheduler.push(pipe, '{"root_id": "m"}', "m")
+        pipe.execute()
+    status = admission.position(redis_client, mission_id="m")
+    assert (status["state"], status["position"]) == ("queued", 2)
+
+
+def test_clear(redis_client):
+    start(redis_client, "m")
+    admission.defer(redis_client, {"prompt": "one", "submitter": "alice"})
+    admission.clear(redis_client)
+    assert redis_client.keys("admission:*") == []
@@ -0,0 +1,27 @@
+import asyncio
+import json
+
+from worker import async_runtime
+
+
+def test_failed_execution_is_handed_back():
+    jobs = [json.dumps({"task_id": t, "depth": 0}) for t in ("ok", "broken")]
+    completed, failed = [], []
+
+    def pop(timeout):
+        return jobs.pop(0) if jobs else None
+
+    def execute(data):
+        if data["task_id"] == "broken":
+            raise ConnectionError("redis down")
+        return "output"
+
+    def complete(job, data, result):
+        completed.append(data["task_id"])
+
+    def fail(job, error):
+        failed.append((json.loads(job)["task_id"], str(error)))
+
+    asyncio.run(async_runtime.run(pop, execute, complete, fail, 2, idle_timeout=0))
+    assert completed == ["ok"]
+    assert failed == [("broken", "redis down")]
@@ -0,0 +1,53 @@
+import pytest
+
+from master import budget
+
+
+def test_reserve_refuses_past_the_limit(redis_client):
+    budget.open_mission(redis_client, "m", tokens=2 * budget.TASK_TOKENS, usd=0)
+    budget.reserve(redis_client, "m")
+    budget.reserve(redis_client, "m")
+    with pytest.raises(budget.BudgetExceeded):
+        budget.reserve(redis_client, "m")
+    # Synthesis is forced through
+    budget.reserve(redis_client, "m", force=True)
+    assert budget.mission(redis_client, "m")["reserved_tokens"] == 3 * budget.TASK_TOKENS
+
+
+def test_unlimited_mission(redis_client):
+    budget.open_mission(redis_client, "m", tokens=0, usd=0)
+    for _ in range(5):
+        budget.reserve(redis_client, "m")
+    assert budget.remaining_tasks(redis_client, "m") is None
+
+
+def test_record_swaps_the_reservation_for_actual_usage(redis_client):
+    budget.open_mission(redis_client, "m", tokens=10 * budget.TASK_TOKENS, usd=0)
+    reserved = budget.reserve(redis_client, "m")
+    assert budget.remaining_tasks(redis_client, "m") == 9
+
+    usage = budget.Usage()
+    usage.add(prompt_tokens=4 * budget.TASK_TOKENS, completion_tokens=budget.TASK_TOKENS)
+    with redis_client.pipeline() as pipe:
+        budget.record(pipe, "m", usage, reserved)
+        pipe.execute()
+
+    state = budget.mission(redis_client, "m")
+    assert state["reserved_tokens"] == 0
+    assert state["spent_tokens"] == 5 * budget.TASK_TOKENS
+    assert state["spent_usd"] == pytest.approx(usage.cost_usd, abs=1e-6)
+    assert budget.remaining_tasks(redis_client, "m") == 5
+
+
+def test_dollar_limit(redis_client):
+    _, micros = budget.task_estimate()
+    budget.open_mission(redis_client, "m", tokens=0, usd=2.5 * micros / budget.MICROS)
+    assert budget.remaining_tasks(redis_client, "m") == 2
+
+
+def test_usage_counts_responses():
+    usage = budget.Usage()
+    usage.add_response({"usage": {"prompt_tokens": 10, "completion_tokens": 5}})
+    usage.add_response({})
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) == (10, 5, 15)
+    assert usage.cost_usd == pytest.approx(budget.cost(10, 5))
@@ -0,0 +1,42 @@
+from master import dag, output_store
+
+
+def test_plain_strings_have_no_prerequisites():
+    assert dag.normalize(["a", "b"]) == [("a", []), ("b", [])]
+
+
+def test_dependencies_on_earlier_subtasks_are_kept():
+    plan = [
+        {"task": "research"},
+        {"task": "outline", "depends_on": [0]},
+        {"prompt": "write", "depends_on": [1, 0, 1]},
+    ]
+    assert dag.normalize(plan) == [("research", []), ("outline", [0]), ("write", [0, 1])]
+
+
+def test_self_forward_and_invalid_references_are_dropped():
+    plan = [
+        {"task": "a", "depends_on": [0, 1]},
+        {"task": "b", "depends_on": 0},
+        {"task": "c", "depends_on": [2, 5, -1, "0", None]},
+        {"task": "d", "depends_on": [True, False]},
+        {"task": "e", "depends_on": True},
+    ]
+    assert dag.normalize(plan) == [("a", []), ("b", [0]), ("c", []), ("d", []), ("e", [])]
+
+
+def test_render_reads_previews_and_loads_only_missing_ones(monkeypatch):
+    previews = {"a": "first output", "b": None}
+    loaded = []
+
+    def load(conn, task_id):
+        loaded.append(task_id)
+        return "legacy output"
+
+    monkeypatch.setattr(output_store, "load_preview", lambda conn, task_id: previews[task_id])
+    monkeypatch.setattr(output_store, "load", load)
+    prompt = dag.render(None, {"prompt": "compare", "depends_on": ["a", "b"]})
+
+    assert loaded == ["b"]
+    assert "[1] first output" in prompt
+    assert "[2] legacy output" in prompt
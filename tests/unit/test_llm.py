@@ -0,0 +1,51 @@
+import pytest
+
+from master import llm
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(llm, "RPM", 2)
+    monkeypatch.setattr(llm, "TPM", 1000)
+
+
+def test_bucket_grants_until_empty(redis_client, limits):
+    assert llm._bucket(redis_client, 1, 100) == 0
+    assert llm._bucket(redis_client, 1, 100) == 0
+    # Two requests a minute: the next one refills in about 30s
+    wait = llm._bucket(redis_client, 1, 100)
+    assert 0 < wait <= 30000
+
+
+def test_token_bucket(redis_client, limits):
+    assert llm._bucket(redis_client, 0, 900) == 0
+    assert llm._bucket(redis_client, 0, 200) > 0
+    # A refund makes room again
+    llm.settle(redis_client, 900, 500)
+    assert llm._bucket(redis_client, 0, 200) == 0
+
+
+def test_pause_holds_every_permit(redis_client, limits):
+    llm.pause(redis_client, 5)
+    assert 0 < llm._bucket(redis_client, 1, 1) <= 5000
+
+
+def test_unlimited_acquire_never_touches_redis(monkeypatch):
+    monkeypatch.setattr(llm, "RPM", 0)
+    monkeypatch.setattr(llm, "TPM", 0)
+    llm.acquire(None, 100)
+
+
+def test_backoff_is_capped():
+    assert all(0 <= llm.backoff(attempt) <= llm.BACKOFF_MAX for attempt in range(20))
+
+
+class RateLimited(Exception):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_retry_after():
+    assert llm.retry_after(RateLimited({"retry-after": "2.5"})) == 2.5
+    assert llm.retry_after(RateLimited({"Retry-After": "soon"})) is None
+    assert llm.retry_after(ValueError()) is None
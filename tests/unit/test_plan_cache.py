@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from master import plan_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(plan_cache, "_entries", plan_cache.OrderedDict())
+    monkeypatch.setattr(plan_cache, "_inflight", {})
+
+
+def test_plan_is_computed_once_and_persisted(redis_client):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ["a", "b"]
+
+    assert plan_cache.get_plan(redis_client, "prompt", "model", compute) == ["a", "b"]
+    assert plan_cache.get_plan(redis_client, "prompt", "model", compute) == ["a", "b"]
+    assert len(calls) == 1
+
+    # A restarted process finds it in Redis
+    plan_cache._entries.clear()
+    assert plan_cache.get_plan(redis_client, "prompt", "model", compute) == ["a", "b"]
+    assert len(calls) == 1
+
+
+def test_concurrent_callers_share_one_computation(redis_client):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["plan"]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            plan_cache.get_plan(redis_client, "prompt", "model", compute)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [["plan"]] * 4
+    assert len(calls) == 1
+
+
+def test_failures_are_not_cached(redis_client):
+    def fail():
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        plan_cache.get_plan(redis_client, "prompt", "model", fail)
+    assert plan_cache.get_plan(redis_client, "prompt", "model", lambda: ["ok"]) == ["ok"]
+
+
+def test_timed_out_waiter_leaves_the_holders_lock(redis_client, monkeypatch):
+    monkeypatch.setattr(plan_cache, "LOCK_TTL", 1)
+    key = plan_cache.prompt_hash("prompt", "model")
+    redis_client.set(plan_cache.LOCK_KEY.format(key), "1")
+
+    assert plan_cache._load_or_compute(redis_client, key, lambda: ["mine"]) == ["mine"]
+    assert redis_client.exists(plan_cache.LOCK_KEY.format(key))
+
+
+def test_expired_lock_is_not_released_from_its_new_holder(redis_client):
+    key = plan_cache.prompt_hash("prompt", "model")
+    lock = plan_cache.LOCK_KEY.format(key)
+
+    def compute():
+        # Our lock expired mid-call and another caller took it
+        redis_client.set(lock, "theirs")
+        return ["mine"]
+
+    assert plan_cache._load_or_compute(redis_client, key, compute) == ["mine"]
+    assert redis_client.get(lock) == b"theirs"
@@ -0,0 +1,107 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from worker import result_sink
+
+
+class FakeDatabase:
+    """Keeps result rows by ID and answers the sink's statements like Postgres would"""
+
+    def __init__(self, stored=()):
+        self.stored = set(stored)
+        self.children_done = {}
+        self.statements = []
+        self.commits = 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+        self.commits += 1
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_values(self, cur, sql, rows, template=None, page_size=100, fetch=False):
+        self.statements.append((sql, list(rows)))
+        if sql == result_sink.INSERT_SQL:
+            # ON CONFLICT ... WHERE status = 'queued': stored rows are left alone
+            inserted = [(row[0], row[1]) for row in rows if row[0] not in self.stored]
+            self.stored.update(row[0] for row in rows)
+            return inserted
+        if sql == result_sink.COUNT_DONE_SQL:
+            for parent, n in rows:
+                self.children_done[parent] = self.children_done.get(parent, 0) + n
+        return []
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase(stored={"old"})
+    monkeypatch.setattr(result_sink, "execute_values", db.execute_values)
+    return db
+
+
+def data(task_id, parent_id="p"):
+    return {"task_id": task_id, "parent_id": parent_id, "prompt": "prompt", "depth": 1}
+
+
+def test_single_writer_flushes_at_once(db):
+    sink = result_sink.ResultSink(db.connection, batch_size=50, flush_interval=30)
+    assert sink.write(data("a"), "output", timeout=5) is True
+    assert sink.write(data("old"), "output", timeout=5) is False
+    assert db.commits == 2
+    assert db.children_done == {"p": 1}
+
+
+def test_concurrent_writers_share_a_batch(db):
+    sink = result_sink.ResultSink(db.connection, batch_size=50, flush_interval=30, writers=3)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda t=t: results.setdefault(t, sink.write(data(t), t, timeout=5)))
+        for t in ("a", "b", "c")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"a": True, "b": True, "c": True}
+    assert db.commits == 1
+    assert sink.stats()["last_batch_size"] == 3
+    assert db.children_done == {"p": 3}
+
+
+def test_duplicates_in_a_batch_are_written_once(db):
+    sink = result_sink.ResultSink(db.connection, writers=1)
+    futures = [result_sink.Future() for _ in range(3)]
+    batch = []
+    for task_id, text, future in zip(("a", "a", "b"), ("same", "same", "same"), futures):
+        body, preview = result_sink.output_store.prepare(text)
+        row = (task_id, "p", "prompt", 1, None, "done", body[0], preview, len(text), 0, 0, 0)
+        batch.append((row, body, future))
+    sink._flush(batch)
+
+    bodies = next(rows for sql, rows in db.statements if sql == result_sink.output_store.INSERT_SQL)
+    rows = next(rows for sql, rows in db.statements if sql == result_sink.INSERT_SQL)
+    assert len(bodies) == 1
+    assert [row[0] for row in rows] == ["a", "b"]
+    # Only one delivery of the duplicated task counts as the insert
+    assert [f.result() for f in futures] == [True, False, True]
+    assert db.children_done == {"p": 2}
+
+
+def test_flush_failure_reaches_every_writer(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(result_sink, "execute_values", fail)
+    sink = result_sink.ResultSink(FakeDatabase().connection)
+    with pytest.raises(RuntimeError):
+        sink.write(data("a"), "output", timeout=5)
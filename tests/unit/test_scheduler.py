@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from master import scheduler, stats
+
+
+def job(name, depth=1):
+    return json.dumps({"task_id": name, "depth": depth})
+
+
+def task_id(raw):
+    return json.loads(raw)["task_id"]
+
+
+@pytest.fixture
+def fair(monkeypatch):
+    monkeypatch.setattr(scheduler, "MODE", "fair")
+
+
+def push_all(redis_client, jobs):
+    with redis_client.pipeline() as pipe:
+        for name, root, boost in jobs:
+            scheduler.push(pipe, job(name), root, boost)
+        pipe.execute()
+
+
+def drain(redis_client, processing_key=None):
+    names = []
+    while True:
+        raw = scheduler.pop(redis_client, 0.01, processing_key)
+        if raw is None:
+            return names
+        names.append(task_id(raw))
+
+
+def test_fifo_pops_in_push_order(redis_client):
+    push_all(redis_client, [("a1", "a", 0), ("a2", "a", 0), ("b1", "b", 0)])
+    assert scheduler.size(redis_client) == 3
+    assert [task_id(j) for j in scheduler.peek(redis_client, 10)] == ["a1", "a2", "b1"]
+    assert drain(redis_client) == ["a1", "a2", "b1"]
+
+
+@pytest.mark.parametrize("processing_key", [None, "tasks:processing:w1"])
+def test_fair_interleaves_missions(redis_client, fair, processing_key):
+    push_all(redis_client, [("a1", "a", 0), ("a2", "a", 0), ("a3", "a", 0), ("b1", "b", 0)])
+    assert drain(redis_client, processing_key) == ["a1", "b1", "a2", "a3"]
+    if processing_key:
+        assert redis_client.llen(processing_key) == 4
+
+
+def test_fair_mission_arriving_later_starts_from_virtual_time(redis_client, fair):
+    push_all(redis_client, [("a1", "a", 0), ("a2", "a", 0), ("a3", "a", 0)])
+    assert task_id(scheduler.pop(redis_client, 0.01)) == "a1"
+    push_all(redis_client, [("b1", "b", 0)])
+    # Neither behind all of a's backlog nor ahead of work already due
+    assert drain(redis_client) == ["a2", "b1", "a3"]
+
+
+def test_fair_priority_boost_jumps_ahead(redis_client, fair):
+    push_all(redis_client, [("a1", "a", 0), ("a2", "a", 0),
+                            ("synthesis", "a", scheduler.priority(2, "synthesis"))])
+    assert drain(redis_client)[0] == "synthesis"
+
+
+def test_priority():
+    assert scheduler.priority(0) == 0
+    assert scheduler.priority(2) == 2 * scheduler.DEPTH_BOOST
+    assert scheduler.priority(1, "synthesis") == scheduler.DEPTH_BOOST + scheduler.SYNTHESIS_BOOST
+
+
+@pytest.mark.parametrize("mode", ["fifo", "fair"])
+def test_reap_requeues_only_dead_workers(redis_client, monkeypatch, mode):
+    monkeypatch.setattr(scheduler, "MODE", mode)
+    processing, heartbeat = "tasks:processing:w1", "workers:heartbeat:w1"
+    redis_client.lpush(processing, job("x", depth=2), job("y", depth=2))
+
+    redis_client.set(heartbeat, "1")
+    assert scheduler.reap(redis_client, processing, heartbeat) == 0
+    assert redis_client.llen(processing) == 2
+
+    redis_client.delete(heartbeat)
+    assert scheduler.reap(redis_client, processing, heartbeat) == 2
+    assert redis_client.llen(processing) == 0
+    assert scheduler.size(redis_client) == 2
+    assert int(redis_client.hget(stats.WAITING_KEY, "2")) == 2
+    assert sorted(drain(redis_client)) == ["x", "y"]
+
+
+def test_fair_requeue_goes_back_at_virtual_time(redis_client, fair):
+    push_all(redis_client, [("a1", "a", 0), ("a2", "a", 0), ("a3", "a", 0)])
+    first = scheduler.pop(redis_client, 0.01)
+    with redis_client.pipeline() as pipe:
+        scheduler.requeue(pipe, first)
+        pipe.execute()
+    assert drain(redis_client) == ["a1", "a2", "a3"]
@@ -0,0 +1,75 @@
+import uuid
+from contextlib import contextmanager
+
+import pytest
+import redis
+
+from master import admission, budget, main
+from master.task_index import pending_children, track_child
+
+
+class FakeDatabase:
+    """Records statements; the insert hands back the root it was given"""
+
+    def __init__(self):
+        self.statements = []
+        self.params = None
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(" ".join(sql.split()))
+        self.params = params
+
+    def fetchone(self):
+        return (self.params["root_id"],)
+
+
+@pytest.fixture
+def db(monkeypatch, redis_client):
+    db = FakeDatabase()
+    monkeypatch.setattr(main, "get_redis", lambda: redis_client)
+    monkeypatch.setattr(main, "pg_connection", db.connection)
+
+    def push(*args, **kwargs):
+        raise redis.ConnectionError("redis down")
+    monkeypatch.setattr(main.task_queue, "push", push)
+    return db
+
+
+def test_failed_push_abandons_a_subtask(db, redis_client):
+    root = str(uuid.uuid4())
+    budget.open_mission(redis_client, root, tokens=0, usd=0)
+    with redis_client.pipeline() as pipe:
+        admission.register(pipe, root, "alice")
+        track_child(pipe, root)  # A sibling still running
+        pipe.execute()
+
+    with pytest.raises(redis.ConnectionError):
+        main.spawn_task("sub", parent_id=root, depth=1, root_id=root)
+
+    assert db.statements[-2].startswith("DELETE FROM results")
+    assert "children_total = children_total - 1" in db.statements[-1]
+    assert budget.mission(redis_client, root)["reserved_tokens"] == 0
+    assert pending_children(redis_client, root) == 1
+    assert int(redis_client.hget(admission.MISSION_KEY.format(root), "pending")) == 1
+
+
+def test_failed_push_abandons_a_mission(db, redis_client):
+    with pytest.raises(redis.ConnectionError):
+        main.spawn_task("mission", submitter="alice")
+
+    assert db.statements[-1].startswith("DELETE FROM results")
+    assert redis_client.zcard(admission.INFLIGHT_KEY) == 0
+    assert redis_client.zcard(admission.SUBMITTER_KEY.format("alice")) == 0
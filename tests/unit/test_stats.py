@@ -0,0 +1,35 @@
+from master import stats
+
+
+def test_percentile():
+    assert stats.percentile([], 0.5) is None
+    assert stats.percentile([3.0], 0.95) == 3.0
+    samples = list(range(1, 101))
+    assert stats.percentile(samples, 0.5) == 50
+    assert stats.percentile(samples, 0.95) == 95
+    assert stats.percentile(samples, 1.0) == 100
+    assert stats.percentile(samples, 0.0) == 1
+    assert stats.percentile([2, 4], 0.5) == 2
+
+
+def test_snapshot_reads_back_what_was_recorded(redis_client):
+    now = 1_700_000_000
+    with redis_client.pipeline() as pipe:
+        stats.record_queued(pipe, 1, count=3)
+        stats.record_start(pipe, 1, now=now)
+        stats.record(pipe, "done", 2.0, now=now)
+        stats.record(pipe, "failed", 4.0, now=now)
+        pipe.execute()
+
+    snapshot = stats.snapshot(redis_client, minutes=5, now=now)
+    assert (snapshot["done"], snapshot["failed"]) == (1, 1)
+    assert snapshot["started_recent"] == 1
+    assert snapshot["waiting_by_depth"] == {1: 2}
+    assert snapshot["per_minute"]["done"][-1] == 1
+    assert snapshot["p50_seconds"] == 2.0
+
+
+def test_seed_only_once(redis_client):
+    stats.seed(redis_client, lambda: {"done": 5})
+    stats.seed(redis_client, lambda: {"done": 100})
+    assert stats.snapshot(redis_client)["done"] == 5
@@ -0,0 +1,53 @@
+import pytest
+
+from worker import synthesis
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt, max_tokens):
+        self.prompts.append(prompt)
+        return f"merged {len(self.prompts)}"
+
+
+def test_pack_stays_within_budget():
+    texts = ["x" * 400] * 10  # ~101 tokens each
+    batches = list(synthesis.pack(texts, 250))
+    assert [len(b) for b in batches] == [2, 2, 2, 2, 2]
+    assert sum(len(b) for b in batches) == len(texts)
+
+
+def test_pack_clips_oversized_texts():
+    batches = list(synthesis.pack(["y" * 10_000], 100))
+    assert len(batches) == 1
+    assert synthesis.estimate_tokens(batches[0][0]) <= 110
+
+
+def test_small_input_takes_one_call():
+    llm = FakeLLM()
+    answer, stats = synthesis.synthesize("mission", ["a", "b", "c"], llm)
+    assert answer == "merged 1"
+    assert stats == {"children": 3, "levels": 0, "calls": 1}
+    assert "### Result 3" in llm.prompts[0]
+
+
+def test_large_input_is_reduced_level_by_level():
+    llm = FakeLLM()
+    outputs = ("z" * 8000 for _ in range(40))  # ~2000 tokens each
+    answer, stats = synthesis.synthesize("mission", outputs, llm, budget=6000, parallelism=2)
+    assert stats["children"] == 40
+    assert stats["levels"] >= 1
+    assert stats["calls"] == len(llm.prompts)
+    assert answer == f"merged {len(llm.prompts)}"
+
+
+def test_nothing_to_merge():
+    with pytest.raises(ValueError):
+        synthesis.synthesize("mission", [], FakeLLM())
+
+
+def test_budget_too_small():
+    with pytest.raises(ValueError):
+        synthesis.synthesize("mission", ["a"], FakeLLM(), budget=1000)
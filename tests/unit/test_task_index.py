@@ -0,0 +1,15 @@
+from master import task_index
+
+
+def test_release_counts_down_and_never_goes_negative(redis_client):
+    with redis_client.pipeline() as pipe:
+        task_index.track_child(pipe, "p")
+        task_index.track_child(pipe, "p")
+        pipe.execute()
+    assert task_index.pending_children(redis_client, "p") == 2
+    assert task_index.release_child(redis_client, "p") == 1
+    assert task_index.release_child(redis_client, "p") == 0
+    assert not redis_client.exists(task_index.pending_key("p"))
+    # A stray double release
+    assert task_index.release_child(redis_client, "p") == 0
+    assert task_index.pending_children(redis_client, "p") == 0
@@ -0,0 +1,62 @@
+import uuid
+
+import pytest
+
+import trace_report
+from master import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "EXPORTER", "jsonl")
+    monkeypatch.setattr(tracing, "TRACE_FILE", str(path))
+    monkeypatch.setattr(tracing, "_fd_pid", None)
+    return path
+
+
+def task(root, task_id, start, end, parent=None, **attributes):
+    """A task span whose persist stage ends with it"""
+    ctx = tracing.context(root, task_id, parent)
+    tracing.record("execute", ctx, start, end - 0.1)
+    tracing.record("persist", ctx, end - 0.1, end)
+    tracing.record_task(ctx, start, end, task_id=task_id, parent_id=parent, **attributes)
+
+
+def test_critical_path_follows_what_each_task_waited_for(trace_file):
+    root, fast, slow, dependent, synthesis = (str(uuid.uuid4()) for _ in range(5))
+    task(root, root, 0, 1)
+    # Subtasks queued alongside the root do not wait on it
+    task(root, fast, 0, 2, parent=root)
+    task(root, slow, 0, 5, parent=root)
+    task(root, dependent, 1, 8, parent=root, depends_on=[fast, slow])
+    task(root, synthesis, 9, 10, parent=root, kind="synthesis")
+
+    trace_id, spans = trace_report.load_spans(str(trace_file))
+    assert trace_id == tracing.trace_id(root)
+    path = trace_report.critical_path(trace_report.build_tasks(spans))
+    assert [t["attributes"]["task_id"] for t in path] == [slow, dependent, synthesis]
+
+    result = trace_report.report(trace_id, spans)
+    assert result["mission_id"] == root
+    assert result["tasks"] == 5
+    assert result["wall_ms"] == 10_000
+    assert result["stages"]["task"]["count"] == 5
+
+
+def test_follow_up_task_waits_on_its_parent(trace_file):
+    root, refinement = str(uuid.uuid4()), str(uuid.uuid4())
+    task(root, root, 0, 3)
+    task(root, refinement, 3.5, 6, parent=root, kind="refinement")
+    _, spans = trace_report.load_spans(str(trace_file))
+    path = trace_report.critical_path(trace_report.build_tasks(spans))
+    assert [t["attributes"]["task_id"] for t in path] == [root, refinement]
+
+
+def test_torn_lines_are_skipped(trace_file):
+    root = str(uuid.uuid4())
+    task(root, root, 0, 1)
+    with open(trace_file, "a") as f:
+        f.write('{"trace_id": "cut sho')
+    _, spans = trace_report.load_spans(str(trace_file))
+    assert len(spans) == 3
@@ -0,0 +1,51 @@
+import json
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+import redis
+
+pytest.importorskip("crewai")
+
+from master import task_queue
+from worker import worker
+
+
+@contextmanager
+def fake_connection():
+    yield None
+
+
+def fail(error):
+    def raiser(*args, **kwargs):
+        raise error
+    return raiser
+
+
+@pytest.fixture
+def env(monkeypatch, redis_client):
+    monkeypatch.setattr(worker, "get_redis", lambda: redis_client)
+    monkeypatch.setattr(worker, "pg_connection", fake_connection)
+    monkeypatch.setattr(worker.result_cache, "ENABLED", True)
+    monkeypatch.setattr(worker, "execute_task", fail(AssertionError("agent ran")))
+    monkeypatch.setattr(worker, "complete_task", fail(AssertionError("completed")))
+    return monkeypatch
+
+
+@pytest.mark.parametrize("target, name, data", [
+    (worker.stats, "record_start", {}),
+    (worker.output_store, "load_preview", {"kind": "refinement", "parent_id": "p"}),
+    (worker.dag, "render", {"depends_on": ["a"]}),
+    (worker.result_cache, "lookup", {}),
+])
+@pytest.mark.parametrize("error", [
+    redis.ConnectionError("redis down"),
+    psycopg2.OperationalError("postgres down"),
+])
+def test_failure_before_execution_requeues(env, redis_client, target, name, data, error):
+    env.setattr(target, name, fail(error))
+    data = {"task_id": "t", "prompt": "prompt", "depth": 1, **data}
+    job = json.dumps(data)
+
+    assert worker.process_job(job, data) is False
+    assert task_queue.pop(redis_client, 1) == job.encode()
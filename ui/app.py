@@ -1,23 +1,37 @@
 import streamlit as st
-import psycopg2
-import redis
 import os
-import json
 import sys
-import time
+import uuid
 from datetime import datetime, timedelta
 import pandas as pd
 
 # Add parent directory to path
 sys.path.append('/app')
-from master.main import run_master, init_database
+from master.main import submit_mission, init_database
+from master import admission, budget, dag, progress, scheduler, stats, task_index
+from master.connections import get_redis
+from ui import queries
 
-# Initialize connections
+# Reverse proxies in front of the UI that append the client address to
+# X-Forwarded-For (1 on Railway). Hops before theirs are set by the client.
+TRUSTED_PROXIES = int(os.getenv("UI_TRUSTED_PROXIES", "0"))
+
+# Tasks still waiting to run; everything else has finished
+PENDING_ICONS = {"queued": "⏳", "blocked": "🔒"}
+
+SUBMISSION_LABELS = {
+    "deferred": "⏸️ Waiting for capacity",
+    "queued": "⏳ Queued",
+    "running": "⚙️ Running",
+    "done": "✅ Finished",
+    "unknown": "❔ Unknown",
+}
+
+# The schema only needs checking once per server process, not on every rerun
 @st.cache_resource
-def get_connections():
-    redis_client = redis.from_url(os.getenv("REDIS_URL"))
-    pg_conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-    return redis_client, pg_conn
+def ensure_database():
+    init_database()
+    return True
 
 # Page config
 st.set_page_config(
@@ -29,41 +43,128 @@ st.set_page_config(
 st.title("🚀 Infinite Crew Control Center")
 st.markdown("*Autonomous agents that spawn autonomous agents*")
 
-# Get connections
-redis_client, pg_conn = get_connections()
+# Get connections (pooled and shared across sessions by master.connections)
+redis_client = get_redis()
 
 # Initialize database
-init_database()
+ensure_database()
+
+def submitter():
+    """
+    Who launches missions from this session, for per-submitter limits: the
+    client address as recorded by the outermost trusted proxy. Without one
+    (UI_TRUSTED_PROXIES=0) it is the browser session, which a reload resets,
+    so the limit is only best-effort.
+    """
+    if "submitter" not in st.session_state:
+        hops = [hop.strip() for hop in st.context.headers.get("X-Forwarded-For", "").split(",")]
+        trusted = hops[-TRUSTED_PROXIES] if TRUSTED_PROXIES and len(hops) >= TRUSTED_PROXIES else ""
+        st.session_state.submitter = trusted or f"session:{uuid.uuid4().hex}"
+    return st.session_state.submitter
+
+def launch(prompt, **options):
+    """Submit a mission through admission control and remember it for this session"""
+    try:
+        submission = submit_mission(prompt, submitter=submitter(), **options)
+    except admission.Rejected as e:
+        st.error(f"{e}. Please try again later.")
+        return None
+    st.session_state.setdefault("submissions", []).insert(0, {"prompt": prompt, **submission})
+    queries.invalidate()
+    return submission
+
+def announce(submission):
+    """Tell the submitter what admission control did with their mission"""
+    # A toast survives the rerun, so there is no need to pause for it
+    if submission["status"] == "deferred":
+        st.toast(f"System busy ({submission['reason']}): mission waiting "
+                 f"at position {submission['position']}.")
+    elif submission["status"] == "degraded":
+        st.toast(f"System busy ({submission['reason']}): mission launched as a single "
+                 "task, without decomposition.")
+    else:
+        st.toast("Mission launched! Check the Active Tasks tab.")
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    if seconds < 60:
+        return f"~{seconds}s"
+    return f"~{seconds // 60}m {seconds % 60}s"
+
+def my_submissions():
+    """This session's missions with their place in line and estimated start"""
+    submissions = st.session_state.get("submissions", [])
+    if not submissions:
+        return
+    st.subheader("Your Submissions")
+    for submission in submissions[:10]:
+        status = queries.submission_status(submission.get("ticket"), submission.get("mission_id"))
+        line = f"{SUBMISSION_LABELS[status['state']]} · {submission['prompt'][:80]}"
+        if status["position"]:
+            line += f" · position {status['position']}"
+        if status["state"] in ("deferred", "queued"):
+            line += f" · starts in {format_eta(status['eta_seconds'])}"
+        st.markdown(line)
+        if submission["status"] == "degraded":
+            st.caption(f"Ran as a single task without decomposition: {submission['reason']}")
+
+def live_status():
+    """Sidebar metrics, read from Redis counters in one round-trip"""
+    metrics = queries.system_stats()
+    waiting = metrics["waiting_by_depth"]
+    
+    st.metric("Tasks in Queue", sum(waiting.values()))
+    if waiting:
+        st.caption(" · ".join(f"depth {depth}: {count}" for depth, count in waiting.items()))
+    st.metric("Running", metrics["running"])
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Started/h", metrics["started_recent"])
+    col2.metric("Done/h", metrics["done_recent"])
+    col3.metric("Failed/h", metrics["failed_recent"])
+    st.line_chart(
+        pd.DataFrame(metrics["per_minute"]).tail(30),
+        height=120
+    )
+    
+    if metrics["p50_seconds"] is not None:
+        st.metric(
+            "Task Time p50 / p95",
+            f"{metrics['p50_seconds']:.1f}s / {metrics['p95_seconds']:.1f}s"
+        )
+    st.metric("Total Results", metrics["done"] + metrics["failed"])
+    
+    cache_stats = metrics["cache"]
+    st.metric(
+        "Result Cache Hit Rate",
+        f"{cache_stats['hit_rate']:.0%}",
+        help=f"{cache_stats['hot_hits']} Redis hits, {cache_stats['cold_hits']} "
+             f"Postgres hits, {cache_stats['misses']} misses"
+    )
 
 # Sidebar for stats
 with st.sidebar:
     st.header("📊 System Status")
     
-    # Auto-refresh
+    # Auto-refresh reruns only the metrics fragment on a timer, so the rest of
+    # the page stays responsive instead of sleeping inside the script
     auto_refresh = st.checkbox("Auto-refresh (5s)", value=False)
-    if auto_refresh:
-        time.sleep(5)
-        st.rerun()
-    
-    # Queue size
-    queue_size = redis_client.llen("tasks")
-    st.metric("Tasks in Queue", queue_size)
-    
-    # Database stats
-    with pg_conn.cursor() as cur:
-        cur.execute("SELECT COUNT(*) FROM results")
-        total_results = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM results WHERE created_at > NOW() - INTERVAL '1 hour'")
-        recent_results = cur.fetchone()[0]
+    st.fragment(live_status, run_every=5 if auto_refresh else None)()
     
-    st.metric("Total Results", total_results)
-    st.metric("Results (Last Hour)", recent_results)
+    # Queue size and the next tasks, one Redis round-trip shared with the Active Tasks tab
+    queue_size, queued_tasks = queries.queue_snapshot(50)
     
     # Clear options
     st.divider()
     if st.button("🗑️ Clear Queue", type="secondary"):
-        redis_client.delete("tasks")
+        scheduler.clear(redis_client)
+        task_index.clear(redis_client)
+        progress.clear(redis_client)
+        dag.clear(redis_client)
+        admission.clear(redis_client)
+        stats.clear_waiting(redis_client)
+        queries.invalidate()
         st.success("Queue cleared!")
         st.rerun()
 
@@ -80,14 +181,33 @@ with tab1:
         height=150
     )
     
+    use_cache = st.checkbox(
+        "Reuse cached results for identical tasks",
+        value=True,
+        help="Untick to force every task of this mission to run fresh"
+    )
+    
+    budget_usd = st.number_input(
+        "Budget (USD)",
+        min_value=0.0,
+        value=budget.USD_LIMIT,
+        step=0.01,
+        format="%.2f",
+        help="Caps what the mission may spend on LLM calls; 0 for no limit. "
+             "Tight budgets fan out to fewer subtasks and skip refinements."
+    )
+    
     col1, col2 = st.columns([1, 4])
     with col1:
         if st.button("🚀 Launch Mission", type="primary", disabled=not mission):
             with st.spinner("Decomposing mission..."):
-                run_master(mission)
-            st.success("Mission launched! Check the Active Tasks tab.")
-            time.sleep(2)
-            st.rerun()
+                submission = launch(mission, use_cache=use_cache, budget_usd=budget_usd)
+            if submission:
+                announce(submission)
+                st.rerun()
+    
+    # Refreshes on its own, so a waiting submitter sees the line move
+    st.fragment(my_submissions, run_every=5)()
     
     # Example missions
     st.subheader("Example Missions")
@@ -100,9 +220,10 @@ with tab1:
     
     for example in examples:
         if st.button(f"📝 {example[:60]}...", key=example):
-            run_master(example)
-            st.success("Example mission launched!")
-            st.rerun()
+            submission = launch(example)
+            if submission:
+                announce(submission)
+                st.rerun()
 
 with tab2:
     st.header("Active Tasks in Queue")
@@ -110,13 +231,8 @@ with tab2:
     if queue_size == 0:
         st.info("No active tasks in queue. Launch a mission to get started!")
     else:
-        # Get all tasks from queue
-        tasks = []
-        for i in range(min(queue_size, 50)):  # Limit to 50 for performance
-            task_json = redis_client.lindex("tasks", i)
-            if task_json:
-                task = json.loads(task_json)
-                tasks.append(task)
+        # Next tasks to run, limited to 50 for performance
+        tasks = queued_tasks
         
         # Display as dataframe
         if tasks:
@@ -135,6 +251,28 @@ with tab2:
                     "parent_id": st.column_config.TextColumn("Parent", width="small")
                 }
             )
+    
+    st.subheader("Running Tasks")
+    running = progress.active(redis_client)
+    if not running:
+        st.info("No task is running right now.")
+    else:
+        labels = {
+            task_id: f"{task_id[:8]}... (last update {idle:.0f}s ago"
+                     + (", possibly stuck)" if idle >= progress.STUCK_AFTER else ")")
+            for task_id, idle in running
+        }
+        selected = st.selectbox("Live output:", list(labels), format_func=labels.get)
+        
+        # Tail the task's stream, fetching only entries newer than last time
+        tail = st.session_state.setdefault("progress_tail", {})
+        last_id, chunks = tail.get(selected, ("0-0", []))
+        entries, last_id = progress.read(redis_client, selected, last_id)
+        chunks = (chunks + [entry["text"] for entry in entries if entry["text"]])[-progress.MAXLEN:]
+        tail[selected] = (last_id, chunks)
+        
+        for chunk in chunks[-20:]:
+            st.text(chunk)
 
 with tab3:
     st.header("Completed Results")
@@ -142,29 +280,20 @@ with tab3:
     # Time filter
     time_filter = st.selectbox(
         "Time Range:",
-        ["All Time", "Last Hour", "Last 24 Hours", "Last Week"]
+        list(queries.TIME_FILTERS),
+        on_change=lambda: st.session_state.pop("results_pages", None)
     )
     
-    # Build query
-    query = "SELECT id, prompt, output, depth, created_at FROM results"
-    if time_filter == "Last Hour":
-        query += " WHERE created_at > NOW() - INTERVAL '1 hour'"
-    elif time_filter == "Last 24 Hours":
-        query += " WHERE created_at > NOW() - INTERVAL '24 hours'"
-    elif time_filter == "Last Week":
-        query += " WHERE created_at > NOW() - INTERVAL '7 days'"
-    query += " ORDER BY created_at DESC LIMIT 20"
-    
-    # Get results
-    with pg_conn.cursor() as cur:
-        cur.execute(query)
-        results = cur.fetchall()
+    # Keyset pagination: each page starts after the (created_at, id) of the
+    # previous page's last row; the stack of page starts allows going back
+    pages = st.session_state.setdefault("results_pages", [None])
+    results = queries.results_page(time_filter, pages[-1])
     
     if not results:
         st.info("No results found for the selected time range.")
     else:
         for result in results:
-            task_id, prompt, output, depth, created_at = result
+            task_id, prompt, preview, output_size, depth, completed_at, _ = result
             
             with st.expander(f"🎯 {prompt[:80]}...", expanded=False):
                 col1, col2, col3 = st.columns([1, 1, 2])
@@ -173,73 +302,70 @@ with tab3:
                 with col2:
                     st.caption(f"ID: {str(task_id)[:8]}...")
                 with col3:
-                    st.caption(f"Completed: {created_at.strftime('%Y-%m-%d %H:%M')}")
+                    st.caption(f"Completed: {completed_at.strftime('%Y-%m-%d %H:%M')}")
                 
                 st.divider()
                 st.markdown("**Task:**")
                 st.text(prompt)
                 st.markdown("**Output:**")
-                st.text(output[:2000] + ("..." if len(output) > 2000 else ""))
+                if output_size and output_size > len(preview) and st.toggle(
+                    f"Show full output ({output_size:,} characters)", key=f"full_{task_id}"
+                ):
+                    st.text(queries.full_output(task_id))
+                else:
+                    st.text(preview + ("..." if output_size and output_size > len(preview) else ""))
+    
+    col1, col2, _ = st.columns([1, 1, 4])
+    with col1:
+        if st.button("⬅️ Newer", disabled=len(pages) == 1):
+            pages.pop()
+            st.rerun()
+    with col2:
+        if st.button("Older ➡️", disabled=len(results) < queries.PAGE_SIZE):
+            pages.append((results[-1][6], results[-1][0]))
+            st.rerun()
 
 with tab4:
     st.header("Task Hierarchy Tree")
     
-    # Get task hierarchy
-    with pg_conn.cursor() as cur:
-        cur.execute("""
-            WITH RECURSIVE task_tree AS (
-                SELECT id, parent_id, prompt, depth, output IS NOT NULL as completed
-                FROM results
-                WHERE parent_id IS NULL
-                
-                UNION ALL
-                
-                SELECT r.id, r.parent_id, r.prompt, r.depth, r.output IS NOT NULL
-                FROM results r
-                JOIN task_tree t ON r.parent_id = t.id
-            )
-            SELECT * FROM task_tree
-            ORDER BY depth, id
-            LIMIT 100
-        """)
-        tree_data = cur.fetchall()
+    # Missions are listed newest first; a mission's tree is only queried once
+    # its toggle is switched on
+    mission_pages = st.session_state.setdefault("mission_pages", [None])
+    mission_rows = queries.missions(mission_pages[-1])
     
-    if not tree_data:
+    if not mission_rows:
         st.info("No task hierarchies found. Complete some multi-level missions to see the tree!")
     else:
-        # Build tree visualization
-        st.markdown("### Task Dependencies")
+        st.markdown("### Missions")
         
-        # Group by parent
-        tree_dict = {}
-        for task_id, parent_id, prompt, depth, completed in tree_data:
-            if parent_id is None:
-                if task_id not in tree_dict:
-                    tree_dict[task_id] = {
-                        'prompt': prompt,
-                        'depth': depth,
-                        'completed': completed,
-                        'children': []
-                    }
-            else:
-                if parent_id not in tree_dict:
-                    tree_dict[parent_id] = {'children': []}
-                tree_dict[parent_id]['children'].append({
-                    'id': task_id,
-                    'prompt': prompt,
-                    'depth': depth,
-                    'completed': completed
-                })
+        for root_id, prompt, status, children_total, children_done, created_at in mission_rows:
+            icon = PENDING_ICONS.get(status, "✅")
+            progress_text = f" ({children_done}/{children_total} subtasks)" if children_total else ""
+            with st.expander(f"{icon} {prompt[:100]}...{progress_text}", expanded=False):
+                st.caption(f"Started {created_at.strftime('%Y-%m-%d %H:%M')} · ID {str(root_id)[:8]}...")
+                if st.toggle("Load task tree", key=f"tree_{root_id}"):
+                    tree = queries.mission_tree(root_id)
+                    tokens = sum(row[5] for row in tree)
+                    cost = sum(row[6] for row in tree)
+                    st.caption(f"Spent {tokens:,} tokens · ${cost:.4f}")
+                    for task_id, task_prompt, task_status, depth, level, _, _ in tree:
+                        task_icon = PENDING_ICONS.get(task_status, "✅")
+                        if level == 0:
+                            st.markdown(f"**{task_icon} Root:** {task_prompt[:100]}...")
+                        else:
+                            indent = "&nbsp;" * 4 * (level - 1)
+                            st.markdown(f"{indent}└─ {task_icon} {task_prompt[:80]}...")
         
-        # Display tree
-        for root_id, root_data in tree_dict.items():
-            if 'prompt' in root_data:
-                status = "✅" if root_data['completed'] else "⏳"
-                st.markdown(f"**{status} Root:** {root_data['prompt'][:100]}...")
-                
-                for child in root_data.get('children', []):
-                    status = "✅" if child['completed'] else "⏳"
-                    st.markdown(f"  └─ {status} {child['prompt'][:80]}...")
+        col1, col2, _ = st.columns([1, 1, 4])
+        with col1:
+            if st.button("⬅️ Newer", key="missions_newer", disabled=len(mission_pages) == 1):
+                mission_pages.pop()
+                st.rerun()
+        with col2:
+            if st.button("Older ➡️", key="missions_older",
+                         disabled=len(mission_rows) < queries.PAGE_SIZE):
+                mission_pages.append((mission_rows[-1][5], mission_rows[-1][0]))
+                st.rerun()
 
 # Footer
 st.divider()
@@ -0,0 +1,138 @@
+"""
+Cached data access for the control center.
+
+Every query the UI runs goes through here and is cached with ``st.cache_data``
+for a few seconds, so reruns and extra browser tabs share one read of Redis
+and Postgres instead of each issuing their own. Results are paged by keyset
+on ``(created_at, id)``, and the sidebar totals come from the counters in
+``master.stats`` rather than from counting rows.
+"""
+
+import json
+
+import streamlit as st
+
+from master import admission, output_store, result_cache, scheduler, stats
+from master.connections import get_redis, pg_connection
+
+PAGE_SIZE = 20
+
+TIME_FILTERS = {
+    "All Time": None,
+    "Last Hour": "1 hour",
+    "Last 24 Hours": "24 hours",
+    "Last Week": "7 days",
+}
+
+
+@st.cache_data(ttl=2, show_spinner=False)
+def queue_snapshot(count=50):
+    """Number of waiting tasks and the next ``count`` of them, decoded"""
+    waiting, jobs = scheduler.snapshot(get_redis(), count)
+    return waiting, [json.loads(job) for job in jobs]
+
+
+def _count_by_status():
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT status, COUNT(*) FROM results WHERE status IN ('done', 'failed') GROUP BY status")
+        return dict(cur.fetchall())
+
+
+@st.cache_data(ttl=2, show_spinner=False)
+def system_stats():
+    """Live metrics from ``master.stats`` plus result cache figures"""
+    redis_client = get_redis()
+    stats.seed(redis_client, _count_by_status)
+    return {**stats.snapshot(redis_client), "cache": result_cache.stats(redis_client)}
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def results_page(time_filter, before=None, page_size=PAGE_SIZE):
+    """
+    Up to ``page_size`` finished tasks older than the ``before`` key
+    ``(created_at, id)``, newest first. Rows hold the output preview only.
+    """
+    query = f"""
+        SELECT id, prompt, COALESCE(preview, LEFT(output, {output_store.PREVIEW_CHARS})),
+               COALESCE(output_size, LENGTH(output)), depth,
+               COALESCE(completed_at, created_at), created_at
+        FROM results
+        WHERE status IN ('done', 'failed')
+    """
+    params = []
+    interval = TIME_FILTERS.get(time_filter)
+    if interval:
+        query += " AND created_at > NOW() - %s::interval"
+        params.append(interval)
+    if before:
+        query += " AND (created_at, id) < (%s, %s)"
+        params.extend(before)
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(page_size)
+
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def full_output(task_id):
+    with pg_connection() as conn:
+        return output_store.load(conn, task_id)
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def missions(before=None, page_size=PAGE_SIZE):
+    """
+    Root tasks older than the ``before`` key ``(created_at, id)``, newest
+    first, with their child counters
+    """
+    query = """
+        SELECT id, prompt, status, children_total, children_done, created_at
+        FROM results
+        WHERE parent_id IS NULL
+    """
+    params = []
+    if before:
+        query += " AND (created_at, id) < (%s, %s)"
+        params.extend(before)
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(page_size)
+
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def mission_tree(root_id):
+    """
+    Every task of one mission in depth-first order, with its nesting level,
+    tokens and cost
+    """
+    with pg_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, prompt, status, depth,
+                   LENGTH(path) - LENGTH(REPLACE(path, '/', '')) AS level,
+                   COALESCE(prompt_tokens, 0) + COALESCE(completion_tokens, 0),
+                   COALESCE(cost_usd, 0)::float8
+            FROM results
+            WHERE root_id = %s
+            ORDER BY path
+        """, (root_id,))
+        return cur.fetchall()
+
+
+@st.cache_data(ttl=2, show_spinner=False)
+def submission_status(ticket=None, mission_id=None):
+    """State, queue position and estimated start of a submitted mission"""
+    return admission.position(get_redis(), ticket=ticket, mission_id=mission_id)
+
+
+def invalidate():
+    """Drop cached reads after the UI itself changed the system"""
+    queue_snapshot.clear()
+    submission_status.clear()
+    system_stats.clear()
+    results_page.clear()
+    missions.clear()
@@ -0,0 +1,85 @@
+"""
+Asyncio runtime that keeps several tasks in flight in one worker process.
+
+A task spends nearly all of its time waiting on LLM HTTP calls, so instead of
+one process per task the event loop dequeues jobs while a semaphore has free
+slots and runs the blocking pieces in thread pools: CrewAI execution in one
+sized to the concurrency limit, result persistence in another of the same
+size (a task blocks there until its batch is committed, so every task in
+flight may need a thread at once), and the blocking dequeue in its own
+thread, so neither a slow LLM call nor a long poll can hold up the others.
+
+The runtime is given the worker's step functions rather than importing
+``worker`` itself, since ``worker.py`` usually runs as ``__main__``.
+"""
+
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# How long a single dequeue blocks before the loop re-checks for idleness
+POLL_TIMEOUT = 5
+
+
+async def _run_one(job, execute, complete, fail, slots, llm_pool, io_pool):
+    """Execute one job and persist its result, freeing its slot afterwards"""
+    loop = asyncio.get_running_loop()
+    try:
+        data = json.loads(job)
+        print(f"\nProcessing task {data['task_id']} (depth {data['depth']})")
+        try:
+            result = await loop.run_in_executor(llm_pool, execute, data)
+        except Exception as e:
+            await loop.run_in_executor(io_pool, fail, job, e)
+            return
+        await loop.run_in_executor(io_pool, complete, job, data, result)
+    except Exception as e:
+        print(f"Worker error: {e}")
+    finally:
+        slots.release()
+
+
+async def run(pop, execute, complete, fail, concurrency, idle_timeout=60):
+    """
+    Dequeue and run jobs with at most ``concurrency`` in flight.
+
+    ``pop(timeout)`` returns a serialized job or None, ``execute(data)``
+    returns the output for the decoded job and ``complete(job, data, result)``
+    stores and acks it; ``fail(job, error)`` requeues a job whose ``execute``
+    raised. Returns once nothing has been dequeued for
+    ``idle_timeout`` seconds and no job is still running.
+    """
+    loop = asyncio.get_running_loop()
+    llm_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm")
+    io_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="io")
+    pop_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pop")
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    last_job = time.monotonic()
+
+    print(f"Async worker running with concurrency {concurrency}")
+    try:
+        while True:
+            await slots.acquire()
+            job = await loop.run_in_executor(pop_pool, pop, POLL_TIMEOUT)
+            if job is None:
+                slots.release()
+                if not in_flight and time.monotonic() - last_job >= idle_timeout:
+                    print(f"No tasks available after {idle_timeout} seconds, exiting")
+                    break
+                continue
+
+            last_job = time.monotonic()
+            task = asyncio.create_task(
+                _run_one(job, execute, complete, fail, slots, llm_pool, io_pool)
+            )
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+    finally:
+        # Let running jobs finish (and be acked) before the pools go away
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        llm_pool.shutdown(wait=True)
+        io_pool.shutdown(wait=True)
+        pop_pool.shutdown(wait=True)
@@ -0,0 +1,68 @@
+"""
+Supervisor keeping a pool of warm, long-lived worker processes.
+
+The supervisor is started from an interpreter that has already imported
+CrewAI, so children forked from it skip that import entirely. Each child runs
+until it has handled its quota of tasks or grown past a memory threshold and
+then exits; the supervisor replaces it with a fresh fork, which keeps memory
+growth from long-running agents in check without paying a cold start per task.
+
+Like ``async_runtime`` this module is handed the worker loop to run rather
+than importing ``worker`` itself.
+"""
+
+import multiprocessing
+import resource
+import signal
+import sys
+import time
+
+
+def rss_mb():
+    """Peak resident set size of the current process in megabytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes everywhere else
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+def supervise(target, size, args=()):
+    """Run ``size`` copies of ``target`` forever, replacing any that exit"""
+    ctx = multiprocessing.get_context("fork")
+    procs = {}
+
+    def spawn(slot):
+        proc = ctx.Process(target=target, args=(slot, *args), name=f"worker-{slot}")
+        proc.start()
+        procs[slot] = proc
+        print(f"Started pool worker {slot} (pid {proc.pid})")
+
+    # Container runtimes stop us with SIGTERM; unwind through the finally below
+    signal.signal(signal.SIGTERM, _stop)
+
+    print(f"Worker pool supervisor starting {size} processes")
+    try:
+        for slot in range(size):
+            spawn(slot)
+        while True:
+            time.sleep(1)
+            for slot, proc in list(procs.items()):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                if proc.exitcode == 0:
+                    print(f"Pool worker {slot} recycled, starting a fresh one")
+                else:
+                    print(f"Pool worker {slot} died with exit code {proc.exitcode}")
+                    time.sleep(5)  # Don't spin if the worker crashes on start
+                spawn(slot)
+    finally:
+        for proc in procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs.values():
+            proc.join(timeout=10)
+        print("Worker pool stopped")
@@ -0,0 +1,182 @@
+"""
+Write-behind sink batching result rows into multi-row INSERTs.
+
+Callers hand a row to ``write()`` and block until the batch containing it has
+been committed, so a job is still only acked after its result is durable; the
+gain is that concurrent tasks share one INSERT and one commit instead of
+paying a round-trip and an fsync each. A background thread flushes whenever
+RESULT_BATCH_SIZE rows are waiting or the oldest has waited
+RESULT_FLUSH_INTERVAL seconds.
+
+Every writer blocks until its row is stored, so a batch never holds more rows
+than there are concurrent writers: once each of them has a row waiting the
+batch is flushed without waiting out the interval, and with a single writer
+(the sync and pool worker modes) every row is written at once.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from psycopg2.extras import execute_values
+
+from master import output_store
+from master.budget import Usage
+from master.result_cache import ERROR_PREFIX
+
+BATCH_SIZE = int(os.getenv("RESULT_BATCH_SIZE", "50"))
+FLUSH_INTERVAL = float(os.getenv("RESULT_FLUSH_INTERVAL", "0.2"))
+
+# Rows are normally created as 'queued' by spawn_task and completed here. A
+# redelivered job may already have been stored by a worker that died before
+# acking it, so only queued rows are updated; RETURNING tells us which rows
+# were completed by this batch. Bodies go to ``outputs`` first (see
+# master/output_store.py); the row keeps only the hash and a preview. Token
+# counts add to what the row already holds: a root task carries its mission's
+# decomposition.
+INSERT_SQL = """
+    INSERT INTO results(id, parent_id, prompt, depth, prompt_hash, status,
+                        output_hash, preview, output_size,
+                        prompt_tokens, completion_tokens, cost_usd, completed_at)
+    VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        prompt = EXCLUDED.prompt,
+        prompt_hash = EXCLUDED.prompt_hash,
+        status = EXCLUDED.status,
+        output_hash = EXCLUDED.output_hash,
+        preview = EXCLUDED.preview,
+        output_size = EXCLUDED.output_size,
+        prompt_tokens = COALESCE(results.prompt_tokens, 0) + EXCLUDED.prompt_tokens,
+        completion_tokens = COALESCE(results.completion_tokens, 0) + EXCLUDED.completion_tokens,
+        cost_usd = COALESCE(results.cost_usd, 0) + EXCLUDED.cost_usd,
+        completed_at = EXCLUDED.completed_at
+    WHERE results.status = 'queued'
+    RETURNING id, parent_id
+"""
+INSERT_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, now())"
+
+# Counted in the same transaction as the completions themselves, so a parent's
+# children_done can never disagree with its children's rows.
+COUNT_DONE_SQL = """
+    UPDATE results AS p SET children_done = p.children_done + c.n
+    FROM (VALUES %s) AS c(parent_id, n)
+    WHERE p.id = c.parent_id::uuid
+"""
+
+
+class ResultSink:
+    """
+    Batches result rows, borrowing a Postgres connection per flush.
+
+    ``connection`` is a context manager factory such as
+    ``master.connections.pg_connection`` that commits on a clean exit;
+    ``writers`` is how many threads may call ``write()`` at the same time.
+    """
+
+    def __init__(self, connection, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 writers=1):
+        self.connection = connection
+        self.batch_size = max(min(batch_size, writers), 1)
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self._pending = []  # (row, outputs row, future)
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._stats = {"batches": 0, "rows": 0, "last_batch_size": 0,
+                       "last_flush_ms": 0.0, "total_flush_ms": 0.0}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data, result, timeout=None):
+        """Store one task's result; returns False if it was already stored"""
+        body, preview = output_store.prepare(result)
+        usage = data.get("usage") or Usage()
+        row = (
+            data["task_id"],
+            data.get("parent_id"),
+            data["prompt"],
+            data["depth"],
+            data.get("prompt_hash"),
+            "failed" if result.startswith(ERROR_PREFIX) else "done",
+            body[0],
+            preview,
+            len(result),
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            round(usage.cost_usd, 6)
+        )
+        future = Future()
+        with self._cond:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((row, body, future))
+            # Wake the flusher to start the interval, or early for a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        return future.result(timeout)
+
+    def stats(self):
+        """Batch size and flush latency figures"""
+        with self._cond:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["rows"] / stats["batches"] if stats["batches"] else 0
+        stats["avg_flush_ms"] = (
+            stats["total_flush_ms"] / stats["batches"] if stats["batches"] else 0
+        )
+        return stats
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Wait for a full batch or for the oldest row's deadline
+                while len(self._pending) < self.batch_size:
+                    remaining = self._oldest + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+                self._oldest = time.monotonic() if self._pending else None
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        # ON CONFLICT cannot touch one row twice per statement; a task
+        # delivered twice in the same batch is written once, as is a body
+        # shared by several tasks
+        rows = list({row[0]: row for row, _, _ in batch}.values())
+        bodies = list({body[0]: body for _, body, _ in batch}.values())
+        try:
+            with self.connection() as conn, conn.cursor() as cur:
+                execute_values(cur, output_store.INSERT_SQL, bodies, page_size=len(bodies))
+                inserted = execute_values(
+                    cur, INSERT_SQL, rows, template=INSERT_TEMPLATE,
+                    page_size=len(rows), fetch=True
+                )
+                finished = Counter(str(parent) for _, parent in inserted if parent)
+                if finished:
+                    execute_values(cur, COUNT_DONE_SQL, list(finished.items()))
+        except Exception as e:
+            print(f"Error flushing {len(batch)} results: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        new_ids = {str(row[0]) for row in inserted}
+        for row, _, future in batch:
+            task_id = str(row[0])
+            future.set_result(task_id in new_ids)
+            new_ids.discard(task_id)
+
+        with self._cond:
+            self._stats["batches"] += 1
+            self._stats["rows"] += len(batch)
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["total_flush_ms"] += elapsed_ms
+        print(f"Flushed {len(batch)} results in {elapsed_ms:.1f} ms")
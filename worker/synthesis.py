@@ -0,0 +1,157 @@
+"""
+Hierarchical (map-reduce) synthesis of a parent task's child outputs.
+
+Child outputs are streamed from ``results`` through a server-side cursor and
+packed greedily into batches that fit SYNTHESIS_TOKEN_BUDGET, prompt and
+answer included. Each batch is merged by one LLM call; the merged partials are
+packed and merged again, level by level, until they fit a single final call.
+Calls within a level are independent and run SYNTHESIS_PARALLELISM at a time,
+so a mission with N children costs O(N) tokens and O(log N) sequential calls
+instead of one prompt that grows without bound.
+
+Token counts are estimated from character length (no tokenizer dependency);
+the budget should leave some headroom below the model's context window.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from master import output_store
+from master.result_cache import ERROR_PREFIX
+
+TOKEN_BUDGET = int(os.getenv("SYNTHESIS_TOKEN_BUDGET", "6000"))
+OUTPUT_TOKENS = int(os.getenv("SYNTHESIS_OUTPUT_TOKENS", "800"))
+PARALLELISM = int(os.getenv("SYNTHESIS_PARALLELISM", "4"))
+FETCH_SIZE = int(os.getenv("SYNTHESIS_FETCH_SIZE", "50"))
+
+CHARS_PER_TOKEN = 4
+# The mission is repeated in every call, so only its head is kept
+MISSION_TOKENS = 500
+# Instructions and separators around the batch
+PROMPT_OVERHEAD = 100
+
+CHILDREN_SQL = f"""
+    SELECT {output_store.BODY_COLUMNS} FROM results r {output_store.BODY_JOIN}
+    WHERE r.parent_id = %s AND r.status = 'done'
+    AND COALESCE(r.preview, r.output) NOT LIKE %s
+    ORDER BY r.created_at, r.id
+"""
+
+MERGE_PROMPT = """You are consolidating partial results of a larger task.
+Task: {mission}
+
+Merge the {count} results below into one concise summary. Keep every key
+finding, figure, decision and open question; drop repetition.
+
+{body}"""
+
+FINAL_PROMPT = """Task: {mission}
+
+The task was split into parts, whose results are below. Using them, write the
+final, complete response to the task.
+
+{body}"""
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def clip(text, tokens):
+    """Cut ``text`` to roughly ``tokens`` tokens"""
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit] + "\n[truncated]"
+
+
+def stream_child_outputs(connection, parent_id):
+    """Yield the parent's successful child outputs, FETCH_SIZE rows at a time"""
+    with connection() as conn, conn.cursor(name=f"synthesis_{parent_id}") as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(CHILDREN_SQL, (parent_id, ERROR_PREFIX + "%"))
+        for row in cur:
+            yield output_store.decode(*row)
+
+
+def load_mission(connection, parent_id):
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT prompt FROM results WHERE id = %s", (parent_id,))
+        row = cur.fetchone()
+    return row[0] if row else ""
+
+
+def pack(texts, budget):
+    """Group texts into batches whose estimated size stays within ``budget``"""
+    batch, used = [], 0
+    for text in texts:
+        text = clip(text, budget)
+        tokens = estimate_tokens(text)
+        if batch and used + tokens > budget:
+            yield batch
+            batch, used = [], 0
+        batch.append(text)
+        used += tokens
+    if batch:
+        yield batch
+
+
+def _body(batch):
+    return "\n\n".join(f"### Result {i}\n{text}" for i, text in enumerate(batch, 1))
+
+
+def synthesize(mission, outputs, llm, budget=TOKEN_BUDGET, parallelism=PARALLELISM):
+    """
+    Reduce ``outputs`` (any iterable of strings) into one answer to ``mission``.
+
+    ``llm(prompt, max_tokens)`` performs one completion and returns its text.
+    Returns ``(answer, stats)``; raises ValueError if nothing is left to merge
+    or the budget cannot hold a few partial results per call.
+    """
+    mission = clip(mission, MISSION_TOKENS)
+    room = budget - OUTPUT_TOKENS - estimate_tokens(mission) - PROMPT_OVERHEAD
+    if room < 3 * OUTPUT_TOKENS:
+        raise ValueError(f"synthesis budget {budget} is too small to reduce")
+
+    def merge(batch):
+        prompt = MERGE_PROMPT.format(mission=mission, count=len(batch), body=_body(batch))
+        # Partials are capped so every level at least halves the input
+        return clip(llm(prompt, OUTPUT_TOKENS), OUTPUT_TOKENS)
+
+    stats = {"children": 0, "levels": 0, "calls": 0}
+    batches = pack(outputs, room)
+    first = next(batches, None)
+    if first is None:
+        raise ValueError("no completed subtasks to synthesize")
+    stats["children"] = len(first)
+
+    partials = first
+    with ThreadPoolExecutor(max_workers=parallelism) as pool:
+        second = next(batches, None)
+        if second is not None:
+            # Map: merges start while later children are still being read
+            level = [pool.submit(merge, first), pool.submit(merge, second)]
+            stats["children"] += len(second)
+            for batch in batches:
+                level.append(pool.submit(merge, batch))
+                stats["children"] += len(batch)
+            partials = [future.result() for future in level]
+            stats["levels"], stats["calls"] = 1, len(level)
+
+        # Reduce until everything fits one call
+        while sum(estimate_tokens(p) for p in partials) > room:
+            level = list(pool.map(merge, pack(partials, room)))
+            stats["levels"] += 1
+            stats["calls"] += len(level)
+            partials = level
+
+    answer = llm(FINAL_PROMPT.format(mission=mission, body=_body(partials)), OUTPUT_TOKENS)
+    stats["calls"] += 1
+    return answer, stats
+
+
+def run(connection, parent_id, llm):
+    """Synthesize the stored results of ``parent_id``'s children"""
+    mission = load_mission(connection, parent_id)
+    answer, stats = synthesize(mission, stream_child_outputs(connection, parent_id), llm)
+    print(f"Synthesized {stats['children']} results for {parent_id} "
+          f"in {stats['calls']} calls over {stats['levels'] + 1} levels")
+    return answer
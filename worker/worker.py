@@ -1,63 +1,234 @@
+import time
+_import_started = time.perf_counter()
+
 import os
 import json
-import redis
-import psycopg2
-import openai
 import sys
-import time
+import asyncio
+from functools import lru_cache
 from crewai import Agent, Task, Crew
 
-# Initialize connections
-redis_client = redis.from_url(os.getenv("REDIS_URL"))
-pg = psycopg2.connect(os.getenv("DATABASE_URL"))
+# Cold-start cost of this process, reported next to steady-state task timings
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# Make the shared ``master`` package importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from master import admission, budget, dag, events, instrumentation, llm, output_store, progress, result_cache, stats, task_queue, tracing
+from master.connections import get_redis, pg_connection
+from master.task_index import release_child
+
+# Time to open this process's connections, measured by connect()
+CONNECT_SECONDS = 0.0
+
+# "sync" runs one task at a time; "async" keeps WORKER_CONCURRENCY in flight
+WORKER_MODE = os.getenv("WORKER_MODE", "sync")
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "8"))
+
+# "pool" keeps WORKER_POOL_SIZE warm processes, each recycled after
+# WORKER_MAX_TASKS tasks or once it grows past WORKER_MAX_RSS_MB
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "4"))
+WORKER_MAX_TASKS = int(os.getenv("WORKER_MAX_TASKS", "100"))
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "1024"))
+
+TIMINGS_KEY = "workers:timings:{}"
+
+# Tokens reserved against LLM_TPM for one agent run
+AGENT_MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "2000"))
+
+AGENT_BACKSTORY = """You are a tireless agent capable of executing any task. 
+                     You work methodically and produce high-quality results.
+                     You complete tasks thoroughly and provide detailed outputs."""
+
+REFINEMENT_PROMPT = """
+    Refine and improve the following output:
+    
+    Original Task: {prompt}
+    
+    Current Output:
+    {output}
+    
+    Please enhance this output by:
+    1. Adding more detail where needed
+    2. Improving clarity and structure
+    3. Ensuring completeness
+    4. Correcting any errors or inconsistencies
+    """
+# Characters of the output being refined that go into its refinement prompt
+REFINEMENT_CONTEXT_CHARS = 1000
+
+# Results are written through a batching sink with its own connection
+_sink = None
 
-# Configure OpenAI/Together
-openai.api_base = os.getenv("OPENAI_API_BASE")
-openai.api_key = os.getenv("OPENAI_API_KEY")
+@lru_cache(maxsize=None)
+def agent_llm_config():
+    """LLM settings shared by every agent this process builds"""
+    return {
+        "model": os.getenv("CREWAI_MODEL_NAME", "mistralai/Mixtral-8x7B-Instruct-v0.1"),
+        "base_url": os.getenv("OPENAI_API_BASE"),
+        "api_key": os.getenv("OPENAI_API_KEY")
+    }
 
-def execute_task(prompt):
-    """Execute a single task using CrewAI"""
+def connect():
+    """Open this process's pooled connections up front and time it"""
+    global CONNECT_SECONDS
+    started = time.perf_counter()
+    get_redis().ping()
+    with pg_connection():
+        pass
+    CONNECT_SECONDS = time.perf_counter() - started
+
+def report_progress(task_id, text, kind="step"):
+    """Stream partial output for the UI; never fails the task"""
+    if task_id is None:
+        return
+    try:
+        progress.append(get_redis(), task_id, text, kind)
+    except Exception as e:
+        print(f"Error reporting progress for {task_id}: {e}")
+
+def describe_step(step):
+    """Readable text for a CrewAI step callback payload"""
+    if isinstance(step, list):
+        return "\n".join(describe_step(item) for item in step)
+    if isinstance(step, tuple) and len(step) == 2:
+        action, observation = step
+        return f"{describe_step(action)}\nObservation: {observation}"
+    return getattr(step, "log", None) or str(step)
+
+def stage_labels(depth):
+    """Labels every stage metric of a task carries"""
+    return {"depth": depth or 0, "model": agent_llm_config()["model"]}
+
+def execute_task(prompt, task_id=None, depth=0, usage=None):
+    """Execute a single task using CrewAI, streaming each agent step"""
     print(f"Executing task: {prompt[:100]}...")
+    report_progress(task_id, prompt, "start")
+    labels = stage_labels(depth)
     
     try:
-        # Create an agent
-        agent = Agent(
-            role="Autonomous Task Executor",
-            goal=f"Complete this exact task: {prompt}",
-            backstory="""You are a tireless agent capable of executing any task. 
-                         You work methodically and produce high-quality results.
-                         You complete tasks thoroughly and provide detailed outputs.""",
-            llm_config={
-                "model": os.getenv("CREWAI_MODEL_NAME", "mistralai/Mixtral-8x7B-Instruct-v0.1"),
-                "base_url": os.getenv("OPENAI_API_BASE"),
-                "api_key": os.getenv("OPENAI_API_KEY")
-            },
-            verbose=True,
-            allow_delegation=False
-        )
-        
-        # Create a task
-        task = Task(
-            description=prompt,
-            agent=agent,
-            expected_output="A complete and detailed response to the task"
-        )
-        
-        # Create and run crew
-        crew = Crew(
-            agents=[agent],
-            tasks=[task],
-            verbose=2
-        )
+        with instrumentation.timed("agent_build", **labels):
+            # Create an agent
+            agent = Agent(
+                role="Autonomous Task Executor",
+                goal=f"Complete this exact task: {prompt}",
+                backstory=AGENT_BACKSTORY,
+                llm_config=agent_llm_config(),
+                verbose=True,
+                allow_delegation=False
+            )
+            
+            # Create a task
+            task = Task(
+                description=prompt,
+                agent=agent,
+                expected_output="A complete and detailed response to the task"
+            )
+            
+            # Create and run crew
+            crew = Crew(
+                agents=[agent],
+                tasks=[task],
+                verbose=2,
+                step_callback=lambda step: report_progress(task_id, describe_step(step))
+            )
         
-        result = crew.kickoff()
-        return str(result)
+        # The agent makes its own calls; take one shared permit for the task
+        with instrumentation.timed("rate_limit_wait", **labels):
+            llm.acquire(get_redis(), llm.estimate_tokens([{"content": prompt}], AGENT_MAX_TOKENS))
+        with instrumentation.timed("llm", **labels):
+            result = str(crew.kickoff())
+        if usage is not None:
+            record_crew_usage(usage, crew, prompt, result)
+        return result
         
     except Exception as e:
         error_msg = f"Error executing task: {str(e)}"
         print(error_msg)
         return error_msg
 
+def record_crew_usage(usage, crew, prompt, result):
+    """Add an agent run's tokens to ``usage``, estimated if CrewAI kept no count"""
+    metrics = getattr(crew, "usage_metrics", None) or {}
+    if metrics.get("total_tokens"):
+        usage.add(metrics.get("prompt_tokens"), metrics.get("completion_tokens"))
+    else:
+        usage.add(len(prompt) // llm.CHARS_PER_TOKEN, len(result) // llm.CHARS_PER_TOKEN)
+
+def complete(prompt, max_tokens, usage=None):
+    """One plain chat completion, for steps that need no agent"""
+    response = llm.chat(
+        [{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=0.3,
+        model=agent_llm_config()["model"],
+        depth=2
+    )
+    if usage is not None:
+        usage.add_response(response)
+    return response.choices[0].message.content.strip()
+
+def execute_synthesis(data):
+    """Merge a finished parent's child outputs into its final answer"""
+    from synthesis import run
+    
+    def complete_and_report(prompt, max_tokens):
+        text = complete(prompt, max_tokens, data["usage"])
+        report_progress(data["task_id"], text)
+        return text
+    
+    print(f"Synthesizing subtasks of {data['parent_id']}")
+    report_progress(data["task_id"], data["prompt"], "start")
+    try:
+        return run(pg_connection, data["parent_id"], complete_and_report)
+    except Exception as e:
+        error_msg = f"Error executing task: {str(e)}"
+        print(error_msg)
+        return error_msg
+
+def execute_job(data):
+    """Execute a dequeued task, answering from the result cache when possible"""
+    data["started_at"] = time.time()
+    # Tokens of every LLM call made for the task, stored with its result
+    data["usage"] = budget.Usage()
+    with get_redis().pipeline() as pipe:
+        stats.record_start(pipe, data.get("depth"))
+        pipe.execute()
+    if "enqueued_at" in data:
+        instrumentation.observe(
+            "queue_wait", data["started_at"] - data["enqueued_at"], **stage_labels(data.get("depth"))
+        )
+        tracing.record("queue_wait", data.get("trace"), data["enqueued_at"], data["started_at"])
+    
+    with tracing.span("execute", data.get("trace"), kind=data.get("kind", "task")) as span:
+        return run_job(data, span)
+
+def run_job(data, span):
+    """The work behind execute_job(); notes cache hits on the trace span"""
+    if data.get("kind") == "synthesis":
+        # The answer depends on the children's outputs, not just the prompt
+        return execute_synthesis(data)
+    if data.get("kind") == "refinement":
+        data["prompt"] = render_refinement(data)
+    if data.get("depends_on"):
+        with pg_connection() as conn:
+            data["prompt"] = dag.render(conn, data)
+    
+    data["prompt_hash"] = result_cache.prompt_hash(data["prompt"], agent_llm_config()["model"])
+    use_cache = result_cache.ENABLED and data.get("cache", True)
+    
+    if use_cache:
+        with pg_connection() as conn:
+            cached = result_cache.lookup(get_redis(), conn, data["prompt_hash"])
+        span["cache_hit"] = cached is not None
+        if cached is not None:
+            print(f"Cache hit for task {data['task_id']}")
+            return cached
+    
+    result = execute_task(data["prompt"], data["task_id"], data.get("depth"), data["usage"])
+    if use_cache and result_cache.cacheable(result):
+        result_cache.store(get_redis(), data["prompt_hash"], result)
+    return result
+
 def should_spawn_deeper_tasks(result, depth):
     """Determine if we should spawn deeper refinement tasks"""
     # Only spawn deeper tasks if:
@@ -83,109 +254,261 @@ def should_spawn_deeper_tasks(result, depth):
     result_lower = result.lower()
     return any(indicator in result_lower for indicator in refinement_indicators)
 
-def spawn_refinement_task(prompt, result, task_id, depth):
+def spawn_refinement_task(prompt, task_id, depth, root_id=None, use_cache=True):
     """Spawn a task to refine the current result"""
-    refinement_prompt = f"""
-    Refine and improve the following output:
-    
-    Original Task: {prompt}
-    
-    Current Output:
-    {result[:1000]}{'...' if len(result) > 1000 else ''}
-    
-    Please enhance this output by:
-    1. Adding more detail where needed
-    2. Improving clarity and structure
-    3. Ensuring completeness
-    4. Correcting any errors or inconsistencies
-    """
-    
     # Import spawn_task from master
-    sys.path.append('/app')
     from master.main import spawn_task
     
+    # Only the task's prompt travels through Redis; the worker that picks the
+    # refinement up reads the output preview back in render_refinement()
     new_task_id = spawn_task(
-        refinement_prompt,
+        prompt,
         parent_id=task_id,
-        depth=depth + 1
+        depth=depth + 1,
+        root_id=root_id,
+        kind="refinement",
+        use_cache=use_cache
     )
     
     print(f"Spawned refinement task: {new_task_id}")
 
+def render_refinement(data):
+    """Full prompt of a refinement task, around its parent's stored output"""
+    with pg_connection() as conn:
+        current = output_store.load_preview(conn, data["parent_id"]) or ""
+    return REFINEMENT_PROMPT.format(
+        prompt=data["prompt"],
+        output=current[:REFINEMENT_CONTEXT_CHARS]
+        + ("..." if len(current) > REFINEMENT_CONTEXT_CHARS else "")
+    )
+
+def result_sink():
+    """This process's batching result writer, created on first use"""
+    global _sink
+    if _sink is None or _sink.pid != os.getpid():
+        from result_sink import ResultSink
+        # Only the async mode stores several results at once
+        _sink = ResultSink(
+            pg_connection, writers=WORKER_CONCURRENCY if WORKER_MODE == "async" else 1
+        )
+    return _sink
+
+def store_result(data, result):
+    """Store a task's output, returning False if it was already stored"""
+    # Blocks until the batch holding this row is committed, so callers only
+    # ack the job once its result is durable
+    return result_sink().write(data, result)
+
+def complete_task(job, data, result):
+    """Store a task's result, spawn follow-ups and ack it; requeue on failure"""
+    labels = stage_labels(data.get("depth"))
+    try:
+        with instrumentation.timed("db_write", **labels), \
+                tracing.span("persist", data.get("trace")):
+            inserted = store_result(data, result)
+        print(f"Result stored for task {data['task_id']}")
+        status = "failed" if result.startswith(result_cache.ERROR_PREFIX) else "done"
+        instrumentation.TASKS.inc(status=status, **labels)
+        progress.finish(get_redis(), data["task_id"], status)
+        
+        if inserted:
+            # The child is done; let the master's completion check see it
+            if data.get("parent_id"):
+                release_child(get_redis(), data["parent_id"])
+            with get_redis().pipeline() as pipe:
+                events.publish(pipe, data, status)
+                stats.record(pipe, status, time.time() - data.get("started_at", time.time()))
+                if data.get("root_id"):
+                    # Before any refinement reserves, so it sees what is left
+                    budget.record(pipe, data["root_id"], data.get("usage") or budget.Usage(),
+                                  data.get("reserved"))
+                pipe.execute()
+            
+            # Check if we should spawn deeper tasks
+            if should_spawn_deeper_tasks(result, data["depth"]):
+                try:
+                    with instrumentation.timed("refinement_spawn", **labels), \
+                            tracing.span("spawn_refinement", data.get("trace")):
+                        spawn_refinement_task(
+                            data["prompt"],
+                            data["task_id"],
+                            data["depth"],
+                            root_id=data.get("root_id"),
+                            use_cache=data.get("cache", True)
+                        )
+                except budget.BudgetExceeded as e:
+                    print(f"Skipping refinement of {data['task_id']}: {e}")
+            
+            # After any refinement is counted, so the mission cannot end early
+            admission.finish(get_redis(), data.get("root_id") or data["task_id"])
+        
+        tracing.record_task(
+            data.get("trace"), data.get("enqueued_at", data.get("started_at")), time.time(),
+            task_id=data["task_id"], parent_id=data.get("parent_id"), depth=data.get("depth"),
+            kind=data.get("kind", "task"), status=status, depends_on=data.get("depends_on")
+        )
+        task_queue.ack(get_redis(), job)
+        return True
+        
+    except Exception as e:
+        print(f"Error storing result: {e}")
+        # Re-queue the task
+        task_queue.requeue(get_redis(), job)
+        return False
+
+def fail_task(job, error):
+    """Requeue a job whose execution raised before it produced a result"""
+    print(f"Error executing task: {error}")
+    task_queue.requeue(get_redis(), job)
+
+def process_job(job, data):
+    """Execute a dequeued job and complete it; requeue it if execution fails"""
+    try:
+        result = execute_job(data)
+    except Exception as e:
+        # Stats, prompt rendering and the cache lookup all touch Redis or
+        # Postgres before the agent runs; an outage there must not drop the job
+        fail_task(job, e)
+        return False
+    return complete_task(job, data, result)
+
+def pop_task(timeout):
+    """Take the next job off the queue, or None after ``timeout`` seconds"""
+    return task_queue.pop(get_redis(), timeout=timeout)
+
 def process_single_task():
     """Process one task from the queue"""
     print("Worker waiting for task...")
     
     # Blocking pop from Redis queue (timeout after 60 seconds)
-    result = redis_client.brpop("tasks", timeout=60)
+    job = pop_task(60)
     
-    if result is None:
+    if job is None:
         print("No tasks available after 60 seconds, exiting")
         return False
     
-    _, job = result
     data = json.loads(job)
     
     print(f"\nProcessing task {data['task_id']}")
     print(f"Prompt: {data['prompt'][:200]}...")
     print(f"Depth: {data['depth']}")
     
-    # Execute the task
-    result = execute_task(data["prompt"])
+    return process_job(job, data)
+
+def run_sync():
+    """Process tasks one at a time until the queue is empty or a store fails"""
+    while True:
+        try:
+            if not process_single_task():
+                print("Worker shutting down")
+                break
+        except Exception as e:
+            print(f"Worker error: {e}")
+            time.sleep(5)  # Wait before retrying
+
+def run_async():
+    """Process up to WORKER_CONCURRENCY tasks at once on an event loop"""
+    from async_runtime import run
+    
+    asyncio.run(run(pop_task, execute_job, complete_task, fail_task, WORKER_CONCURRENCY))
+
+def report_timings(timings):
+    """Publish startup versus steady-state timings for this process"""
+    steady = timings["task_seconds"][1:]
+    summary = {
+        "import_seconds": round(IMPORT_SECONDS, 3),
+        "connect_seconds": round(CONNECT_SECONDS, 3),
+        "tasks": len(timings["task_seconds"]),
+        "first_task_seconds": round(timings["task_seconds"][0], 3) if timings["task_seconds"] else 0,
+        "steady_task_seconds": round(sum(steady) / len(steady), 3) if steady else 0,
+        "rss_mb": round(timings["rss_mb"], 1),
+        "avg_result_batch_size": round(result_sink().stats()["avg_batch_size"], 2),
+        "avg_result_flush_ms": round(result_sink().stats()["avg_flush_ms"], 2),
+        "updated_at": time.time()
+    }
+    key = TIMINGS_KEY.format(task_queue.worker_id())
+    redis_client = get_redis()
+    redis_client.hset(key, mapping=summary)
+    redis_client.expire(key, 24 * 3600)
+    print(f"Worker timings: {summary}")
+
+def run_pooled(slot):
+    """Long-lived loop of one pool process, returning when it is due for recycling"""
+    from pool import rss_mb
     
-    # Store result in database
+    # Pools are per process, so this opens our own rather than the supervisor's
+    connect()
+    if instrumentation.PORT:
+        instrumentation.serve(instrumentation.PORT + slot + 1)
+    heartbeat = None
+    if task_queue.reliable():
+        heartbeat = task_queue.Heartbeat(get_redis()).start()
+    
+    timings = {"task_seconds": [], "rss_mb": rss_mb()}
     try:
-        with pg.cursor() as cur:
-            cur.execute("""
-                INSERT INTO results(id, parent_id, prompt, output, depth)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (
-                data["task_id"],
-                data.get("parent_id"),
-                data["prompt"],
-                result,
-                data["depth"]
-            ))
-        pg.commit()
-        print(f"Result stored for task {data['task_id']}")
-        
-        # Check if we should spawn deeper tasks
-        if should_spawn_deeper_tasks(result, data["depth"]):
-            spawn_refinement_task(
-                data["prompt"],
-                result,
-                data["task_id"],
-                data["depth"]
-            )
-        
-        return True
-        
-    except Exception as e:
-        print(f"Error storing result: {e}")
-        pg.rollback()
-        # Re-queue the task
-        redis_client.lpush("tasks", job)
-        return False
+        while len(timings["task_seconds"]) < WORKER_MAX_TASKS:
+            job = pop_task(60)
+            if job is None:
+                continue  # Stay warm while idle
+            
+            data = json.loads(job)
+            print(f"\n[pool {slot}] Processing task {data['task_id']} (depth {data['depth']})")
+            started = time.perf_counter()
+            try:
+                process_job(job, data)
+            except Exception as e:
+                print(f"Worker error: {e}")
+            timings["task_seconds"].append(time.perf_counter() - started)
+            timings["rss_mb"] = rss_mb()
+            report_timings(timings)
+            
+            if timings["rss_mb"] >= WORKER_MAX_RSS_MB:
+                print(f"[pool {slot}] RSS {timings['rss_mb']:.0f} MB over limit, recycling")
+                break
+    finally:
+        if heartbeat:
+            heartbeat.stop()
+
+def run_pool():
+    """Keep WORKER_POOL_SIZE warm worker processes running"""
+    from pool import supervise
+    
+    print(f"CrewAI imported in {IMPORT_SECONDS:.2f}s; children inherit it warm")
+    supervise(run_pooled, WORKER_POOL_SIZE)
 
 def main():
     """Main worker loop"""
     print("CrewAI Worker started")
+    print(f"Using model: {os.getenv('CREWAI_MODEL_NAME')}")
+    print(f"Queue mode: {task_queue.QUEUE_MODE}")
+    print(f"Worker mode: {WORKER_MODE}")
+    
+    if WORKER_MODE == "pool":
+        # Each pool process manages its own lease and connections
+        run_pool()
+        return
+    
+    connect()
+    instrumentation.serve()
     print(f"Connected to Redis: {os.getenv('REDIS_URL')[:30]}...")
     print(f"Connected to PostgreSQL: {os.getenv('DATABASE_URL')[:30]}...")
-    print(f"Using model: {os.getenv('CREWAI_MODEL_NAME')}")
+    
+    # Keep our lease alive so the master doesn't reap jobs we are working on
+    heartbeat = None
+    if task_queue.reliable():
+        heartbeat = task_queue.Heartbeat(get_redis()).start()
     
     # Process tasks until queue is empty or error
-    while True:
-        try:
-            if not process_single_task():
-                print("Worker shutting down")
-                break
-        except KeyboardInterrupt:
-            print("\nWorker interrupted, shutting down")
-            break
-        except Exception as e:
-            print(f"Worker error: {e}")
-            time.sleep(5)  # Wait before retrying
+    try:
+        if WORKER_MODE == "async":
+            run_async()
+        else:
+            run_sync()
+    except KeyboardInterrupt:
+        print("\nWorker interrupted, shutting down")
+    finally:
+        if heartbeat:
+            heartbeat.stop()
 
 if __name__ == "__main__":
     main()